@@ -1,3 +1,7 @@
+import os
+import time
+import hashlib
+import tempfile
 import numpy
 
 from amuse.units import units
@@ -6,15 +10,25 @@ from amuse.datamodel import Grid
 
 class adcirc_file_reader(object):
   def __init__(self, *args, **kwargs):
+    self.progress=kwargs.pop("progress", None)
     self.f=open(*args, **kwargs)
+    self._start_time=time.time()
   def __enter__(self):
     return self
   def close(self):
     self.f.close()
   def __exit__(self, *args):
     self.f.close()
+  def report_progress(self, section, done, total):
+    if self.progress is not None:
+      self.progress(section, done, total, time.time()-self._start_time)
   def readline(self):
     return self.f.readline()
+  def readlines(self,n):
+    lines=[self.f.readline() for i in range(n)]
+    if n>0 and not lines[-1]:
+      raise Exception("unexpected end of file {0}".format(self.f.name))
+    return lines
   def read_string(self,n=80):
     return self.readline()[:n]
   def read_int(self,n=1):
@@ -29,28 +43,30 @@ class adcirc_file_reader(object):
     for i in range(n):
       result.append(self.read_value(*types))
     return result
-  def read_single_type_attributes(self,n,m,dtype=int):
+  def read_block(self,n,m,dtype=float):
+    """ read n lines as a block and return the first m columns as an (n,m) array,
+        trailing columns and comments (starting with !) are ignored """
+    lines=self.readlines(n)
+    text=''.join(lines)
+    if '!' in text:
+      text='\n'.join([l.split('!',1)[0] for l in lines])
+    data=numpy.fromstring(text, dtype=dtype, sep=' ')
+    if data.size==n*m:
+      return data.reshape((n,m))
+    return numpy.array([l.split('!',1)[0].split()[:m] for l in lines], dtype=dtype)
+  def read_single_type_attributes(self,n,m,dtype=int, section=None):
     result=numpy.zeros((n,m),dtype)
-    _n=0
-    while _n<n:
-      line_=self.readline().split()
-      index=int(line_[0])-1
-      result[index,:]=[dtype(line_[i]) for i in range(1,m+1)]
-      _n+=1    
+    block=self.read_block(n,m+1,dtype)
+    index=block[:,0].astype(int)-1
+    result[index,:]=block[:,1:]
+    if section is not None:
+      self.report_progress(section, n, n)
     return result
   def read_boundary_segment(self,n):
-    seg=[]
-    i=0
-    while i<n:
-      line=self.readline()
-      line_=line.split()
-      seg.append( int(line_[0]))
-      i+=1
-    return numpy.array(seg)    
-  def read_boundary_segments(self,nseg,nnodes,default_type=None):
+    return self.read_block(n,1,int)[:,0]
+  def iter_boundary_segments(self,nseg,nnodes,default_type=None,section=None):
     i=0
     _nnodes=0
-    result=[]
     while i<nseg:
       line=self.readline()
       line_=line.split()
@@ -62,9 +78,12 @@ class adcirc_file_reader(object):
       _nnodes+=n
       seg=self.read_boundary_segment(n)
       i+=1
-      result.append((_type,seg))
+      if section is not None:
+        self.report_progress(section, i, nseg)
+      yield (_type,seg)
     assert nnodes==_nnodes
-    return result
+  def read_boundary_segments(self,nseg,nnodes,default_type=None,section=None):
+    return list(self.iter_boundary_segments(nseg,nnodes,default_type,section))
 
 class adcirc_parameter_reader(object):  
   def __init__(self,filename="fort.15"):
@@ -323,32 +342,114 @@ class adcirc_parameter_reader(object):
     
 class adcirc_grid_reader(object):
   
-  def __init__(self,filename="fort.14",coordinates="cartesian"):
+  cache_version=1
+  cached_parameters=["NE","NP","NOPE","NBOU","NETA","NVEL","NFLUX"]
+  
+  def __init__(self,filename="fort.14",coordinates="cartesian",progress=None,cache=False,validate="mtime"):
+    """ progress is an optional callback, called as progress(section, done, total, elapsed_time)
+        while the mesh is being read. With cache=True the mesh is stored in a binary
+        sidecar file (filename+".npz", or the filename given as cache) which is used
+        instead of the ASCII file as long as it is valid; validate is either "mtime"
+        (size and modification time of the ASCII file) or "hash" (its sha1 checksum) """
     self.filename=filename
     self.coordinates=coordinates
+    self.progress=progress
     if coordinates not in ["cartesian","spherical"]:
       raise Exception("coordinates must be cartesian or spherical")  
+    if validate not in ["mtime","hash"]:
+      raise Exception("validate must be mtime or hash")
+    if cache is True:
+      cache=filename+".npz"
+    self.cache_filename=cache or None
+    self.validate=validate
       
+  def source_signature(self):
+    if self.validate=="hash":
+      sha=hashlib.sha1()
+      with open(self.filename,'rb') as f:
+        for chunk in iter(lambda: f.read(1<<20), b''):
+          sha.update(chunk)
+      return "sha1:"+sha.hexdigest()
+    st=os.stat(self.filename)
+    return "mtime:{0}:{1}".format(st.st_size, st.st_mtime_ns)
+
   def read_grid(self):
-    f=adcirc_file_reader(self.filename,'r')
+    if self.cache_filename is not None:
+      signature=self.source_signature()
+      if self.read_cache(signature):
+        return
+    self.read_ascii_grid()
+    if self.cache_filename is not None:
+      self.write_cache(signature)
+
+  def read_cache(self, signature):
+    try:
+      data=numpy.load(self.cache_filename, allow_pickle=False)
+    except (IOError, ValueError):
+      return False
+    with data:
+      if int(data["version"])!=self.cache_version or str(data["signature"])!=signature:
+        return False
+      self.p=data["p"]
+      self.t=data["t"]
+      self.elev_spec_boundary_seg=self._unpack_segments(data["elev_types"],data["elev_lengths"],data["elev_nodes"])
+      self.flow_spec_boundary_seg=self._unpack_segments(data["flow_types"],data["flow_lengths"],data["flow_nodes"])
+      param=dict(zip(self.cached_parameters, [int(x) for x in data["parameters"]]))
+      param["AGRID"]=str(data["AGRID"])
+    self.parameters=param
+    return True
+
+  def write_cache(self, signature):
+    elev_types,elev_lengths,elev_nodes=self._pack_segments(self.elev_spec_boundary_seg)
+    flow_types,flow_lengths,flow_nodes=self._pack_segments(self.flow_spec_boundary_seg)
+    directory=os.path.dirname(os.path.abspath(self.cache_filename))
+    try:
+      handle,tmpname=tempfile.mkstemp(suffix=".tmp", dir=directory)
+    except OSError:
+      return # no write access, silently skip caching
+    try:
+      with os.fdopen(handle,'wb') as f:
+        numpy.savez(f, version=self.cache_version, signature=signature, p=self.p, t=self.t,
+          AGRID=self.parameters["AGRID"], parameters=[self.parameters[x] for x in self.cached_parameters],
+          elev_types=elev_types, elev_lengths=elev_lengths, elev_nodes=elev_nodes,
+          flow_types=flow_types, flow_lengths=flow_lengths, flow_nodes=flow_nodes)
+      os.replace(tmpname, self.cache_filename)
+    finally:
+      if os.path.exists(tmpname):
+        os.remove(tmpname)
+
+  @staticmethod
+  def _pack_segments(segments):
+    types=numpy.array([x[0] for x in segments], dtype=int)
+    lengths=numpy.array([len(x[1]) for x in segments], dtype=int)
+    nodes=numpy.concatenate([x[1] for x in segments]) if len(segments)>0 else numpy.zeros(0,dtype=int)
+    return types,lengths,nodes
+
+  @staticmethod
+  def _unpack_segments(types,lengths,nodes):
+    offsets=numpy.cumsum(lengths)[:-1]
+    return list(zip([int(x) for x in types], numpy.split(nodes,offsets))) if len(types)>0 else []
+
+  def read_ascii_grid(self):
+    f=adcirc_file_reader(self.filename,'r',progress=self.progress)
     param=dict()
     param["AGRID"]=f.read_string()
 
     NE,NP=f.read_int(2)
     
-    self.p=f.read_single_type_attributes(NP,3,float)
-    self.t=f.read_single_type_attributes(NE,4,int)
+    self.p=f.read_single_type_attributes(NP,3,float,section="nodes")
+    self.t=f.read_single_type_attributes(NE,4,int,section="elements")
 
     assert numpy.all(self.t[:,0]==3)
             
     NOPE=f.read_int(1)
     NETA=f.read_int(1)
 
-    self.elev_spec_boundary_seg=f.read_boundary_segments(NOPE,NETA,0)
+    self.elev_spec_boundary_seg=f.read_boundary_segments(NOPE,NETA,0,section="elevation boundaries")
 
     NBOU=f.read_int(1)
     NVEL=f.read_int(1)
-    self.flow_spec_boundary_seg=f.read_boundary_segments(NBOU,NVEL)
+    self.flow_spec_boundary_seg=f.read_boundary_segments(NBOU,NVEL,section="flow boundaries")
     
     NFLUX=0
     for _type,seg in self.flow_spec_boundary_seg:
@@ -377,7 +478,7 @@ class adcirc_grid_reader(object):
     nodes.depth=self.p[:,2] | units.m
         
     elements=Grid(self.parameters["NE"])
-    elements.nodes=[(x[1]-1,x[2]-1,x[3]-1) for x in self.t]
+    elements.nodes=self.t[:,1:4]-1
     
     elev_boundary=[]
     for type_,seg in self.elev_spec_boundary_seg:
@@ -397,27 +498,34 @@ class adcirc_grid_reader(object):
     
     return nodes,elements,elev_boundary,flow_boundary
   
+def unique_edges(triangles):
+    """ return the unique (undirected) edges of the triangles as an (n,2) array,
+        with the lowest node index first """
+    triangles=numpy.asarray(triangles)
+    edges=triangles[:,[0,1,1,2,2,0]].reshape(-1,2)
+    edges.sort(axis=1)
+    return numpy.unique(edges, axis=0)
+
+def node_adjacency(triangles, number_of_nodes=None):
+    """ return the node adjacency of the triangles in CSR form (offsets, neighbours):
+        the neighbours of node i are neighbours[offsets[i]:offsets[i+1]], sorted """
+    edges=unique_edges(triangles)
+    if number_of_nodes is None:
+      number_of_nodes=edges.max()+1 if len(edges)>0 else 0
+    first=numpy.concatenate((edges[:,0],edges[:,1]))
+    second=numpy.concatenate((edges[:,1],edges[:,0]))
+    order=numpy.lexsort((second,first))
+    offsets=numpy.zeros(number_of_nodes+1, dtype=int)
+    numpy.cumsum(numpy.bincount(first, minlength=number_of_nodes), out=offsets[1:])
+    return offsets, second[order]
+
 def assign_neighbours(nodes,elements):  
-    for n in nodes:
-      n.neighbours=set()
-    
-    for e in elements:
-      p1=e.nodes[0]
-      p2=e.nodes[1]
-      p3=e.nodes[2]
-      nodes[p1].neighbours.add(p2)
-      nodes[p1].neighbours.add(p3)
-      nodes[p2].neighbours.add(p1)
-      nodes[p2].neighbours.add(p3)
-      nodes[p3].neighbours.add(p1)
-      nodes[p3].neighbours.add(p2)
+    offsets,neighbours=node_adjacency(elements.nodes, len(nodes))
+    neighbours=neighbours.tolist()
+    nodes.neighbours=[set(neighbours[offsets[i]:offsets[i+1]]) for i in range(len(nodes))]
      
 def get_edges(elements):
-    edges=set()
-    for e in elements:
-      for i,j in [(0,1),(1,2),(2,0)]:
-        edges.add( frozenset([e.nodes[i],e.nodes[j]]) )
-    return edges
+    return set([frozenset(x) for x in unique_edges(elements.nodes).tolist()])
 
 if __name__=="__main__":
     a=adcirc_grid_reader()
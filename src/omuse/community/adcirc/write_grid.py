@@ -130,6 +130,17 @@ class adcirc_file_writer(object):
     def write_var_rows(self,*var):
         for v in zip(var):
             self.write_var(*v)
+    def write_block(self,*columns,**kwargs):
+        """ write the columns (arrays of equal length or scalars) as rows, formatted
+            as write_var would, chunksize rows at a time (default: all at once) """
+        chunksize=kwargs.get("chunksize", None)
+        columns=numpy.broadcast_arrays(*[numpy.asarray(x) for x in columns])
+        n=len(columns[0]) if columns[0].ndim>0 else 1
+        if chunksize is None: chunksize=max(n,1)
+        rowformat=' '.join(['%s']*len(columns))+"\n"
+        for start in range(0,n,chunksize):
+            rows=zip(*[x[start:start+chunksize].tolist() for x in columns])
+            self.write(''.join([rowformat % row for row in rows]))
 
 
 class adcirc_parameter_writer(object):
@@ -295,7 +306,9 @@ class adcirc_parameter_writer(object):
 class adcirc_grid_writer(object):
   
   def __init__(self,filename="fort.14",coordinates="cartesian", density_filename="fort.11",
-                nodes=None,elements=None, elevation_boundaries=None, flow_boundaries=None):
+                nodes=None,elements=None, elevation_boundaries=None, flow_boundaries=None, chunksize=None):
+    """ chunksize sets the number of lines formatted and written at once (default: whole blocks) """
+    self.chunksize=chunksize
     self.nodes=nodes
     self.elements=elements
     self.elevation_boundaries=elevation_boundaries
@@ -310,24 +323,24 @@ class adcirc_grid_writer(object):
     f=adcirc_file_writer(self.filename,'w')
     f.write_var("AMUSE grid")
     f.write_var(len(elements),len(x))
-    for i,x_,y_,d_ in zip(range(1,len(x)+1),x,y,depth):
-      f.write_var(i,x_,y_,d_)
-    for i,n in enumerate(elements):
-      f.write_var(i+1,3,n[0],n[1],n[2])
+    f.write_block(numpy.arange(1,len(x)+1),x,y,depth,chunksize=self.chunksize)
+    elements=numpy.asarray(elements)
+    if len(elements)>0:
+      f.write_block(numpy.arange(1,len(elements)+1),3,elements[:,0],elements[:,1],elements[:,2],chunksize=self.chunksize)
 
     f.write_var(len(elev_boundary))
     NETA=sum([len(x[0]) for x in elev_boundary])
     f.write_var(NETA)
     for b,t in elev_boundary:
       f.write_var(len(b), t)
-      for node in b: f.write_var(node)    
+      f.write_block(b,chunksize=self.chunksize)
     
     f.write_var(len(flow_boundary))
     NVEL=sum([len(x[0]) for x in flow_boundary])
     f.write_var(NVEL)
     for b,t in flow_boundary:
       f.write_var(len(b),t)
-      for node in b: f.write_var(node)    
+      f.write_block(b,chunksize=self.chunksize)
       
     f.close()
 
@@ -341,13 +354,17 @@ class adcirc_grid_writer(object):
 
     NP=len(nodes)
     NFEN=number_of_vertical_levels
-    f=adcirc_file_writer(self.density_filename,'w')
-    f.write_var("header 1")
-    f.write_var("header 2")
-    f.write_var(NFEN,NP)
-    for i in range(NP):
-      for j in range(NFEN):
-        f.write_var(i+1,j+1,Tconst.value_in(units.Celsius))
+    with adcirc_file_writer(self.density_filename,'w') as f:
+      f.write_var("header 1")
+      f.write_var("header 2")
+      f.write_var(NFEN,NP)
+      # node/level index rows are generated per chunk of nodes, the full NP*NFEN columns are never built
+      nodes_per_chunk=NP if self.chunksize is None else max(self.chunksize//NFEN,1)
+      levels=numpy.arange(1,NFEN+1)
+      for start in range(0,NP,nodes_per_chunk):
+        node=numpy.arange(start+1,min(start+nodes_per_chunk,NP)+1)
+        f.write_block(numpy.repeat(node,NFEN),numpy.tile(levels,len(node)),
+          Tconst.value_in(units.Celsius),chunksize=self.chunksize)
       
   def write_grid(self, nodes=None, elements=None, elevation_boundaries=None,flow_boundaries=None):
     if nodes is None: nodes=self.nodes
@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 
 import numpy
+import scipy.sparse
 
-from spherical_geometry import *
+from omuse.community.cdo.spherical_geometry import distance, triangle_area
 
 class adcirc_grid_converter(object):
 
@@ -25,143 +26,96 @@ class adcirc_grid_converter(object):
         # r.t contains the connectivity of nodes to form triangles, strip fist column 
         self.triangles = triangles = r.t[:,1:] -1  #minus one to offset Fortran indexes starting at 1
 
-        self.grid_center_lat = grid_center_lat = numpy.zeros(num_elems, dtype=numpy.double)
-        self.grid_center_lon = grid_center_lon = numpy.zeros(num_elems, dtype=numpy.double)
-
-        self.grid_corner_lat = grid_corner_lat = numpy.zeros(num_elems*num_corners, dtype=numpy.double)
-        self.grid_corner_lon = grid_corner_lon = numpy.zeros(num_elems*num_corners, dtype=numpy.double)
-
-        self.inverse_mapping = inverse_mapping = [[] for i in range(num_nodes)]
-
-        self.elem_area = elem_area = numpy.zeros(num_elems, dtype=numpy.double)
-        self.elem_area_spherical = elem_area_spherical = numpy.zeros(num_elems, dtype=numpy.double)
-
-        i=0
-        for triangle in triangles:
-            n1,n2,n3 = triangle
-            lat1 = lat[n1]
-            lat2 = lat[n2]
-            lat3 = lat[n3]
-            lon1 = lon[n1]
-            lon2 = lon[n2]
-            lon3 = lon[n3]
-
-            #add element i as neighbors of nodes n1, n2, and n3
-            inverse_mapping[n1].append(i)
-            inverse_mapping[n2].append(i)
-            inverse_mapping[n3].append(i)
-
-            grid_center_lat[i] = (lat1 + lat2 + lat3)/3.0
-            grid_center_lon[i] = (lon1 + lon2 + lon3)/3.0
-
-            grid_corner_lat[i*3+0] = lat1
-            grid_corner_lat[i*3+1] = lat2
-            grid_corner_lat[i*3+2] = lat3
-
-            grid_corner_lon[i*3+0] = lon1
-            grid_corner_lon[i*3+1] = lon2
-            grid_corner_lon[i*3+2] = lon3
-
-            #triangle area, uses counter-clockwise sorting of nodes in trangle
-            #assumes 2D euclidian geometry, not entirely accurate for lat-lon
-            elem_area[i] = (((lon2-lon1)*(lat3-lat1))-((lon3-lon1)*(lat2-lat1)))/2.0
-
-            #compute triangle area using spherical geometry
-            a = distance(lat1, lon1, lat2, lon2)
-            b = distance(lat2, lon2, lat3, lon3)
-            c = distance(lat3, lon3, lat1, lon1)
-            elem_area_spherical[i] = triangle_area(a, b, c)
-
-            i+=1
-
-        self.adjacency_list = adjacency_list = []
-        self.boundary_node = boundary_node = [False for i in range(num_nodes)]
-
-        for node in range(num_nodes):
-
-            #create a list for each cell center connected to this corner
-            cell_neighbors = [[] for i in inverse_mapping[node]]
-            #use celli as index into cell_neighbors array
-            celli = 0
-
-            #for each neighboring cell/triangle
-            for cell in inverse_mapping[node]:
-                
-                corners = triangles[cell][:] #copy corner list
-                corner_list = list(corners)
-                corner_list.remove(node) #remove the shared corner, look for another one
-                for i in inverse_mapping[node]:
-                    matches = 0
-                    for c in triangles[i]:
-                        if c in corner_list:
-                            matches += 1
-                    if matches == 1: #matches should be one, if it's 2 then it is the cell itself
-                        cell_neighbors[celli].append(i)
-
-                #if there is a cell with less than two neighboring cells for this corner, then
-                #this corner must be on a boundary
-                if len(cell_neighbors[celli]) < 2:
-                    boundary_node[node] = True
-
-                #print "node=", node, "cell=", cell, "neighbors=", cell_neighbors[celli] 
-                celli += 1
-
-            adjacency_list.append(cell_neighbors)
-
-
-
-    def get_nodes_from_elements(self, elem_values):
+        lat1, lat2, lat3 = lat[triangles].T
+        lon1, lon2, lon3 = lon[triangles].T
+
+        self.grid_center_lat = (lat1 + lat2 + lat3)/3.0
+        self.grid_center_lon = (lon1 + lon2 + lon3)/3.0
+
+        self.grid_corner_lat = lat[triangles].ravel()
+        self.grid_corner_lon = lon[triangles].ravel()
+
+        #triangle area, uses counter-clockwise sorting of nodes in trangle
+        #assumes 2D euclidian geometry, not entirely accurate for lat-lon
+        self.elem_area = (((lon2-lon1)*(lat3-lat1))-((lon3-lon1)*(lat2-lat1)))/2.0
+
+        #compute triangle area using spherical geometry
+        a = distance(lat1, lon1, lat2, lon2)
+        b = distance(lat2, lon2, lat3, lon3)
+        c = distance(lat3, lon3, lat1, lon1)
+        self.elem_area_spherical = triangle_area(a, b, c)
+
+        #node to element incidence in CSR form, the elements of node i are
+        #inverse_mapping_elements[inverse_mapping_offsets[i]:inverse_mapping_offsets[i+1]]
+        #incidence_corner holds the corner (0, 1 or 2) of the element that is node i
+        order = numpy.argsort(triangles.ravel(), kind='stable')
+        self.inverse_mapping_elements = order // num_corners
+        self.incidence_corner = order % num_corners
+        self.inverse_mapping_offsets = numpy.zeros(num_nodes+1, dtype=int)
+        numpy.cumsum(numpy.bincount(triangles.ravel(), minlength=num_nodes), out=self.inverse_mapping_offsets[1:])
+        self.incidence_node = numpy.repeat(numpy.arange(num_nodes), numpy.diff(self.inverse_mapping_offsets))
+
+        #element neighbours across each edge, edge j connects corner j and j+1, -1 marks a boundary edge
+        #assumes every edge is shared by at most two triangles
+        self.element_neighbours = element_neighbours = -numpy.ones((num_elems, num_corners), dtype=int)
+        edges = numpy.sort(numpy.stack((triangles, numpy.roll(triangles, -1, axis=1)), axis=-1).reshape(-1, 2), axis=1)
+        order = numpy.lexsort((edges[:,1], edges[:,0]))
+        shared = numpy.all(edges[order[1:]] == edges[order[:-1]], axis=1)
+        first = order[:-1][shared]
+        second = order[1:][shared]
+        element_neighbours.flat[first] = second // num_corners
+        element_neighbours.flat[second] = first // num_corners
+
+        #for each incidence the neighbours of the element across the two edges that contain the node
+        cells = self.inverse_mapping_elements
+        corner = self.incidence_corner
+        self.incidence_neighbours = numpy.stack((element_neighbours[cells, corner],
+                                                 element_neighbours[cells, (corner-1) % num_corners]), axis=-1)
+
+        #if there is a cell with less than two neighboring cells for a corner, then
+        #this corner must be on a boundary
+        self.boundary_node = numpy.zeros(num_nodes, dtype=bool)
+        self.boundary_node[self.incidence_node[numpy.any(self.incidence_neighbours < 0, axis=1)]] = True
+
+        self._matrices = dict()
+
+    def _check_elem_values(self, elem_values):
         if (len(elem_values) != self.num_elems):
-            print "Error: number of elements in grid does not match number of elements passed"
-
-        node_values = numpy.zeros(self.num_nodes)
-
-        for i in range(self.num_nodes):
-            num_neighbors = len(self.inverse_mapping[i])
-            value = 0.0
-
-            #add value of neighboring element
-            for neighbor in self.inverse_mapping[i]:
-                value += elem_values[neighbor]
+            print("Error: number of elements in grid does not match number of elements passed")
+
+    def _cached_matrix(self, name, elem_area, builder):
+        #matrices are only cached for the area arrays of this converter
+        if elem_area is None:
+            key = (name, None)
+        elif elem_area is self.elem_area:
+            key = (name, "euclidian")
+        elif elem_area is self.elem_area_spherical:
+            key = (name, "spherical")
+        else:
+            return builder(elem_area)
+        if key not in self._matrices:
+            self._matrices[key] = builder(elem_area)
+        return self._matrices[key]
+
+    def _incidence_matrix(self, weights):
+        #sparse matrix from the node-element incidences, with rows normalized to one
+        weights = weights / numpy.bincount(self.incidence_node, weights, minlength=self.num_nodes)[self.incidence_node]
+        return scipy.sparse.csr_matrix((weights, self.inverse_mapping_elements, self.inverse_mapping_offsets),
+                                       shape=(self.num_nodes, self.num_elems))
 
-            #compute the averaged value
-            value /= num_neighbors
-
-            #store result
-            node_values[i] = value
-
-        return node_values
-
-
-    def compute_node_fracarea(self, i, elem_values, elem_area):
-            num_neighbors = len(self.inverse_mapping[i])
-            value = 0.0
-            area = 0.0
-
-            #add value of neighboring element
-            for neighbor in self.inverse_mapping[i]:
-                #value += elem_values[neighbor] 
-                fracarea = elem_area[neighbor]/3.0
-                area += fracarea
-                value += elem_values[neighbor] * fracarea
-            #compute the (area) averaged value
-            #value /= num_neighbors
-            value /= area
+    def get_nodes_from_elements(self, elem_values):
+        self._check_elem_values(elem_values)
+        matrix = self._cached_matrix("average", None,
+            lambda area: self._incidence_matrix(numpy.ones(len(self.incidence_node))))
+        return matrix.dot(elem_values)
 
-            return value
+    def _fracarea_matrix(self, elem_area):
+        fracarea = numpy.asarray(elem_area)[self.inverse_mapping_elements]/3.0
+        return self._incidence_matrix(fracarea)
 
     def get_nodes_from_elements_fracarea(self, elem_values, elem_area):
-        if (len(elem_values) != self.num_elems):
-            print "Error: number of elements in grid does not match number of elements passed"
-
-        node_values = numpy.zeros(self.num_nodes)
-
-        for i in range(self.num_nodes):
-            node_values[i] = self.compute_node_fracarea(i, elem_values, elem_area)
-
-        return node_values
-
-
+        self._check_elem_values(elem_values)
+        return self._cached_matrix("fracarea", elem_area, self._fracarea_matrix).dot(elem_values)
 
 
     """
@@ -171,96 +125,55 @@ class adcirc_grid_converter(object):
       grids for arbitrary-Lagrangian-Eulerian methods" by R. Loubere and M. Shashkov
       Journal of Computational Physics, 2005, Volume 209, Pages 105--138
     """
-    def get_nodes_from_elements_gather(self, elem_values, elem_area):
-        if (len(elem_values) != self.num_elems):
-            print "Error: number of elements in grid does not match number of elements passed"
-
-        node_values = numpy.zeros(self.num_nodes)
-
-        for i in range(self.num_nodes):
-
-            #if node is on boundary we for the moment defer to fracarea method
-            num_neighbors = len(self.inverse_mapping[i])
-            value = 0.0
-            area = 0.0
-
-            celli = 0 #index within adjacency_list
-            #add value of neighboring element
-            for cell in self.inverse_mapping[i]:
-                #value += elem_values[neighbor] 
-                subcellarea = elem_area[cell]/3.0
-                area += subcellarea
-                cell_neighbors = self.adjacency_list[i][celli]
-
-                if len(cell_neighbors) == 2:
-                    subcellval = 2.0 * elem_values[cell] 
-                    subcellval -= 0.5 * elem_values[cell_neighbors[0]]
-                    subcellval -= 0.5 * elem_values[cell_neighbors[1]]
-                if len(cell_neighbors) == 1:
-                    subcellval = 1.5 * elem_values[cell] 
-                    subcellval -= 0.5 * elem_values[cell_neighbors[0]]
-                if len(cell_neighbors) == 0:
-                    subcellval = 1.0 * elem_values[cell] 
-
-                value += subcellval * subcellarea
-                celli += 1
-
-            #compute the (area) averaged value
-            #value /= num_neighbors
-            value /= area
-
-            #store result
-            node_values[i] = value
-
-        return node_values
-
-
-
-
-
-
+    def _gather_matrix(self, elem_area):
+        cells = self.inverse_mapping_elements
+        subcellarea = numpy.asarray(elem_area)[cells]/3.0
+        area = numpy.bincount(self.incidence_node, subcellarea, minlength=self.num_nodes)
+        weight = subcellarea / area[self.incidence_node]
+
+        #the subcell value is (1 + 0.5*k)*value of the cell minus 0.5*value of each of its k neighbours
+        has_neighbour = self.incidence_neighbours >= 0
+        num_neighbours = has_neighbour.sum(axis=1)
+
+        rows = [self.incidence_node]
+        cols = [cells]
+        values = [(1.0 + 0.5*num_neighbours) * weight]
+        for k in range(2):
+            mask = has_neighbour[:,k]
+            rows.append(self.incidence_node[mask])
+            cols.append(self.incidence_neighbours[mask,k])
+            values.append(-0.5 * weight[mask])
+
+        return scipy.sparse.coo_matrix((numpy.concatenate(values), (numpy.concatenate(rows), numpy.concatenate(cols))),
+                                       shape=(self.num_nodes, self.num_elems)).tocsr()
 
+    def get_nodes_from_elements_gather(self, elem_values, elem_area):
+        self._check_elem_values(elem_values)
+        return self._cached_matrix("gather", elem_area, self._gather_matrix).dot(elem_values)
 
 
     def get_elements_from_nodes(self, node_values):
         if (len(node_values) != self.num_nodes):
-            print "Error: number of nodes in grid does not match number of nodes passed"
+            print("Error: number of nodes in grid does not match number of nodes passed")
         
-        elem_values = numpy.zeros(self.num_elems)
-
-        for i in range(self.num_elems):
-            neighbors = self.triangles[i]
-            value = ( node_values[neighbors[0]] + node_values[neighbors[1]] + node_values[neighbors[2]] ) / 3.0
-            elem_values[i] = value
-
-        return elem_values
-
-
-
-
-
-
-
-
+        node_values = numpy.asarray(node_values)
+        return node_values[self.triangles].sum(axis=1) / 3.0
 
 
     def area_sum(self, elem_values, elem_area):
-        sum = numpy.zeros(1, dtype=numpy.double)
-        for i in range(self.num_elems):
-            sum += elem_values[i] * elem_area[i]
-        return sum
+        return numpy.array([numpy.dot(elem_values, elem_area)])
 
 
     def print_area_sums(self, original_values, elem_values):
-        sum0 = c.area_sum(original_values, self.elem_area)
-        ssum0 = c.area_sum(original_values, self.elem_area_spherical)
-        sum1 = c.area_sum(elem_values, self.elem_area)
-        ssum1 = c.area_sum(elem_values, self.elem_area_spherical)
-        print "sum = ", sum1, "spherical area sum= ", ssum1
+        sum0 = self.area_sum(original_values, self.elem_area)
+        ssum0 = self.area_sum(original_values, self.elem_area_spherical)
+        sum1 = self.area_sum(elem_values, self.elem_area)
+        ssum1 = self.area_sum(elem_values, self.elem_area_spherical)
+        print("sum = ", sum1, "spherical area sum= ", ssum1)
         terror = (original_values.sum() - elem_values.sum())/original_values.sum()
         error = (sum0-sum1)/sum0
         serror = (ssum0-ssum1)/ssum0
-        print "total value error=%e" % terror , "error based on euclidian area=%e" % error, ", error based on spherical area=%e" % serror
+        print("total value error=%e" % terror , "error based on euclidian area=%e" % error, ", error based on spherical area=%e" % serror)
         
 
 
@@ -269,7 +182,7 @@ if __name__ == "__main__":
     c = adcirc_grid_converter(filename, "spherical")
 
 
-    print 'size=', c.size
+    print('size=', c.size)
 
 
 
@@ -286,7 +199,7 @@ if __name__ == "__main__":
     
     c.print_area_sums(original_values, elem_values)
 
-    print "Computing ",ntest," back and forth transformations using number of neighbors weights"
+    print("Computing ",ntest," back and forth transformations using number of neighbors weights")
 
     for i in range(ntest):
         node_values = c.get_nodes_from_elements(elem_values)
@@ -297,7 +210,7 @@ if __name__ == "__main__":
     #restore original values
     elem_values = original_values[:] #assuming this creates a copy
 
-    print "Computing ",ntest," back and forth transformations using area weights (Euclidian)"
+    print("Computing ",ntest," back and forth transformations using area weights (Euclidian)")
 
     for i in range(ntest):
         node_values = c.get_nodes_from_elements_fracarea(elem_values, c.elem_area)
@@ -308,7 +221,7 @@ if __name__ == "__main__":
     #restore original values
     elem_values = original_values[:] #assuming this creates a copy
 
-    print "Computing ",ntest," back and forth transformations using area weights (Spherical)"
+    print("Computing ",ntest," back and forth transformations using area weights (Spherical)")
 
     for i in range(ntest):
         node_values = c.get_nodes_from_elements_fracarea(elem_values, c.elem_area_spherical)
@@ -321,7 +234,7 @@ if __name__ == "__main__":
     spheric_node_values = node_values[:]
     elem_values = original_values[:] #assuming this creates a copy
 
-    print "Computing ",ntest," back and forth transformations using area weights (Gather)"
+    print("Computing ",ntest," back and forth transformations using area weights (Gather)")
 
     for i in range(ntest):
         node_values = c.get_nodes_from_elements_gather(elem_values, c.elem_area_spherical)
@@ -360,4 +273,4 @@ if __name__ == "__main__":
 
 
  
-    raw_input()
+    input()
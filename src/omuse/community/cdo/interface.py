@@ -6,6 +6,9 @@ from amuse.datamodel.grids import *
 
 from omuse.units import units
 
+#binary layout of a remapping file: src_address, dst_address, weights1, weights2, weights3
+REMAPPING_DTYPE = numpy.dtype('i4, i4, f8, f8, f8')
+
 class CDOInterface(CodeInterface):
     
     """
@@ -258,19 +261,14 @@ class CDORemapper(CommonCode):
 
     def _structured_corners_to_cdo_corners(self, grid):
         #construct a cell_corners array that CDO understands
-        dims = grid.shape
-        cell_corners = numpy.zeros((2, grid.size*4), dtype=numpy.double) #always 4 corners for structured grid
-        print(grid._cell_corners.shape)
-        for k in range(len(cell_corners)):
-            index = 0
-            for j in range(dims[1]):
-                for i in range(dims[0]):
-                    cell_corners[k,index+0] = grid._cell_corners[k, i  , j  ] #sw
-                    cell_corners[k,index+1] = grid._cell_corners[k, i+1, j  ] #se
-                    cell_corners[k,index+2] = grid._cell_corners[k, i+1, j+1] #ne
-                    cell_corners[k,index+3] = grid._cell_corners[k, i  , j+1] #nw
-                    index += 4
-        return cell_corners
+        #CDO expects the 4 corners (sw, se, ne, nw) of each cell to be consecutive, with the cells in Fortran order
+        corners = numpy.asarray(grid._cell_corners, dtype=numpy.double)
+        cell_corners = numpy.stack([corners[:, :-1, :-1],   #sw
+                                    corners[:, 1:,  :-1],   #se
+                                    corners[:, 1:,  1:],    #ne
+                                    corners[:, :-1, 1:]],   #nw
+                                   axis=-1)
+        return numpy.ascontiguousarray(cell_corners.transpose(0, 2, 1, 3)).reshape(2, grid.size*4)
 
     def set_src_grid(self, grid):
         if not ((type(grid) is UnstructuredGrid) or (type(grid) is StructuredGrid)):
@@ -439,14 +437,19 @@ class CDORemapper(CommonCode):
         num_links = self.get_num_links()
         (src, dst, w1, w2, w3) = self.get_remap_links(numpy.arange(num_links))
 
-        remapping = numpy.array(zip(src, dst, w1, w2, w3), dtype='i32, i32, f64, f64, f64')
+        remapping = numpy.zeros(num_links, dtype=REMAPPING_DTYPE)
+        remapping['f0'] = src
+        remapping['f1'] = dst
+        remapping['f2'] = w1
+        remapping['f3'] = w2
+        remapping['f4'] = w3
         remapping.tofile(filename)
         
 
     def read_remapping_from_file(self, filename):
         self.remapping_filename = filename
 
-        remapping = numpy.fromfile(filename, dtype='i32, i32, f64, f64, f64')
+        remapping = numpy.fromfile(filename, dtype=REMAPPING_DTYPE)
 
         num_links = remapping.size
         self.set_num_links(num_links)
@@ -464,6 +467,5 @@ class CDORemapper(CommonCode):
 
         return remapping    
 
-    def get_remapping_filename():
-        return self.remapping_filename
-
+    def get_remapping_filename(self):
+        return getattr(self, "remapping_filename", "")
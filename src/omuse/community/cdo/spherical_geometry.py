@@ -1,5 +1,5 @@
 import numpy
-from math import *
+from numpy import sin, cos, tan, sqrt, arctan as atan, arctan2 as atan2
 
 #radius of Earth in meters
 R = 6371000
@@ -7,13 +7,15 @@ from amuse.units import units
 
 from nose.tools import nottest
 
+from omuse.ext.testing import regular_structured_grid
+
 default_options=dict(redirection="none", channel="sockets")
 
 class CDORemapperTests(TestWithMPI):
     
     def test1(self):
         r = CDORemapper(**default_options)
-        print r
+        print(r)
         r.stop()
 
 
@@ -35,5 +37,49 @@ class CDORemapperTests(TestWithMPI):
 
         r.stop()
 
+    #check the packing of structured grid corners against the cell-by-cell ordering (sw, se, ne, nw, i fastest)
+    def test3(self):
+        grid = regular_structured_grid(5, 3)
+        grid._cell_corners = grid._cell_corners + numpy.random.random(grid._cell_corners.shape)
+
+        dims = grid.shape
+        expected = numpy.zeros((2, grid.size*4), dtype=numpy.double)
+        for k in range(2):
+            index = 0
+            for j in range(dims[1]):
+                for i in range(dims[0]):
+                    expected[k,index+0] = grid._cell_corners[k, i  , j  ]
+                    expected[k,index+1] = grid._cell_corners[k, i+1, j  ]
+                    expected[k,index+2] = grid._cell_corners[k, i+1, j+1]
+                    expected[k,index+3] = grid._cell_corners[k, i  , j+1]
+                    index += 4
+
+        cell_corners = CDORemapper._structured_corners_to_cdo_corners(None, grid)
+        self.assertEqual(cell_corners.shape, (2, grid.size*4))
+        self.assertTrue(numpy.array_equal(cell_corners, expected))
+
+    #check the local sparse remapping against the remapping performed by CDO
+    def test4(self):
+        from omuse.ext.grid_remappers import conservative_spherical_remapper
+
+        src_grid = regular_structured_grid(36, 18)
+        dst_grid = regular_structured_grid(25, 13)
 
+        r = CDORemapper(**default_options)
+        r.parameters.src_grid = src_grid
+        r.parameters.dst_grid = dst_grid
+        r.commit_parameters()
+
+        lon = src_grid.lon.value_in(units.rad).ravel('F')
+        lat = src_grid.lat.value_in(units.rad).ravel('F')
+        values = numpy.cos(3*lon)*numpy.cos(lat)**2 + numpy.sin(2*lat) + 0.5*numpy.sin(lon)*numpy.sin(lat)**3
+
+        remapper = conservative_spherical_remapper(src_grid, dst_grid, cdo_remapper=r)
+        expected = remapper._remap(values)
+        remapper.local_remap = True
+        local = remapper._remap(values)
+        r.stop()
 
+        self.assertEqual(local.shape, (dst_grid.size,))
+        self.assertTrue(numpy.abs(expected).max() > 0.1)
+        self.assertAlmostRelativeEqual(local, expected, 10)
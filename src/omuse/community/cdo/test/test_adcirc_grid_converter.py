@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+
+import numpy
+
+from amuse.test.amusetest import TestCase
+
+from omuse.community.cdo.adcirc_grid_converter import adcirc_grid_converter
+from omuse.community.cdo.spherical_geometry import distance, triangle_area
+
+
+def write_fort14(filename, nx=6, ny=5):
+    """ write a small fort.14 mesh of perturbed rectangles split in counter-clockwise triangles,
+        with alternating diagonals so that the nodes have different numbers of elements """
+    random = numpy.random.RandomState(1)
+    i, j = numpy.meshgrid(numpy.arange(nx), numpy.arange(ny), indexing='ij')
+    lon = 0.01*(i + 0.2*random.random(i.shape)).ravel()
+    lat = 0.5 + 0.01*(j + 0.2*random.random(j.shape)).ravel()
+    node = lambda i, j: i*ny + j + 1
+    triangles = []
+    for i in range(nx-1):
+        for j in range(ny-1):
+            a, b, c, d = node(i, j), node(i+1, j), node(i+1, j+1), node(i, j+1)
+            if (i + j) % 2 == 0:
+                triangles += [(a, b, c), (a, c, d)]
+            else:
+                triangles += [(a, b, d), (b, c, d)]
+    with open(filename, "w") as f:
+        f.write("test mesh\n")
+        f.write("%d %d\n" % (len(triangles), nx*ny))
+        for n in range(nx*ny):
+            f.write("%d %.15f %.15f 10.0\n" % (n+1, lon[n], lat[n]))
+        for n, triangle in enumerate(triangles):
+            f.write("%d 3 %d %d %d\n" % ((n+1,) + triangle))
+        f.write("0 ! NOPE\n0 ! NETA\n0 ! NBOU\n0 ! NVEL\n")
+
+
+class reference_converter(object):
+    """ the per-node loops of the converter before it was vectorized """
+
+    def __init__(self, lon, lat, triangles, num_nodes):
+        self.num_nodes = num_nodes
+        self.triangles = triangles
+        self.inverse_mapping = inverse_mapping = [[] for i in range(num_nodes)]
+        self.elem_area = []
+        self.elem_area_spherical = []
+        for i, (n1, n2, n3) in enumerate(triangles):
+            for n in (n1, n2, n3):
+                inverse_mapping[n].append(i)
+            lat1, lat2, lat3 = lat[n1], lat[n2], lat[n3]
+            lon1, lon2, lon3 = lon[n1], lon[n2], lon[n3]
+            self.elem_area.append((((lon2-lon1)*(lat3-lat1))-((lon3-lon1)*(lat2-lat1)))/2.0)
+            a = distance(lat1, lon1, lat2, lon2)
+            b = distance(lat2, lon2, lat3, lon3)
+            c = distance(lat3, lon3, lat1, lon1)
+            self.elem_area_spherical.append(triangle_area(a, b, c))
+
+        self.adjacency_list = []
+        self.boundary_node = [False]*num_nodes
+        for node in range(num_nodes):
+            cell_neighbors = []
+            for cell in inverse_mapping[node]:
+                corner_list = list(triangles[cell])
+                corner_list.remove(node)
+                neighbors = [i for i in inverse_mapping[node]
+                             if sum(1 for c in triangles[i] if c in corner_list) == 1]
+                if len(neighbors) < 2:
+                    self.boundary_node[node] = True
+                cell_neighbors.append(neighbors)
+            self.adjacency_list.append(cell_neighbors)
+
+    def get_nodes_from_elements(self, elem_values):
+        return numpy.array([numpy.mean([elem_values[e] for e in elements]) for elements in self.inverse_mapping])
+
+    def get_nodes_from_elements_fracarea(self, elem_values, elem_area):
+        result = numpy.zeros(self.num_nodes)
+        for i, elements in enumerate(self.inverse_mapping):
+            value = sum(elem_values[e]*elem_area[e]/3.0 for e in elements)
+            result[i] = value / sum(elem_area[e]/3.0 for e in elements)
+        return result
+
+    def get_nodes_from_elements_gather(self, elem_values, elem_area):
+        result = numpy.zeros(self.num_nodes)
+        for i, elements in enumerate(self.inverse_mapping):
+            value = 0.0
+            area = 0.0
+            for cell, cell_neighbors in zip(elements, self.adjacency_list[i]):
+                subcellarea = elem_area[cell]/3.0
+                area += subcellarea
+                subcellval = (1.0 + 0.5*len(cell_neighbors)) * elem_values[cell]
+                for neighbor in cell_neighbors:
+                    subcellval -= 0.5 * elem_values[neighbor]
+                value += subcellval * subcellarea
+            result[i] = value / area
+        return result
+
+
+class TestAdcircGridConverter(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        filename = os.path.join(self.directory, "fort.14")
+        write_fort14(filename)
+        self.converter = adcirc_grid_converter(filename, "cartesian")
+        c = self.converter
+        self.reference = reference_converter(c.lon, c.lat, [list(t) for t in c.triangles], c.num_nodes)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test1(self):
+        """ test the areas and the node to element incidence """
+        c, r = self.converter, self.reference
+        self.assertEqual(c.num_nodes, 30)
+        self.assertEqual(c.num_elems, 40)
+        self.assertAlmostRelativeEqual(c.elem_area, r.elem_area, 12)
+        self.assertAlmostRelativeEqual(c.elem_area_spherical, r.elem_area_spherical, 10)
+        for i in range(c.num_nodes):
+            begin, end = c.inverse_mapping_offsets[i], c.inverse_mapping_offsets[i+1]
+            self.assertEqual(list(c.inverse_mapping_elements[begin:end]), r.inverse_mapping[i])
+            self.assertEqual(list(c.incidence_node[begin:end]), [i]*(end-begin))
+            for element, corner in zip(c.inverse_mapping_elements[begin:end], c.incidence_corner[begin:end]):
+                self.assertEqual(c.triangles[element, corner], i)
+
+    def test2(self):
+        """ test the element neighbours of every incidence and the boundary nodes """
+        c, r = self.converter, self.reference
+        for i in range(c.num_nodes):
+            begin, end = c.inverse_mapping_offsets[i], c.inverse_mapping_offsets[i+1]
+            for neighbours, expected in zip(c.incidence_neighbours[begin:end], r.adjacency_list[i]):
+                self.assertEqual(sorted(n for n in neighbours if n >= 0), sorted(expected))
+        self.assertEqual(list(c.boundary_node), r.boundary_node)
+        self.assertEqual(numpy.count_nonzero(c.boundary_node), 18)
+
+    def test3(self):
+        """ test the element to node averages """
+        c, r = self.converter, self.reference
+        values = numpy.random.RandomState(2).random(c.num_elems)
+        self.assertAlmostRelativeEqual(c.get_nodes_from_elements(values), r.get_nodes_from_elements(values), 12)
+        for area in [c.elem_area, c.elem_area_spherical]:
+            self.assertAlmostRelativeEqual(c.get_nodes_from_elements_fracarea(values, area),
+                                           r.get_nodes_from_elements_fracarea(values, area), 12)
+            self.assertAlmostRelativeEqual(c.get_nodes_from_elements_gather(values, area),
+                                           r.get_nodes_from_elements_gather(values, area), 12)
+        nodes = numpy.random.RandomState(3).random(c.num_nodes)
+        expected = [sum(nodes[n] for n in t)/3.0 for t in c.triangles]
+        self.assertAlmostRelativeEqual(c.get_elements_from_nodes(nodes), expected, 12)
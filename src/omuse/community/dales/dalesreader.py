@@ -1,18 +1,25 @@
+import collections
 import logging
+import multiprocessing
 import re
+from concurrent.futures import ProcessPoolExecutor
 import numpy
 import netCDF4
 
 # File readers for DALES experiments. We support single-timestep prifile ASCII
 # file and netcdf files for time-dependent output profiles or time series.
+# Netcdf variables are read lazily in slabs of consecutive time steps, which are
+# kept in a least-recently-used cache, so that repeated reads of time windows
+# don't go back to the file.
 
 log = logging.getLogger(__name__)
 
 
-# Factory method for creating file readers.
-def make_file_reader(filename):
+# Factory method for creating file readers. The keyword arguments are passed to
+# the netcdf reader.
+def make_file_reader(filename, **kwargs):
     if filename.endswith(".nc"):
-        result = NetcdfReader(filename)
+        result = NetcdfReader(filename, **kwargs)
     else:
         result = AsciiReader(filename)
     log.info("Detected %d variables in file %s" % (len(result.variables), filename))
@@ -82,7 +89,17 @@ class AsciiReader(DalesReader):
                 break
         if "height" in self.variables:
             self.dimensions.append("height")
-        self.data = numpy.loadtxt(self.filepath, skiprows=2).transpose()
+
+    # The data is loaded on first access.
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = numpy.loadtxt(self.filepath, skiprows=2).transpose()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value if len(value) > 0 else None
 
     def __getitem__(self, varname, *args):
         if varname in self.variables:
@@ -105,20 +122,109 @@ class AsciiReader(DalesReader):
             return super(AsciiReader, self).get_shape(var)
 
 
-# Netcdf file reader implementation.
+# Least-recently-used cache of variable slabs, limited by the total number of bytes.
+class SlabCache(object):
+
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.slabs = collections.OrderedDict()
+
+    # Returns the cached slab for the given key, or None.
+    def get(self, key):
+        slab = self.slabs.get(key, None)
+        if slab is not None:
+            self.slabs.move_to_end(key)
+        return slab
+
+    # Adds a slab to the cache, evicting the least recently used slabs if the cache
+    # is full. Slabs larger than the cache are not stored.
+    def put(self, key, slab):
+        if slab.nbytes > self.max_bytes:
+            return
+        old = self.slabs.pop(key, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self.slabs[key] = slab
+        self.nbytes += slab.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.slabs.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        self.slabs.clear()
+        self.nbytes = 0
+
+
+# Lazy view of a netcdf variable. Indexing it only reads the time steps that are
+# selected, through the slab cache of the reader.
+class NetcdfVariable(object):
+
+    def __init__(self, reader, name):
+        self.reader = reader
+        self.name = name
+
+    @property
+    def shape(self):
+        return self.reader.get_shape(self.name)
+
+    @property
+    def dimensions(self):
+        return self.reader.dataset.variables[self.name].dimensions
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        index = index if isinstance(index, tuple) else (index,)
+        axis = self.reader.get_time_axis(self.name)
+        if axis is None or axis >= len(index) or any(i is Ellipsis for i in index):
+            return self.reader.get_time_slice(self.name)[index]
+        steps = numpy.arange(self.shape[axis])[index[axis]]
+        if steps.size == 0:
+            return self.reader.get_time_slice(self.name, 0, 0)[index[:axis] + (slice(0, 0),) + index[axis + 1:]]
+        start, end = steps.min(), steps.max() + 1
+        if isinstance(index[axis], slice):
+            step = index[axis].indices(self.shape[axis])[2]
+            first, last = steps[0] - start, steps[-1] - start
+            local = slice(first, last + 1, step) if step > 0 else slice(first, last - 1 if last > 0 else None, step)
+        else:
+            local = steps - start
+        data = self.reader.get_time_slice(self.name, start, end)
+        return data[index[:axis] + (local,) + index[axis + 1:]]
+
+
+# Netcdf file reader implementation. Time-dependent variables are read in slabs of
+# slab_size time steps, rounded up to whole chunks of the time dimension, which are
+# kept in the given cache (a new one by default). Variables of netcdf3 files are
+# memory-mapped when scipy is available, unless use_mmap is False.
 class NetcdfReader(DalesReader):
+    time_dim = "time"
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, cache=None, slab_size=64, use_mmap=True):
         super(NetcdfReader, self).__init__(filepath)
         self.dataset = netCDF4.Dataset(filepath, 'r')
         self.variables = [v for v in self.dataset.variables if v not in self.dataset.dimensions]
         self.units = [getattr(self.dataset.variables[v], "units", None) for v in self.variables]
+        self.cache = SlabCache() if cache is None else cache
+        self.slab_size = slab_size
+        self.time_values = None
+        self.mmap_file = None
+        # scipy reads the classic and 64-bit offset formats, not 64-bit data (CDF5) files
+        if use_mmap and self.dataset.data_model in ("NETCDF3_CLASSIC", "NETCDF3_64BIT_OFFSET"):
+            try:
+                import scipy.io
+                self.mmap_file = scipy.io.netcdf_file(filepath, 'r', mmap=True)
+            except ImportError:
+                log.debug("Memory-mapped reading of %s requires scipy" % filepath)
+            except (ValueError, TypeError, OSError) as e:
+                log.debug("Memory-mapped reading of %s failed: %s" % (filepath, e))
 
     def __getitem__(self, varname, *args):
-        v = self.dataset.variables.get(varname, None)
-        if not v:
+        if varname not in self.dataset.variables:
             return []
-        return v.__getitem__(*args)
+        v = NetcdfVariable(self, varname)
+        return v.__getitem__(*args) if args else v
 
     def get_heights(self, var):
         v = self.dataset.variables.get(var, None)
@@ -133,9 +239,11 @@ class NetcdfReader(DalesReader):
         v = self.dataset.variables.get(var, None)
         if not v:
             return []
-        if "time" in v.dimensions:
-            dim = self.dataset.variables.get("time", None)
-            return dim[:] if dim else []
+        if self.time_dim in v.dimensions:
+            if self.time_values is None:
+                dim = self.dataset.variables.get(self.time_dim, None)
+                self.time_values = dim[:] if dim else []
+            return self.time_values
 
     def get_shape(self, var):
         if var in self.variables:
@@ -148,3 +256,176 @@ class NetcdfReader(DalesReader):
             return getattr(self.dataset.variables[var], "_FillValue", None)
         else:
             return super(NetcdfReader, self).get_missval(var)
+
+    # Returns the axis of the time dimension of the given variable, or None.
+    def get_time_axis(self, var):
+        dims = self.dataset.variables[var].dimensions
+        return dims.index(self.time_dim) if self.time_dim in dims else None
+
+    # Returns the number of time steps per slab of the given variable, a multiple of
+    # the chunk size along the time dimension.
+    def get_slab_size(self, var):
+        v = self.dataset.variables[var]
+        chunking = v.chunking()
+        if not chunking or chunking == "contiguous":
+            return self.slab_size
+        chunk = chunking[self.get_time_axis(var)]
+        return max(1, -(-self.slab_size // chunk)) * chunk
+
+    # Returns the data of the given variable for the time steps start up to end,
+    # reading the slabs that are not cached. Variables without a time dimension are
+    # returned entirely. The slabs are cached by their size and index, readers with
+    # different slab sizes can share a cache.
+    def get_time_slice(self, var, start=0, end=None):
+        axis = self.get_time_axis(var)
+        if axis is None:
+            key = (self.filepath, var, None)
+            data = self.cache.get(key)
+            if data is None:
+                data = self.read(var, slice(None))
+                self.cache.put(key, data)
+            return data.copy()
+        n = self.get_shape(var)[axis]
+        start, end, _ = slice(start, end).indices(n)
+        end = max(start, end)
+        size = self.get_slab_size(var)
+        first = start // size
+        last = (end - 1) // size + 1 if end > start else first
+        slabs = [self.cache.get((self.filepath, var, size, i)) for i in range(first, last)]
+        # Consecutive missing slabs are read at once.
+        i = 0
+        while i < len(slabs):
+            if slabs[i] is not None:
+                i += 1
+                continue
+            j = i
+            while j < len(slabs) and slabs[j] is None:
+                j += 1
+            data = self.read(var, slice((first + i) * size, min((first + j) * size, n)), axis)
+            for k in range(i, j):
+                index = [slice(None)] * data.ndim
+                index[axis] = slice((k - i) * size, (k - i + 1) * size)
+                slabs[k] = data[tuple(index)].copy()
+                self.cache.put((self.filepath, var, size, first + k), slabs[k])
+            i = j
+        if not slabs:
+            return self.read(var, slice(start, end), axis)
+        index = [slice(None)] * len(self.get_shape(var))
+        index[axis] = slice(start - first * size, end - first * size)
+        return numpy.ma.concatenate(slabs, axis=axis)[tuple(index)]
+
+    # Returns the data of the given variable between the times tmin and tmax, in
+    # seconds since the starttime, inclusive, together with these times.
+    def get_time_window(self, var, tmin=None, tmax=None):
+        times = numpy.asarray(self.get_times(var))
+        start = 0 if tmin is None else numpy.searchsorted(times, tmin, side="left")
+        end = len(times) if tmax is None else numpy.searchsorted(times, tmax, side="right")
+        return times[start:end], self.get_time_slice(var, start, end)
+
+    # Reads the given index range along the given axis of a variable from the file,
+    # from the memory map if possible, as a masked array. The memory-mapped data is
+    # masked as netCDF4 does, by the fill and missing values and the valid range.
+    def read(self, var, index, axis=0):
+        v = self.dataset.variables[var]
+        full_index = [slice(None)] * len(v.shape)
+        if full_index:
+            full_index[axis] = index
+        full_index = tuple(full_index)
+        if self.mmap_file is not None and not any(hasattr(v, a) for a in ["scale_factor", "add_offset"]):
+            data = numpy.array(self.mmap_file.variables[var].data[full_index], dtype=v.dtype)
+            missing = [getattr(v, a) for a in ["_FillValue", "missing_value"] if hasattr(v, a)]
+            if not hasattr(v, "_FillValue") and v.dtype.str[1:] in netCDF4.default_fillvals:
+                missing.append(netCDF4.default_fillvals[v.dtype.str[1:]])
+            mask = numpy.zeros(data.shape, dtype=bool)
+            for value in missing:
+                mask |= data == numpy.asarray(value, dtype=v.dtype)
+            if v.dtype.kind != "S":
+                valid_min, valid_max = getattr(v, "valid_min", None), getattr(v, "valid_max", None)
+                if numpy.size(getattr(v, "valid_range", None)) == 2:
+                    valid_min, valid_max = v.valid_range
+                if valid_min is not None:
+                    mask |= data < numpy.asarray(valid_min, dtype=v.dtype)
+                if valid_max is not None:
+                    mask |= data > numpy.asarray(valid_max, dtype=v.dtype)
+            return numpy.ma.masked_array(data, mask=mask)
+        return numpy.ma.asarray(v[full_index])
+
+    def close(self):
+        if self.mmap_file is not None:
+            self.mmap_file.close()
+            self.mmap_file = None
+        self.dataset.close()
+
+
+# Reader processes keep their open files, with their slab caches.
+_worker_readers = {}
+
+
+def _read_member(filepath, var, start, end, kwargs):
+    if filepath not in _worker_readers:
+        _worker_readers[filepath] = NetcdfReader(filepath, **kwargs)
+    return _worker_readers[filepath].get_time_slice(var, start, end)
+
+
+# Reader for an ensemble of netcdf files with the same variables, e.g. the output of
+# the members of a superparameterization run. The data of the members is read in
+# parallel by max_workers processes and stacked along a new first axis. The metadata
+# is taken from the first file.
+class EnsembleReader(DalesReader):
+
+    def __init__(self, filepaths, max_workers=None, **kwargs):
+        if not filepaths:
+            raise Exception("EnsembleReader needs at least one file")
+        super(EnsembleReader, self).__init__(filepaths[0])
+        self.filepaths = list(filepaths)
+        self.kwargs = kwargs
+        self.reader = NetcdfReader(self.filepaths[0], **kwargs)
+        self.variables = self.reader.variables
+        self.units = self.reader.units
+        self.max_workers = min(len(self.filepaths), multiprocessing.cpu_count()) if max_workers is None else max_workers
+        self.executor = None
+
+    def get_heights(self, var):
+        return self.reader.get_heights(var)
+
+    def get_times(self, var):
+        return self.reader.get_times(var)
+
+    def get_shape(self, var):
+        shape = self.reader.get_shape(var)
+        return (len(self.filepaths),) + tuple(shape) if shape else shape
+
+    def get_missval(self, var):
+        return self.reader.get_missval(var)
+
+    # Returns the data of the given variable for the time steps start up to end,
+    # for all members.
+    def get_time_slice(self, var, start=0, end=None):
+        if var not in self.variables:
+            raise Exception("Variable %s not found in %s" % (var, self.filepaths[0]))
+        if self.max_workers <= 1:
+            members = [_read_member(f, var, start, end, self.kwargs) for f in self.filepaths]
+        else:
+            if self.executor is None:
+                context = multiprocessing.get_context("spawn")
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            futures = [self.executor.submit(_read_member, f, var, start, end, self.kwargs) for f in self.filepaths]
+            members = [future.result() for future in futures]
+        shapes = set(m.shape for m in members)
+        if len(shapes) > 1:
+            raise Exception("Variable %s has different shapes in the ensemble files: %s" % (var, str(shapes)))
+        return numpy.ma.stack(members)
+
+    # Returns the data of the given variable between the times tmin and tmax for all
+    # members, together with these times.
+    def get_time_window(self, var, tmin=None, tmax=None):
+        times = numpy.asarray(self.get_times(var))
+        start = 0 if tmin is None else numpy.searchsorted(times, tmin, side="left")
+        end = len(times) if tmax is None else numpy.searchsorted(times, tmax, side="right")
+        return times[start:end], self.get_time_slice(var, start, end)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.reader.close()
@@ -0,0 +1,203 @@
+import logging
+import time
+
+import numpy
+from amuse.rfi.async_request import AsyncRequestsPool
+from omuse.community.dales.interface import profile_names
+from omuse.units import units
+
+# Scheduler for running the same operations on many Dales instances, as in superparameterization
+# runs, with a bounded number of concurrent asynchronous requests.
+
+log = logging.getLogger(__name__)
+
+
+class DalesEnsemble(object):
+    """Ensemble of Dales instances
+
+    Evolves the instances, retrieves their profiles and sets their tendencies with asynchronous requests, of which
+    at most max_requests are in flight at a time. The wall time of every call is recorded per instance, and the
+    instances are started in order of decreasing expected wall time, so the slowest instances don't start last.
+
+    Parameters
+    ----------
+    instances : list of Dales
+        The instances, or objects with the same interface
+    max_requests : integer, optional
+        Maximum number of concurrent requests, all instances by default
+    smoothing : float, optional
+        Weight of the last call in the expected wall time of an instance, between 0 and 1
+    """
+
+    def __init__(self, instances, max_requests=None, smoothing=0.5):
+        self.instances = list(instances)
+        self.max_requests = len(self.instances) if max_requests is None else max_requests
+        if self.max_requests < 1:
+            raise Exception("max_requests should be at least 1, got %s" % str(self.max_requests))
+        self.smoothing = smoothing
+        self.wall_times = {}
+        self.loads = {}
+        self.levels = {}
+
+    def run(self, name, function, args=None, wall_time=None):
+        """Calls a function for every instance with bounded concurrency
+
+        Parameters
+        ----------
+        name : str
+            Name of the operation, for the statistics and ordering
+        function : callable
+            Called as function(instance, *args) and returns an asynchronous request, or None if there is nothing to
+            do for the instance
+        args : list of tuples, optional
+            Extra arguments for each instance
+        wall_time : callable, optional
+            Returns the wall time in seconds from the result of a request, e.g. as measured by the worker.
+            By default the time from sending the request until its result arrives is used.
+
+        Returns
+        -------
+        list
+            The results of the requests, in the order of the instances, None for instances without a request
+        """
+        n = len(self.instances)
+        if args is None:
+            args = [()] * n
+        results = [None] * n
+        start_times = [None] * n
+
+        def handle_result(request, index):
+            results[index] = request.result()
+            elapsed = time.time() - start_times[index]
+            self.record(name, index, elapsed if wall_time is None else wall_time(results[index]))
+
+        start = time.time()
+        waiting = self.get_order(name)
+        pool = AsyncRequestsPool()
+        while len(waiting) > 0 or len(pool) > 0:
+            while len(waiting) > 0 and len(pool) < self.max_requests:
+                index = waiting.pop(0)
+                start_times[index] = time.time()
+                request = function(self.instances[index], *args[index])
+                if request is not None:
+                    pool.add_request(request, handle_result, [index])
+            if len(pool) > 0:
+                pool.wait()
+        log.debug("%s on %d instances took %f s" % (name, n, time.time() - start))
+        return results
+
+    def record(self, name, index, wall_time):
+        """Adds the wall time of a call to the statistics of an instance"""
+        if name not in self.wall_times:
+            self.wall_times[name] = [[] for _ in self.instances]
+            self.loads[name] = numpy.full(len(self.instances), numpy.nan)
+        self.wall_times[name][index].append(wall_time)
+        load = self.loads[name][index]
+        self.loads[name][index] = wall_time if numpy.isnan(load) else \
+            self.smoothing * wall_time + (1 - self.smoothing) * load
+
+    def get_order(self, name):
+        """Instance indices in order of decreasing expected wall time, the ones without any calls first"""
+        if name not in self.loads:
+            return list(range(len(self.instances)))
+        loads = numpy.where(numpy.isnan(self.loads[name]), numpy.inf, self.loads[name])
+        return [int(i) for i in numpy.argsort(-loads, kind="stable")]
+
+    def get_wall_times(self, name="evolve_model"):
+        """Wall times in seconds of all calls of an operation, a list for each instance"""
+        return self.wall_times.get(name, [[] for _ in self.instances])
+
+    def get_statistics(self, name="evolve_model"):
+        """Wall time statistics of an operation
+
+        Returns
+        -------
+        dict
+            Arrays with the number of calls, the mean, maximum and last wall time and the expected wall time used
+            for the ordering, per instance. The times are in seconds, NaN for instances without calls.
+        """
+        wall_times = self.get_wall_times(name)
+        return {
+            "count": numpy.array([len(x) for x in wall_times]),
+            "mean": numpy.array([numpy.mean(x) if x else numpy.nan for x in wall_times]),
+            "max": numpy.array([numpy.max(x) if x else numpy.nan for x in wall_times]),
+            "last": numpy.array([x[-1] if x else numpy.nan for x in wall_times]),
+            "load": self.loads.get(name, numpy.full(len(self.instances), numpy.nan)).copy(),
+        }
+
+    def get_levels(self, index):
+        """Vertical indices of the profiles of an instance, retrieved once"""
+        if index not in self.levels:
+            kmin, kmax = self.instances[index].get_z_grid_range()
+            self.levels[index] = numpy.arange(kmin, kmax + 1)
+        return self.levels[index]
+
+    def evolve_model(self, tend, exactEnd=True):
+        """Evolves all instances to the given time
+
+        The wall times are the ones measured by the workers.
+
+        Returns
+        -------
+        list
+            The wall time of every instance
+        """
+        return self.run("evolve_model", lambda instance: instance.evolve_model.asynchronous(tend, exactEnd=exactEnd),
+                        wall_time=lambda walltime: walltime.value_in(units.s))
+
+    def get_profiles(self, fields=None):
+        """Retrieves the profiles of all instances, one message per instance
+
+        Parameters
+        ----------
+        fields : list of str, optional
+            Variable shortnames, as for Dales.get_profiles. All by default.
+
+        Returns
+        -------
+        list of dict
+            1D arrays containing mean vertical profile values by variable shortname, for every instance
+        """
+        if fields is None:
+            fields = profile_names
+        for field in fields:
+            if field not in profile_names:
+                raise Exception('get_profiles called with undefined field %s' % field)
+        args = [(self.get_levels(i),) for i in range(len(self.instances))]
+        results = self.run("get_profiles", lambda instance, k: instance.get_profiles_.asynchronous(k), args)
+        return [dict((name, profile) for name, profile in zip(profile_names, profiles) if name in fields)
+                for profiles in results]
+
+    def set_tendencies(self, tendencies):
+        """Sets the large-scale tendency profiles of all instances
+
+        Parameters
+        ----------
+        tendencies : list of dict
+            Tendency profiles by variable shortname U, V, THL or QT, for every instance
+        """
+        if len(tendencies) != len(self.instances):
+            raise Exception('set_tendencies called with %d tendencies for %d instances' %
+                            (len(tendencies), len(self.instances)))
+        for tendency in tendencies:
+            for field in tendency:
+                if field not in ('U', 'V', 'THL', 'QT'):
+                    raise Exception('set_tendencies called with undefined field %s' % field)
+
+        # the requests to one instance are handled in order, so it is done when the last one is,
+        # the results of the earlier ones are checked when its result is retrieved
+        def check_results(result, requests):
+            for request in requests:
+                request.result()
+            return result()
+
+        def set_tendency(instance, k, tendency):
+            requests = [getattr(instance, "set_tendency_" + field + "_").asynchronous(k, tendency[field])
+                        for field in sorted(tendency)]
+            if not requests:
+                return None
+            requests[-1].add_result_handler(check_results, (requests[:-1],))
+            return requests[-1]
+
+        args = [(self.get_levels(i), tendency) for i, tendency in enumerate(tendencies)]
+        self.run("set_tendencies", set_tendency, args)
@@ -37,6 +37,15 @@ module dales_interface
 
     logical :: exactEnd = .false.
 
+    ! One-based, inclusive index bounds of the block accessed by the block
+    ! getters and setters, see set_block_range
+    integer :: block_imin = 1, block_imax = 1, block_jmin = 1, block_jmax = 1, block_kmin = 1, block_kmax = 1
+
+    ! Names of the fields returned one after another by get_block_fields, see set_block_fields
+    integer, parameter :: max_block_fields = 64
+    character(16) :: block_fields(max_block_fields)
+    integer :: nblock_fields = 0
+
 contains
 
     ! Sets the variance nudging type
@@ -456,6 +465,38 @@ contains
 
         ret = gathercloudfrac(ql0(2:i1, 2:j1, :), g_k, a)
     end function get_cloudfraction
+
+    ! Returns all profiles of the profiles grid in one call, in the order
+    ! U, V, W, THL, QT, QL, QL_ice, QR, E12, T, cloud fraction, pressure, density, base density.
+    ! The rain water profile is zero if Dales doesn't have the rain field, as in get_profile_QR_.
+    function get_profiles_(g_k, a_u, a_v, a_w, a_thl, a_qt, a_ql, a_ql_ice, a_qr, a_e12, a_t, a_cf, &
+            a_presf, a_rhof, a_rhobf, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_k
+        real, dimension(n), intent(out) :: a_u, a_v, a_w, a_thl, a_qt, a_ql, a_ql_ice, a_qr, a_e12, a_t, a_cf, &
+                a_presf, a_rhof, a_rhobf
+        integer :: ret, r(13), i
+
+        ! all profiles are computed on every rank, the gathers are collective
+        r(1) = get_profile_U_(g_k, a_u, n)
+        r(2) = get_profile_V_(g_k, a_v, n)
+        r(3) = get_profile_W_(g_k, a_w, n)
+        r(4) = get_profile_THL_(g_k, a_thl, n)
+        r(5) = get_profile_QT_(g_k, a_qt, n)
+        r(6) = get_profile_QL_(g_k, a_ql, n)
+        r(7) = get_profile_QL_ice_(g_k, a_ql_ice, n)
+        r(8) = get_profile_E12_(g_k, a_e12, n)
+        r(9) = get_profile_T_(g_k, a_t, n)
+        r(10) = get_cloudfraction(g_k, a_cf, n)
+        r(11) = get_presf_(g_k, a_presf, n)
+        r(12) = get_rhof_(g_k, a_rhof, n)
+        r(13) = get_rhobf_(g_k, a_rhobf, n)
+        if (get_profile_QR_(g_k, a_qr, n) /= 0) a_qr = 0
+        ret = 0
+        do i = 1, size(r)
+            if (r(i) /= 0) ret = r(i)
+        enddo
+    end function get_profiles_
     !!! end of vertical profile getters
 
     ! Total rain water content getter
@@ -1165,6 +1206,618 @@ contains
         ret = gatherlayer(g_i, g_j, a, n, dthldz(2:i1, 2:j1))
     end function get_field_dthldz
 
+    !!! block getter and setter functions - using offsets into the block set by set_block_range
+    ! Sets the one-based, inclusive index bounds of the block accessed by the block
+    ! getters and setters. These take one-based offsets into the block in Fortran order
+    ! instead of index arrays, so the bounds are sent to the worker only once.
+    ! For the 2D fields the vertical bounds should be 1.
+    function set_block_range(g_imin, g_imax, g_jmin, g_jmax, g_kmin, g_kmax) result(ret)
+        integer, intent(in) :: g_imin, g_imax, g_jmin, g_jmax, g_kmin, g_kmax
+        integer :: ret
+        if (g_imin < 1 .or. g_imax > itot .or. g_imin > g_imax .or. &
+            g_jmin < 1 .or. g_jmax > jtot .or. g_jmin > g_jmax .or. &
+            g_kmin < 1 .or. g_kmax > kmax .or. g_kmin > g_kmax) then
+            ret = -1
+            return
+        endif
+        block_imin = g_imin
+        block_imax = g_imax
+        block_jmin = g_jmin
+        block_jmax = g_jmax
+        block_kmin = g_kmin
+        block_kmax = g_kmax
+        ret = 0
+    end function set_block_range
+
+    ! Converts offsets into the block to global index arrays
+    subroutine blockindex(g_m, g_i, g_j, g_k, n)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        integer, allocatable, intent(out) :: g_i(:), g_j(:), g_k(:)
+        integer :: m, l, ni, nj
+
+        ni = block_imax - block_imin + 1
+        nj = block_jmax - block_jmin + 1
+        allocate(g_i(n), g_j(n), g_k(n))
+        do m = 1, n
+            l = g_m(m) - 1
+            g_i(m) = block_imin + mod(l, ni)
+            g_j(m) = block_jmin + mod(l / ni, nj)
+            g_k(m) = block_kmin + l / (ni * nj)
+        enddo
+    end subroutine blockindex
+
+    ! Eastward wind velocity volume field block getter
+    function get_block_U(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_U(g_i, g_j, g_k, a, n)
+    end function get_block_U
+
+    ! Northward wind velocity volume field block getter
+    function get_block_V(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_V(g_i, g_j, g_k, a, n)
+    end function get_block_V
+
+    ! Upward wind velocity volume field block getter
+    function get_block_W(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_W(g_i, g_j, g_k, a, n)
+    end function get_block_W
+
+    ! Liquid water potential temperature volume field block getter
+    function get_block_THL(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_THL(g_i, g_j, g_k, a, n)
+    end function get_block_THL
+
+    ! Total humidity volume field block getter
+    function get_block_QT(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_QT(g_i, g_j, g_k, a, n)
+    end function get_block_QT
+
+    ! Liquid water content volume field block getter
+    function get_block_QL(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_QL(g_i, g_j, g_k, a, n)
+    end function get_block_QL
+
+    ! Ice water content volume field block getter
+    function get_block_QL_ice(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_QL_ice(g_i, g_j, g_k, a, n)
+    end function get_block_QL_ice
+
+    ! Rain water volume field block getter
+    function get_block_QR(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_QR(g_i, g_j, g_k, a, n)
+    end function get_block_QR
+
+    ! Saturation humidity volume field block getter
+    function get_block_Qsat(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_Qsat(g_i, g_j, g_k, a, n)
+    end function get_block_Qsat
+
+    ! Turbulent kinetic energy volume field block getter
+    function get_block_E12(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_E12(g_i, g_j, g_k, a, n)
+    end function get_block_E12
+
+    ! Temperature volume field block getter
+    function get_block_T(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_T(g_i, g_j, g_k, a, n)
+    end function get_block_T
+
+    ! Modified pressure volume field block getter
+    function get_block_pi(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_pi(g_i, g_j, g_k, a, n)
+    end function get_block_pi
+
+    ! Downwelling shortwave radiative flux block getter
+    function get_block_rswd(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rswd(g_i, g_j, g_k, a, n)
+    end function get_block_rswd
+
+    ! Upwelling shortwave radiative flux block getter
+    function get_block_rswu(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rswu(g_i, g_j, g_k, a, n)
+    end function get_block_rswu
+
+    ! Downwelling direct shortwave radiative flux block getter
+    function get_block_rswdir(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rswdir(g_i, g_j, g_k, a, n)
+    end function get_block_rswdir
+
+    ! Downwelling diffuse shortwave radiative flux block getter
+    function get_block_rswdif(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rswdif(g_i, g_j, g_k, a, n)
+    end function get_block_rswdif
+
+    ! Downwelling longwave radiative flux block getter
+    function get_block_rlwd(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rlwd(g_i, g_j, g_k, a, n)
+    end function get_block_rlwd
+
+    ! Upwelling longwave radiative flux block getter
+    function get_block_rlwu(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rlwu(g_i, g_j, g_k, a, n)
+    end function get_block_rlwu
+
+    ! Clear-sky downwelling shortwave radiative flux block getter
+    function get_block_rswdcs(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rswdcs(g_i, g_j, g_k, a, n)
+    end function get_block_rswdcs
+
+    ! Clear-sky upwelling shortwave radiative flux block getter
+    function get_block_rswucs(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rswucs(g_i, g_j, g_k, a, n)
+    end function get_block_rswucs
+
+    ! Clear-sky downwelling longwave radiative flux block getter
+    function get_block_rlwdcs(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rlwdcs(g_i, g_j, g_k, a, n)
+    end function get_block_rlwdcs
+
+    ! Clear-sky upwelling longwave radiative flux block getter
+    function get_block_rlwucs(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_rlwucs(g_i, g_j, g_k, a, n)
+    end function get_block_rlwucs
+
+    ! block getter function for LWP - a 2D field, vertical integral of ql
+    function get_block_LWP(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_LWP(g_i, g_j, a, n)
+    end function get_block_LWP
+
+    ! block getter function for TWP - Total Water Path - 2D field, vertical integral of qt
+    function get_block_TWP(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_TWP(g_i, g_j, a, n)
+    end function get_block_TWP
+
+    ! block getter function for RWP - Rain water path - 2D field
+    function get_block_RWP(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_RWP(g_i, g_j, a, n)
+    end function get_block_RWP
+
+    ! Surface friction velocity field block getter
+    function get_block_ustar(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_ustar(g_i, g_j, a, n)
+    end function get_block_ustar
+
+    ! Surface momentum roughness length field block getter
+    function get_block_z0m(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_z0m(g_i, g_j, a, n)
+    end function get_block_z0m
+
+    ! Surface heat roughness length field block getter
+    function get_block_z0h(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_z0h(g_i, g_j, a, n)
+    end function get_block_z0h
+
+    ! Surface skin temperature field block getter
+    function get_block_tskin(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_tskin(g_i, g_j, a, n)
+    end function get_block_tskin
+
+    ! Surface skin moisture content field block getter
+    function get_block_qskin(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_qskin(g_i, g_j, a, n)
+    end function get_block_qskin
+
+    ! Surface latent heat flux field block getter
+    function get_block_LE(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_LE(g_i, g_j, a, n)
+    end function get_block_LE
+
+    ! Surface sensible heat flux field block getter
+    function get_block_H(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_H(g_i, g_j, a, n)
+    end function get_block_H
+
+    ! Surface Obukhov length field block getter
+    function get_block_obl(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_obl(g_i, g_j, a, n)
+    end function get_block_obl
+
+    ! Surface theta-l flux field block getter
+    function get_block_thlflux(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_thlflux(g_i, g_j, a, n)
+    end function get_block_thlflux
+
+    ! Surface moisture flux field block getter
+    function get_block_qtflux(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_qtflux(g_i, g_j, a, n)
+    end function get_block_qtflux
+
+    ! Surface eastward wind vertical gradient block getter
+    function get_block_dudz(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_dudz(g_i, g_j, a, n)
+    end function get_block_dudz
+
+    ! Surface northward wind vertical gradient block getter
+    function get_block_dvdz(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_dvdz(g_i, g_j, a, n)
+    end function get_block_dvdz
+
+    ! Surface moisture vertical gradient block getter
+    function get_block_dqtdz(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_dqtdz(g_i, g_j, a, n)
+    end function get_block_dqtdz
+
+    ! Surface liquid water temperature vertical gradient block getter
+    function get_block_dthldz(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = get_field_dthldz(g_i, g_j, a, n)
+    end function get_block_dthldz
+    !!! end of block getter functions
+
+    ! Sets the fields returned by get_block_fields, as a list of block getter field names
+    ! separated by spaces, e.g. 'U V THL QT'. The fields should be all 3D or all 2D.
+    function set_block_fields(names) result(ret)
+        character(256), intent(in) :: names
+        character(16) :: fields(max_block_fields)
+        integer :: ret, ios
+
+        fields = ''
+        read(names, *, iostat=ios) fields
+        ! a short list ends the read early, which is fine
+        if (ios > 0 .or. count(fields /= '') == 0) then
+            ret = -1
+            return
+        endif
+        nblock_fields = count(fields /= '')
+        block_fields = fields
+        ret = 0
+    end function set_block_fields
+
+    ! Block getter for the field with the given name
+    function get_block_field(name, g_m, a, n) result(ret)
+        character(*), intent(in) :: name
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret
+
+        select case (name)
+        case ('U')
+            ret = get_block_U(g_m, a, n)
+        case ('V')
+            ret = get_block_V(g_m, a, n)
+        case ('W')
+            ret = get_block_W(g_m, a, n)
+        case ('THL')
+            ret = get_block_THL(g_m, a, n)
+        case ('QT')
+            ret = get_block_QT(g_m, a, n)
+        case ('QL')
+            ret = get_block_QL(g_m, a, n)
+        case ('QL_ice')
+            ret = get_block_QL_ice(g_m, a, n)
+        case ('QR')
+            ret = get_block_QR(g_m, a, n)
+        case ('Qsat')
+            ret = get_block_Qsat(g_m, a, n)
+        case ('E12')
+            ret = get_block_E12(g_m, a, n)
+        case ('T')
+            ret = get_block_T(g_m, a, n)
+        case ('pi')
+            ret = get_block_pi(g_m, a, n)
+        case ('rswd')
+            ret = get_block_rswd(g_m, a, n)
+        case ('rswu')
+            ret = get_block_rswu(g_m, a, n)
+        case ('rswdir')
+            ret = get_block_rswdir(g_m, a, n)
+        case ('rswdif')
+            ret = get_block_rswdif(g_m, a, n)
+        case ('rlwd')
+            ret = get_block_rlwd(g_m, a, n)
+        case ('rlwu')
+            ret = get_block_rlwu(g_m, a, n)
+        case ('rswdcs')
+            ret = get_block_rswdcs(g_m, a, n)
+        case ('rswucs')
+            ret = get_block_rswucs(g_m, a, n)
+        case ('rlwdcs')
+            ret = get_block_rlwdcs(g_m, a, n)
+        case ('rlwucs')
+            ret = get_block_rlwucs(g_m, a, n)
+        case ('LWP')
+            ret = get_block_LWP(g_m, a, n)
+        case ('TWP')
+            ret = get_block_TWP(g_m, a, n)
+        case ('RWP')
+            ret = get_block_RWP(g_m, a, n)
+        case ('ustar')
+            ret = get_block_ustar(g_m, a, n)
+        case ('z0m')
+            ret = get_block_z0m(g_m, a, n)
+        case ('z0h')
+            ret = get_block_z0h(g_m, a, n)
+        case ('tskin')
+            ret = get_block_tskin(g_m, a, n)
+        case ('qskin')
+            ret = get_block_qskin(g_m, a, n)
+        case ('LE')
+            ret = get_block_LE(g_m, a, n)
+        case ('H')
+            ret = get_block_H(g_m, a, n)
+        case ('obl')
+            ret = get_block_obl(g_m, a, n)
+        case ('thlflux')
+            ret = get_block_thlflux(g_m, a, n)
+        case ('qtflux')
+            ret = get_block_qtflux(g_m, a, n)
+        case ('dudz')
+            ret = get_block_dudz(g_m, a, n)
+        case ('dvdz')
+            ret = get_block_dvdz(g_m, a, n)
+        case ('dqtdz')
+            ret = get_block_dqtdz(g_m, a, n)
+        case ('dthldz')
+            ret = get_block_dthldz(g_m, a, n)
+        case default
+            a = 0
+            ret = -1
+        end select
+    end function get_block_field
+
+    ! Returns several fields of the block in one call. The offsets run over the block
+    ! of each field set by set_block_fields one after another, i.e. offset m of the
+    ! second field is offset m + (size of the block) here.
+    function get_block_fields(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(out) :: a
+        integer :: ret, f, nb, r
+        logical, allocatable :: infield(:)
+        integer, allocatable :: g_f(:)
+        real, allocatable :: a_f(:)
+
+        nb = (block_imax - block_imin + 1) * (block_jmax - block_jmin + 1) * (block_kmax - block_kmin + 1)
+        ret = 0
+        a = 0
+        do f = 1, nblock_fields
+            infield = (g_m - 1) / nb + 1 == f
+            ! a long message is split, a part may not contain all fields
+            if (.not. any(infield)) cycle
+            g_f = pack(g_m - (f - 1) * nb, infield)
+            allocate(a_f(size(g_f)))
+            r = get_block_field(trim(block_fields(f)), g_f, a_f, size(g_f))
+            ! keep an error over the missing rain field warning of get_block_QR
+            if (r < 0 .or. ret == 0) ret = r
+            a = unpack(a_f, infield, a)
+            deallocate(a_f)
+        enddo
+    end function get_block_fields
+
     ! Surface prescribed uniform heat flux getter
     function get_wt_surf(wtflux) result(ret)
         real, intent(out) :: wtflux
@@ -1319,6 +1972,61 @@ contains
         enddo
         ret = 0
     end function set_field_QT
+
+    ! Sets the eastward wind velocity total volume field for the block
+    function set_block_U(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(in) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = set_field_U(g_i, g_j, g_k, a, n)
+    end function set_block_U
+
+    ! Sets the northward wind velocity total volume field for the block
+    function set_block_V(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(in) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = set_field_V(g_i, g_j, g_k, a, n)
+    end function set_block_V
+
+    ! Sets the vertical wind velocity total volume field for the block
+    function set_block_W(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(in) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = set_field_W(g_i, g_j, g_k, a, n)
+    end function set_block_W
+
+    ! Sets the liquid water temperature total volume field for the block
+    function set_block_THL(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(in) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = set_field_THL(g_i, g_j, g_k, a, n)
+    end function set_block_THL
+
+    ! Sets the total humidity total volume field for the block
+    function set_block_QT(g_m, a, n) result(ret)
+        integer, intent(in) :: n
+        integer, dimension(n), intent(in) :: g_m
+        real, dimension(n), intent(in) :: a
+        integer :: ret
+        integer, allocatable :: g_i(:), g_j(:), g_k(:)
+        call blockindex(g_m, g_i, g_j, g_k, n)
+        ret = set_field_QT(g_i, g_j, g_k, a, n)
+    end function set_block_QT
     !!! end of setter functions for 3D fields
 
     !!! get simulation parameters
@@ -2,6 +2,7 @@ from __future__ import print_function
 
 import os.path
 import shutil
+from collections import namedtuple
 
 import numpy
 from amuse import datamodel
@@ -172,6 +173,16 @@ class DalesInterface(CodeInterface,
     def get_rhobf_(k=0):
         returns(out=0. | units.kg / units.m ** 3)
 
+    # getter for all profiles of the profiles grid in one call, in the order of profile_names
+    # the outputs are ordered by their position in the source, so no name may end with another one
+    @remote_function(must_handle_array=True)
+    def get_profiles_(k=0):
+        returns(a_u=0. | units.m / units.s, a_v=0. | units.m / units.s, a_w=0. | units.m / units.s,
+                a_thl=0. | units.K, a_qt=0. | units.mfu, a_ql=0. | units.mfu, a_ql_ice=0. | units.mfu,
+                a_qr=0. | units.mfu, a_e12=0. | units.m / units.s, a_t=0. | units.K,
+                a_cf=0. | units.m ** 2 / units.m ** 2, a_presf=0. | units.Pa, a_rhof=0. | units.kg / units.m ** 3,
+                a_rhobf=0. | units.kg / units.m ** 3)
+
     # setter functions for vertical tendencies / forcings
     @remote_function(must_handle_array=True)
     def set_tendency_U(a=0. | units.m / units.s ** 2):
@@ -477,6 +488,198 @@ class DalesInterface(CodeInterface,
     def set_field_QT(g_i=0, g_j=0, g_k=0, a=0. | units.mfu):
         returns()
 
+    # block getter functions for 3D and 2D fields, using offsets into the block set by set_block_range
+    @remote_function
+    def set_block_range(g_imin=1, g_imax=1, g_jmin=1, g_jmax=1, g_kmin=1, g_kmax=1):
+        returns()
+
+    @remote_function(must_handle_array=True)
+    def get_block_U(g_m=0):
+        returns(a=0. | units.m / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_V(g_m=0):
+        returns(a=0. | units.m / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_W(g_m=0):
+        returns(a=0. | units.m / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_THL(g_m=0):
+        returns(a=0. | units.K)
+
+    @remote_function(must_handle_array=True)
+    def get_block_QT(g_m=0):
+        returns(a=0. | units.mfu)
+
+    @remote_function(must_handle_array=True)
+    def get_block_QL(g_m=0):
+        returns(a=0. | units.mfu)
+
+    @remote_function(must_handle_array=True)
+    def get_block_QL_ice(g_m=0):
+        returns(a=0. | units.mfu)
+
+    @remote_function(must_handle_array=True)
+    def get_block_QR(g_m=0):
+        returns(a=0. | units.mfu)
+
+    @remote_function(must_handle_array=True)
+    def get_block_Qsat(g_m=0):
+        returns(a=0. | units.mfu)
+
+    @remote_function(must_handle_array=True)
+    def get_block_E12(g_m=0):
+        returns(a=0. | units.m / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_T(g_m=0):
+        returns(a=0. | units.K)
+
+    @remote_function(must_handle_array=True)
+    def get_block_pi(g_m=0):
+        returns(a=0. | units.m ** 2 / units.s ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rswd(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rswdir(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rswdif(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rswu(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rlwd(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rlwu(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rswdcs(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rswucs(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rlwdcs(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_rlwucs(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_LWP(g_m=0):
+        returns(a=0. | units.kg / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_RWP(g_m=0):
+        returns(a=0. | units.kg / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_TWP(g_m=0):
+        returns(a=0. | units.kg / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_ustar(g_m=0):
+        returns(a=0. | units.m / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_z0m(g_m=0):
+        returns(a=0. | units.m)
+
+    @remote_function(must_handle_array=True)
+    def get_block_z0h(g_m=0):
+        returns(a=0. | units.m)
+
+    @remote_function(must_handle_array=True)
+    def get_block_tskin(g_m=0):
+        returns(a=0. | units.K)
+
+    @remote_function(must_handle_array=True)
+    def get_block_qskin(g_m=0):
+        returns(a=0. | units.mfu)
+
+    @remote_function(must_handle_array=True)
+    def get_block_LE(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_H(g_m=0):
+        returns(a=0. | units.W / units.m ** 2)
+
+    @remote_function(must_handle_array=True)
+    def get_block_obl(g_m=0):
+        returns(a=0. | units.m)
+
+    @remote_function(must_handle_array=True)
+    def get_block_thlflux(g_m=0):
+        returns(a=0. | units.K * units.m / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_qtflux(g_m=0):
+        returns(a=0. | units.mfu * units.m / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_dudz(g_m=0):
+        returns(a=0. | 1. / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_dvdz(g_m=0):
+        returns(a=0. | 1. / units.s)
+
+    @remote_function(must_handle_array=True)
+    def get_block_dqtdz(g_m=0):
+        returns(a=0. | units.mfu / units.m)
+
+    @remote_function(must_handle_array=True)
+    def get_block_dthldz(g_m=0):
+        returns(a=0. | units.K / units.m)
+
+    # getter for several fields of the block in one call, the offsets run over the fields set by set_block_fields
+    # one after another. The values are returned without units, as the fields have different units.
+    @remote_function
+    def set_block_fields(names="U"):
+        returns()
+
+    @remote_function(must_handle_array=True)
+    def get_block_fields(g_m=0):
+        returns(a=0.)
+
+    # setter functions for 3D fields using offsets into the block set by set_block_range
+    @remote_function(must_handle_array=True)
+    def set_block_U(g_m=0, a=0. | units.m / units.s):
+        returns()
+
+    @remote_function(must_handle_array=True)
+    def set_block_V(g_m=0, a=0. | units.m / units.s):
+        returns()
+
+    @remote_function(must_handle_array=True)
+    def set_block_W(g_m=0, a=0. | units.m / units.s):
+        returns()
+
+    @remote_function(must_handle_array=True)
+    def set_block_THL(g_m=0, a=0. | units.K):
+        returns()
+
+    @remote_function(must_handle_array=True)
+    def set_block_QT(g_m=0, a=0. | units.mfu):
+        returns()
+
     #    @remote_function(must_handle_array=True)
     #    def set_field_E12(g_i=0,g_j=0,g_k=0,a=0.):
     #        returns()
@@ -535,6 +738,190 @@ class DalesInterface(CodeInterface,
         returns()
 
 
+def block_range(indices):
+    """Bounds of the block covered by index arrays
+
+    Parameters
+    ----------
+    indices : list of integer arrays
+        Flattened one-based index arrays, one per axis.
+
+    Returns
+    -------
+    tuple or None
+        The one-based, inclusive bounds (imin, imax, jmin, jmax, ...) and the shape of the block,
+        if the index arrays enumerate a contiguous block in C order, None otherwise.
+    """
+    indices = [numpy.asarray(x) for x in indices]
+    if len(indices) == 0 or any(x.ndim != 1 or x.size != indices[0].size for x in indices) or indices[0].size == 0:
+        return None
+    lower = [int(x.min()) for x in indices]
+    shape = tuple(int(x.max()) - l + 1 for x, l in zip(indices, lower))
+    if numpy.prod(shape) != indices[0].size:
+        return None
+    for axis, (x, l) in enumerate(zip(indices, lower)):
+        expected = numpy.arange(l, l + shape[axis]).reshape([-1 if d == axis else 1 for d in range(len(shape))])
+        if not numpy.array_equal(x.reshape(shape), numpy.broadcast_to(expected, shape)):
+            return None
+    bounds = []
+    for l, n in zip(lower, shape):
+        bounds.extend([l, l + n - 1])
+    return bounds, shape
+
+
+class BlockFieldMethod(object):
+    """Getter or setter of a field for the fields and surface_fields grids
+
+    Index arrays that enumerate a contiguous block, as the grids pass them for slices, are transferred with
+    set_block_range and the block function of the worker, so only offsets into the block are sent instead of
+    the index arrays. Other and small index arrays are passed to the index array function.
+    Supports asynchronous calls like the worker functions.
+    """
+
+    min_block_size = 4096
+
+    def __init__(self, code, field, setter=False):
+        self.code = code
+        prefix = "set_" if setter else "get_"
+        self.setter = setter
+        self.field_function = prefix + "field_" + field
+        self.block_function = prefix + "block_" + field
+
+    def __call__(self, *arguments, **kwargs):
+        return self._call(False, arguments, kwargs)
+
+    def asynchronous(self, *arguments, **kwargs):
+        return self._call(True, arguments, kwargs)
+
+    def _call(self, asynchronous, arguments, kwargs):
+        def call(name, *args):
+            if asynchronous:
+                return getattr(self.code, name).asynchronous(*args, **kwargs)
+            return getattr(self.code, name)(*args, **kwargs)
+
+        indices = arguments[:-1] if self.setter else arguments
+        block = None
+        if numpy.size(indices[0]) >= self.min_block_size:
+            block = block_range(indices)
+        if block is None or (self.setter and numpy.shape(arguments[-1]) != (numpy.size(indices[0]),)):
+            return call(self.field_function, *arguments)
+
+        # 2D fields have a single vertical level
+        bounds, shape = block
+        range_request = call("set_block_range", *(bounds + [1, 1])[:6])
+        offsets = numpy.arange(1, numpy.prod(shape) + 1, dtype=numpy.int32)
+        if self.setter:
+            values = arguments[-1].reshape(shape).transpose().flatten()
+            result = call(self.block_function, offsets, values)
+            if asynchronous:
+                result.add_result_handler(check_results, ([range_request],))
+            return result
+
+        result = call(self.block_function, offsets)
+        if asynchronous:
+            result.add_result_handler(check_results, ([range_request],))
+            result.add_result_handler(lambda function: from_fortran_order(function(), shape).flatten())
+            return result
+        return from_fortran_order(result, shape).flatten()
+
+
+class BlockFieldsMethod(object):
+    """Getter of several fields at once for the fields and surface_fields grids
+
+    For index arrays that enumerate a contiguous block, the values of all fields are returned by get_block_fields
+    in a single message. Other index arrays are passed to the getters of the fields one by one.
+    Supports asynchronous calls like the worker functions.
+    """
+
+    def __init__(self, code, fields):
+        self.code = code
+        self.fields = fields
+        self.units = [block_field_unit(x) for x in fields]
+
+    def __call__(self, *arguments, **kwargs):
+        return self._call(False, arguments, kwargs)
+
+    def asynchronous(self, *arguments, **kwargs):
+        return self._call(True, arguments, kwargs)
+
+    def _call(self, asynchronous, arguments, kwargs):
+        def call(name, *args):
+            if asynchronous:
+                return getattr(self.code, name).asynchronous(*args, **kwargs)
+            return getattr(self.code, name)(*args, **kwargs)
+
+        block = block_range(arguments)
+        if block is None:
+            methods = [BlockFieldMethod(self.code, x) for x in self.fields]
+            if not asynchronous:
+                return tuple(method(*arguments, **kwargs) for method in methods)
+            # the requests are handled in order, collect the values with the last one
+            requests = [method.asynchronous(*arguments, **kwargs) for method in methods]
+            requests[-1].add_result_handler(
+                lambda function: tuple(r.result() for r in requests[:-1]) + (function(),))
+            return requests[-1]
+
+        bounds, shape = block
+        requests = [call("set_block_range", *(bounds + [1, 1])[:6]),
+                    call("set_block_fields", " ".join(self.fields))]
+        size = numpy.prod(shape)
+        result = call("get_block_fields", numpy.arange(1, len(self.fields) * size + 1, dtype=numpy.int32))
+
+        def split(values):
+            return tuple(from_fortran_order(values[i * size:(i + 1) * size], shape).flatten() | unit
+                         for i, unit in enumerate(self.units))
+
+        if asynchronous:
+            result.add_result_handler(check_results, (requests,))
+            result.add_result_handler(lambda function: split(function()))
+            return result
+        return split(result)
+
+
+def check_results(result, requests):
+    """Result handler of the last of a series of asynchronous requests to one worker
+
+    The requests are handled in order, so the earlier ones are done when the last one is. Their results are
+    retrieved first, so that their errors are not lost.
+    """
+    for request in requests:
+        request.result()
+    return result()
+
+
+def from_fortran_order(values, shape):
+    """Reshape values of a block in Fortran order to an array of the given shape"""
+    return values.reshape(shape[::-1]).transpose()
+
+
+def block_field_unit(field):
+    """Unit of a field, as returned by its block getter"""
+    return getattr(DalesInterface, "get_block_" + field).specification.output_parameters[0].unit
+
+
+class GridGeometry(namedtuple("GridGeometry", ["itot", "jtot", "ktot", "xsize", "ysize", "zf", "zh"])):
+    """Geometry of the Dales grid: the numbers of grid cells, the domain extent and the full and half level heights"""
+
+    __slots__ = ()
+
+    @property
+    def dx(self):
+        return self.xsize / self.itot
+
+    @property
+    def dy(self):
+        return self.ysize / self.jtot
+
+    @property
+    def levels(self):
+        """One-based indices of the full levels"""
+        return numpy.arange(1, self.ktot + 1)
+
+
+# attributes of the profiles grid, in the order returned by get_profiles_
+profile_names = ["U", "V", "W", "THL", "QT", "QL", "QL_ice", "QR", "E12", "T", "A", "P", "rho", "rhob"]
+
+
 class Dales(CommonCode, CodeWithNamelistParameters):
     """OMUSE Dales Interface.
 
@@ -868,12 +1255,43 @@ class Dales(CommonCode, CodeWithNamelistParameters):
 
         #  cache grid parameters after committing the grid
         self.params_grid_cache =  self.overridden().get_params_grid()
+        self.grid_geometry_cache = None
+
+    def commit_grid(self):
+        self.overridden().commit_grid()
+        # the vertical grid is read again on first use
+        self.grid_geometry_cache = None
 
     def get_params_grid(self):
         if not hasattr(self, 'params_grid_cache'):
             # if the cache is not there, create it
             self.params_grid_cache =  self.overridden().get_params_grid()
         return self.params_grid_cache
+
+    def get_grid_geometry(self):
+        """Dales grid geometry
+
+        Read from the worker on first use after committing the grid, and served locally afterwards.
+
+        Returns
+        -------
+        GridGeometry
+            Grid sizes, domain extent and the heights of the full and half levels
+        """
+        if getattr(self, 'grid_geometry_cache', None) is None:
+            itot, jtot, ktot, xsize, ysize = self.get_params_grid()
+            self.grid_geometry_cache = GridGeometry(itot, jtot, ktot, xsize, ysize,
+                                                    self.get_zf_(numpy.arange(1, ktot + 1)),
+                                                    self.get_zh_(numpy.arange(1, ktot + 2)))
+        return self.grid_geometry_cache
+
+    @staticmethod
+    def _select_levels(heights, k):
+        # the level indices are 1-based, as in the worker, and must not wrap around
+        k = numpy.asarray(k)
+        if numpy.any(k < 1) or numpy.any(k > len(heights)):
+            raise Exception("vertical index out of range 1..%d: %s" % (len(heights), k))
+        return heights[k - 1]
     
     def define_parameters(self, obj):
         CodeWithNamelistParameters.define_parameters(self, obj)
@@ -1000,12 +1418,22 @@ class Dales(CommonCode, CodeWithNamelistParameters):
             obj.add_method(state, 'get_rhobf_')
             obj.add_method(state, 'get_surface_pressure')
             obj.add_method(state, 'get_cloudfraction')
+            obj.add_method(state, 'get_profiles_')
             obj.add_method(state, 'get_rain')
             for x in ['U', 'V', 'W', 'THL', 'QT', 'QL', 'QR', 'E12', 'T', 'pi', 'rswd', 'rswdir', 'rswdif', 'rswu',
                       'rlwd', 'rlwu', 'rswdcs', 'rswucs', 'rlwdcs', 'rlwucs']:
                 obj.add_method(state, 'get_field_' + x)
             for x in ['U', 'V', 'W', 'THL', 'QT']:
                 obj.add_method(state, 'set_field_' + x)
+                obj.add_method(state, 'set_block_' + x)
+            obj.add_method(state, 'set_block_range')
+            obj.add_method(state, 'set_block_fields')
+            obj.add_method(state, 'get_block_fields')
+            for x in ['U', 'V', 'W', 'THL', 'QT', 'QL', 'QL_ice', 'QR', 'Qsat', 'E12', 'T', 'pi', 'rswd', 'rswdir',
+                      'rswdif', 'rswu', 'rlwd', 'rlwu', 'rswdcs', 'rswucs', 'rlwdcs', 'rlwucs', 'LWP', 'RWP', 'TWP',
+                      'ustar', 'z0m', 'z0h', 'tskin', 'qskin', 'LE', 'H', 'obl', 'thlflux', 'qtflux', 'dudz', 'dvdz',
+                      'dqtdz', 'dthldz']:
+                obj.add_method(state, 'get_block_' + x)
             for x in ['U', 'V', 'W', 'THL', 'QT', 'QL', 'QL_ice', 'QR', 'E12', 'T']:
                 obj.add_method(state, 'get_profile_' + x)
             for x in ['U', 'V', 'THL', 'QT']:
@@ -1041,11 +1469,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Eastward vertical wind profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_U_(indices, **kwargs)
 
     def get_profile_V(self, k=None, **kwargs):
@@ -1063,11 +1487,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
          numpy.array
             Northward vertical wind profile
          """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_V_(indices, **kwargs)
 
     def get_profile_W(self, k=None, **kwargs):
@@ -1085,12 +1505,8 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Upward vertical wind profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1, **kwargs)
-        else:
-            indices = k
-        return self.get_profile_W_(indices)
+        indices = self.get_grid_geometry().levels if k is None else k
+        return self.get_profile_W_(indices, **kwargs)
 
     def get_profile_THL(self, k=None, **kwargs):
         """Dales liquid water virtual temperature profile retrieval method
@@ -1107,11 +1523,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Liquid water virtual temperature vertical profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_THL_(indices, **kwargs)
 
     def get_profile_QT(self, k=None, **kwargs):
@@ -1129,11 +1541,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Total humidity vertical profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_QT_(indices, **kwargs)
 
     def get_profile_QL(self, k=None, **kwargs):
@@ -1151,11 +1559,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Liquid water content vertical profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_QL_(indices, **kwargs)
 
     def get_profile_QL_ice(self, k=None, **kwargs):
@@ -1173,11 +1577,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Ice water content vertical profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_QL_ice_(indices, **kwargs)
 
     def get_profile_QR(self, k=None, **kwargs):
@@ -1195,11 +1595,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Rain water content vertical profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_QR_(indices, **kwargs)
 
     def get_profile_E12(self, k=None, **kwargs):
@@ -1217,11 +1613,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Turbulence kinetic energy vertical profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_E12_(indices, **kwargs)
 
     def get_profile_T(self, k=None, **kwargs):
@@ -1239,11 +1631,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Temperature vertical profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_profile_T_(indices, **kwargs)
 
     def get_zf(self, k=None, **kwargs):
@@ -1261,12 +1649,10 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Full level heights
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
-        return self.get_zf_(indices, **kwargs)
+        indices = self.get_grid_geometry().levels if k is None else k
+        if kwargs:
+            return self.get_zf_(indices, **kwargs)
+        return Dales._select_levels(self.get_grid_geometry().zf, indices)
 
     def get_zh(self, k=None, **kwargs):
         """Dales half level heights retrieval method
@@ -1283,12 +1669,11 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Half level heights
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 2)
-        else:
-            indices = k
-        return self.get_zh_(indices, **kwargs)
+        # there is one more half level than full levels
+        indices = numpy.arange(1, self.get_grid_geometry().ktot + 2) if k is None else k
+        if kwargs:
+            return self.get_zh_(indices, **kwargs)
+        return Dales._select_levels(self.get_grid_geometry().zh, indices)
 
     def get_presf(self, k=None, **kwargs):
         """Dales full level mean pressure retrieval method
@@ -1305,11 +1690,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Full level mean pressure profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_presf_(indices, **kwargs)
 
     def get_presh(self, k=None, **kwargs):
@@ -1327,11 +1708,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Half level mean pressure profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_presh_(indices, **kwargs)
 
     def get_rhof(self, k=None, **kwargs):
@@ -1349,11 +1726,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Full level mean density profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_rhof_(indices, **kwargs)
 
     def get_rhobf(self, k=None, **kwargs):
@@ -1371,11 +1744,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         numpy.array
             Full level density base profile
         """
-        if k is None:
-            kmin, kmax = self.get_z_grid_range()
-            indices = numpy.arange(kmin, kmax + 1)
-        else:
-            indices = k
+        indices = self.get_grid_geometry().levels if k is None else k
         return self.get_rhobf_(indices, **kwargs)
 
     def get_field(self, field, imin=1, imax=None, jmin=1, jmax=None, kmin=1, kmax=None, **kwargs):
@@ -1406,6 +1775,59 @@ class Dales(CommonCode, CodeWithNamelistParameters):
             3D block containing variable values
         """
 
+        if field in ('LWP', 'RWP', 'TWP'):  # 2D field, k ignored
+            shape = self.set_field_block(True, imin, imax, jmin, jmax, kmin, kmax)
+        elif field in ('U', 'V', 'W', 'THL', 'QT', 'QL', 'Qsat', 'E12', 'T'):  # 3D field
+            shape = self.set_field_block(False, imin, imax, jmin, jmax, kmin, kmax)
+        else:
+            raise Exception('get_field called with undefined variable name %s' % field)
+
+        offsets = numpy.arange(1, numpy.prod(shape) + 1, dtype=numpy.int32)
+        field = getattr(self, 'get_block_' + field)(offsets, **kwargs)
+        return from_fortran_order(field, shape)
+
+    def get_fields(self, fields, imin=1, imax=None, jmin=1, jmax=None, kmin=1, kmax=None, **kwargs):
+        """Dales batched volume field retrieval method
+
+        Parameters
+        ----------
+        fields : list of str
+                Variable shortnames, as for get_field. Either all 2D (LWP, RWP, TWP) or all 3D fields.
+        imin : integer, optional
+               Lower one-based x-bound of data block
+        imax : integer, optional
+               Upper one-based x-bound of data block
+        jmin : integer, optional
+               Lower one-based y-bound of data block
+        jmax : integer, optional
+               Upper one-based y-bound of data block
+        kmin : integer, optional
+               Lower one-based z-bound of data block
+        kmax : integer, optional
+               Upper one-based z-bound of data block
+
+        Returns
+        -------
+        dict
+            Blocks containing the variable values by variable shortname, retrieved from the worker in one call
+        """
+        if all(field in ('LWP', 'RWP', 'TWP') for field in fields):
+            shape = self.set_field_block(True, imin, imax, jmin, jmax, kmin, kmax)
+        elif all(field in ('U', 'V', 'W', 'THL', 'QT', 'QL', 'Qsat', 'E12', 'T') for field in fields):
+            shape = self.set_field_block(False, imin, imax, jmin, jmax, kmin, kmax)
+        else:
+            raise Exception('get_fields called with undefined or mixed 2D and 3D variable names %s' % fields)
+
+        # the worker returns the blocks of the fields one after another
+        self.set_block_fields(" ".join(fields))
+        size = numpy.prod(shape)
+        values = self.get_block_fields(numpy.arange(1, len(fields) * size + 1, dtype=numpy.int32), **kwargs)
+        return dict((field, from_fortran_order(values[i * size:(i + 1) * size], shape) | block_field_unit(field))
+                    for i, field in enumerate(fields))
+
+    # sends the bounds of a block to the worker for the block getters, returns the shape of the block
+    # the upper bounds are exclusive here, the grid range is used for the ones that are None
+    def set_field_block(self, surface, imin, imax, jmin, jmax, kmin, kmax):
         grid_range = ()
         if imax is None or jmax is None or kmax is None:
             grid_range = self.get_grid_range()
@@ -1416,48 +1838,15 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         if kmax is None:
             kmax = grid_range[5] + 1
 
-        # build index arrays
-        if field in ('LWP', 'RWP', 'TWP'):  # 2D field
-            points = numpy.mgrid[imin:imax, jmin:jmax]
-            points = points.reshape(2, -1)
-            i, j = points
-            k = 0
-        else:  # 3D field
-            points = numpy.mgrid[imin:imax, jmin:jmax, kmin:kmax]
-            points = points.reshape(3, -1)
-            i, j, k = points
-
-        if field == 'U':
-            field = self.get_field_U(i, j, k, **kwargs)
-        elif field == 'V':
-            field = self.get_field_V(i, j, k, **kwargs)
-        elif field == 'W':
-            field = self.get_field_W(i, j, k, **kwargs)
-        elif field == 'THL':
-            field = self.get_field_THL(i, j, k, **kwargs)
-        elif field == 'QT':
-            field = self.get_field_QT(i, j, k, **kwargs)
-        elif field == 'QL':
-            field = self.get_field_QL(i, j, k, **kwargs)
-        elif field == 'Qsat':
-            field = self.get_field_Qsat(i, j, k, **kwargs)
-        elif field == 'E12':
-            field = self.get_field_E12(i, j, k, **kwargs)
-        elif field == 'T':
-            field = self.get_field_T(i, j, k, **kwargs)
-        elif field == 'LWP':  # LWP - 2D field, k ignored
-            field = self.get_field_LWP(i, j, **kwargs)
-            return field.reshape((imax - imin, jmax - jmin))  # separate return here, to reshape to 2D
-        elif field == 'RWP':  # RWP - 2D field, k ignored
-            field = self.get_field_RWP(i, j, **kwargs)
-            return field.reshape((imax - imin, jmax - jmin))  # separate return here, to reshape to 2D
-        elif field == 'TWP':  # TWP - 2D field, k ignored
-            field = self.get_field_TWP(i, j, **kwargs)
-            return field.reshape((imax - imin, jmax - jmin))  # separate return here, to reshape to 2D
+        if surface:  # 2D field, k ignored
+            shape = (imax - imin, jmax - jmin)
+            kmin, kmax = 1, 2
         else:
-            raise Exception('get_field called with undefined variable name %s' % field)
+            shape = (imax - imin, jmax - jmin, kmax - kmin)
 
-        return field.reshape((imax - imin, jmax - jmin, kmax - kmin))
+        # send the bounds of the block once, the worker returns the values in Fortran order
+        self.set_block_range(imin, imax - 1, jmin, jmax - 1, kmin, kmax - 1)
+        return shape
 
     # set a 3D field
     # indices are one-based, for zero-based index access use the grids
@@ -1481,33 +1870,22 @@ class Dales(CommonCode, CodeWithNamelistParameters):
                 Execute function asynchronously, return request object
         """
 
-        # set max indices from the size of a 
+        if field not in ('U', 'V', 'W', 'THL', 'QT'):
+            raise Exception('set_field called with undefined variable name %s' % field)
+
+        # set max indices from the size of a, a single value is set at imin, jmin, kmin
         try:
             imax = imin + a.shape[0]
             jmax = jmin + a.shape[1]
             kmax = kmin + a.shape[2]
-            i, j, k = numpy.mgrid[imin:imax, jmin:jmax, kmin:kmax]
-            i = i.flatten()
-            j = j.flatten()
-            k = k.flatten()
-            a = a.flatten()
         except:
-            i = imin
-            j = jmin
-            k = kmin
+            getattr(self, 'set_field_' + field)(imin, jmin, kmin, a, **kwargs)
+            return
 
-        if field == 'U':
-            self.set_field_U(i, j, k, a, **kwargs)
-        elif field == 'V':
-            self.set_field_V(i, j, k, a, **kwargs)
-        elif field == 'W':
-            self.set_field_W(i, j, k, a, **kwargs)
-        elif field == 'THL':
-            self.set_field_THL(i, j, k, a, **kwargs)
-        elif field == 'QT':
-            self.set_field_QT(i, j, k, a, **kwargs)
-        else:
-            raise Exception('set_field called with undefined variable name %s' % field)
+        # send the bounds of the block once and the values in Fortran order
+        self.set_block_range(imin, imax - 1, jmin, jmax - 1, kmin, kmax - 1)
+        offsets = numpy.arange(1, numpy.prod(a.shape) + 1, dtype=numpy.int32)
+        getattr(self, 'set_block_' + field)(offsets, a.transpose().flatten(), **kwargs)
 
     # get_profile - wrapper function consistent with get_field
     def get_profile(self, field, **kwargs):
@@ -1526,8 +1904,7 @@ class Dales(CommonCode, CodeWithNamelistParameters):
             1D array containing mean vertical profile values
         """
         profile = None
-        kmin, kmax = self.get_z_grid_range()
-        indices = numpy.arange(kmin, kmax + 1)
+        indices = self.get_grid_geometry().levels
         if field == 'U':
             profile = self.get_profile_U_(indices, **kwargs)
         elif field == 'V':
@@ -1548,6 +1925,32 @@ class Dales(CommonCode, CodeWithNamelistParameters):
             raise Exception('get_profile called with undefined field %s' % field)
         return profile
 
+    def get_profiles(self, fields=None, k=None, **kwargs):
+        """Dales batched profile retrieval method
+
+        Parameters
+        ----------
+        fields : list of str, optional
+                Variable shortnames of the profiles grid: U, V, W, THL, QT, QL, QL_ice, QR, E12, T,
+                A (cloud fraction), P (pressure), rho (density) or rhob (base density). All by default.
+        k : integer array, optional
+            Restrict profiles to this set of vertical indices.
+
+        Returns
+        -------
+        dict
+            1D arrays containing mean vertical profile values by variable shortname, retrieved from the worker in
+            one call
+        """
+        if fields is None:
+            fields = profile_names
+        for field in fields:
+            if field not in profile_names:
+                raise Exception('get_profiles called with undefined field %s' % field)
+        indices = self.get_grid_geometry().levels if k is None else k
+        profiles = self.get_profiles_(indices, **kwargs)
+        return dict((name, profile) for name, profile in zip(profile_names, profiles) if name in fields)
+
     def get_itot(self):
         """Dales number of grid cells in x-direction
 
@@ -1625,24 +2028,23 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         return 1, itot, 1, jtot, 1, ktot
 
     def get_grid_position(self, i, j, k):
-        itot, jtot, ktot, x, y = self.get_params_grid()
-        return i * x / itot, j * y / jtot, self.get_zf(k)
+        x, y = self.get_xy_grid_position(i, j)
+        return x, y, self.get_z_grid_position(k)
 
     def get_xy_grid_range(self):
         imin, imax, jmin, jmax, kmin, kmax = self.get_grid_range()
         return imin, imax, jmin, jmax
 
     def get_xy_grid_position(self, i, j):
-        x, y, z = self.get_grid_position(i, j, 0)
-        return x, y
+        itot, jtot, ktot, x, y = self.get_params_grid()
+        return i * x / itot, j * y / jtot
 
     def get_z_grid_range(self):
         imin, imax, jmin, jmax, kmin, kmax = self.get_grid_range()
         return kmin, kmax
 
     def get_z_grid_position(self, k):
-        x, y, z = self.get_grid_position(0, 0, k)
-        return z
+        return Dales._select_levels(self.get_grid_geometry().zf, k)
 
     def get_scalar_grid_range(self):
         return ()
@@ -1656,20 +2058,25 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         obj.add_getter("fields", "get_grid_position", names="xyz")
         for x in ["U", "V", "W", "THL", "QT", "QL", "QL_ice", "QR", "E12", "T", "pi", "rswd", "rswdir", "rswdif",
                   "rswu", "rlwd", "rlwu", "rswdcs", "rswucs", "rlwdcs", "rlwucs"]:
-            obj.add_getter("fields", "get_field_" + x, names=[x])
+            setattr(self, "get_grid_field_" + x, BlockFieldMethod(self, x))
+            obj.add_getter("fields", "get_grid_field_" + x, names=[x])
         for x in ["U", "V", "W", "THL", "QT"]:
-            obj.add_setter("fields", "set_field_" + x, names=[x])
+            setattr(self, "set_grid_field_" + x, BlockFieldMethod(self, x, setter=True))
+            obj.add_setter("fields", "set_grid_field_" + x, names=[x])
+        # getters of several fields in one message, used when all of their attributes are read together
+        for name, fields in [("state", ["U", "V", "W", "THL", "QT"]),
+                             ("all", ["U", "V", "W", "THL", "QT", "QL", "QL_ice", "QR", "E12", "T", "pi", "rswd",
+                                      "rswdir", "rswdif", "rswu", "rlwd", "rlwu", "rswdcs", "rswucs", "rlwdcs",
+                                      "rlwucs"])]:
+            setattr(self, "get_grid_fields_" + name, BlockFieldsMethod(self, fields))
+            obj.add_getter("fields", "get_grid_fields_" + name, names=fields)
 
         obj.define_grid("profiles", axes_names="z", grid_class=datamodel.RectilinearGrid,
                         state_guard="before_new_set_instance")
         obj.set_grid_range("profiles", "get_z_grid_range")
         obj.add_getter("profiles", "get_z_grid_position", names=["z"])
-        obj.add_getter("profiles", "get_presf_", names=["P"])
-        obj.add_getter("profiles", "get_rhof_", names=["rho"])
-        obj.add_getter("profiles", "get_rhobf_", names=["rhob"])
-        obj.add_getter("profiles", "get_cloudfraction", names=["A"])
-        for x in ["U", "V", "W", "THL", "QT", "QL", "QL_ice", "QR", "E12", "T"]:
-            obj.add_getter("profiles", "get_profile_" + x + "_", names=[x])
+        # the profiles are cheap to compute, so any profile attributes are read in one message
+        obj.add_getter("profiles", "get_profiles_", names=profile_names)
 
         # nudge grid  -experimental-
         obj.define_grid("nudging_profiles", axes_names="z", grid_class=datamodel.RectilinearGrid,
@@ -1699,7 +2106,15 @@ class Dales(CommonCode, CodeWithNamelistParameters):
         obj.define_grid("surface_fields", grid_class=datamodel.RectilinearGrid, state_guard="before_new_set_instance")
         obj.set_grid_range("surface_fields", "get_xy_grid_range")
         obj.add_getter("surface_fields", "get_xy_grid_position", names="xy")
+        for name in ["LWP", "RWP", "TWP", "ustar", "z0m", "z0h", "tskin", "qskin", "LE", "H", "obl", "qtflux",
+                     "thlflux"]:
+            setattr(self, "get_grid_field_" + name, BlockFieldMethod(self, name))
         for name in ["LWP", "RWP", "TWP", "ustar", "z0m", "z0h", "tskin", "qskin", "LE", "H", "obl"]:
-            obj.add_getter("surface_fields", "get_field_" + name, names=[name])
-        obj.add_getter("surface_fields", "get_field_qtflux", names=["wq"])
-        obj.add_getter("surface_fields", "get_field_thlflux", names=["wt"])
+            obj.add_getter("surface_fields", "get_grid_field_" + name, names=[name])
+        obj.add_getter("surface_fields", "get_grid_field_qtflux", names=["wq"])
+        obj.add_getter("surface_fields", "get_grid_field_thlflux", names=["wt"])
+        self.get_grid_fields_surface = BlockFieldsMethod(self, ["LWP", "RWP", "TWP", "ustar", "z0m", "z0h", "tskin",
+                                                                "qskin", "LE", "H", "obl", "qtflux", "thlflux"])
+        obj.add_getter("surface_fields", "get_grid_fields_surface",
+                       names=["LWP", "RWP", "TWP", "ustar", "z0m", "z0h", "tskin", "qskin", "LE", "H", "obl", "wq",
+                              "wt"])
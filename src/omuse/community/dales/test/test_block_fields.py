@@ -0,0 +1,149 @@
+# relative import hack
+# https://stackoverflow.com/questions/16981921/relative-imports-in-python-3
+import os, sys; sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import numpy
+from amuse.rfi.core import PythonCodeInterface
+from amuse.support.interface import InCodeComponentImplementation
+from amuse.test.amusetest import TestWithMPI
+from omuse.community.dales.interface import BlockFieldMethod, BlockFieldsMethod, DalesInterface
+from omuse.units import units
+
+# the mock workers are python processes on this machine
+kwargs = dict(channel_type="sockets", initialize_mpi=False)
+
+
+# Mock of the Dales worker with the index array and block functions of the U field, and the block
+# functions of several fields at once for the U and V fields. A block range outside the grid and an
+# unknown field are errors that leave the previous range and fields in place.
+class MockDalesImplementation(object):
+
+    def __init__(self):
+        self.shape = (8, 6, 4)
+        self.U = numpy.arange(numpy.prod(self.shape), dtype=float).reshape(self.shape)
+        self.block = tuple(slice(0, n) for n in self.shape)
+        self.fields = ["U"]
+
+    def set_block_range(self, g_imin, g_imax, g_jmin, g_jmax, g_kmin, g_kmax):
+        bounds = [(g_imin, g_imax), (g_jmin, g_jmax), (g_kmin, g_kmax)]
+        if any(l < 1 or h > n or l > h for (l, h), n in zip(bounds, self.shape)):
+            return -1
+        self.block = tuple(slice(l - 1, h) for l, h in bounds)
+        return 0
+
+    def block_index(self, g_m):
+        # the offsets run through the block in Fortran order
+        shape = self.U[self.block].shape
+        return tuple(index + s.start for index, s in
+                     zip(numpy.unravel_index(numpy.asarray(g_m) - 1, shape, order='F'), self.block))
+
+    def get_block_U(self, g_m, a, N):
+        a.value = self.U[self.block_index(g_m)]
+        return 0
+
+    def set_block_U(self, g_m, a, N):
+        self.U[self.block_index(g_m)] = a
+        return 0
+
+    def set_block_fields(self, names):
+        if any(name not in ["U", "V"] for name in names.split()):
+            return -1
+        self.fields = names.split()
+        return 0
+
+    def get_block_fields(self, g_m, a, N):
+        # the values of the fields follow each other
+        size = self.U[self.block].size
+        index = self.block_index((numpy.asarray(g_m) - 1) % size + 1)
+        fields = numpy.array([self.U[index] if name == "U" else -self.U[index] for name in self.fields])
+        a.value = fields[(numpy.asarray(g_m) - 1) // size, numpy.arange(len(g_m))]
+        return 0
+
+    def get_field_U(self, g_i, g_j, g_k, a, N):
+        a.value = self.U[numpy.asarray(g_i) - 1, numpy.asarray(g_j) - 1, numpy.asarray(g_k) - 1]
+        return 0
+
+
+# The functions of the Dales interface that are not implemented by the mock are never called.
+class MockDalesInterface(PythonCodeInterface, DalesInterface):
+
+    def __init__(self, **options):
+        PythonCodeInterface.__init__(self, MockDalesImplementation, **options)
+
+
+class MockDales(InCodeComponentImplementation):
+
+    def __init__(self, **options):
+        InCodeComponentImplementation.__init__(self, MockDalesInterface(**options), **options)
+
+
+def block_indices(lower, shape):
+    i, j, k = numpy.indices(shape)
+    return [(x + l).flatten() for x, l in zip((i, j, k), lower)]
+
+
+class TestBlockFieldMethod(TestWithMPI):
+
+    def test_block_getter_and_setter(self):
+        code = MockDales(**kwargs)
+        try:
+            getter = BlockFieldMethod(code, "U")
+            setter = BlockFieldMethod(code, "U", setter=True)
+            getter.min_block_size = setter.min_block_size = 1
+            U = numpy.arange(8 * 6 * 4, dtype=float).reshape((8, 6, 4))
+            i, j, k = block_indices((2, 1, 3), (5, 6, 2))
+            expected = U[i - 1, j - 1, k - 1] | units.m / units.s
+            self.assertEqual(getter(i, j, k), expected)
+            self.assertEqual(getter.asynchronous(i, j, k).result(), expected)
+
+            setter.asynchronous(i, j, k, 2 * expected).result()
+            self.assertEqual(getter(i, j, k), 2 * expected)
+            self.assertEqual(code.get_field_U(i, j, k), 2 * expected)
+        finally:
+            code.stop()
+
+    def test_block_range_error(self):
+        code = MockDales(**kwargs)
+        try:
+            getter = BlockFieldMethod(code, "U")
+            setter = BlockFieldMethod(code, "U", setter=True)
+            getter.min_block_size = setter.min_block_size = 1
+            # the block reaches beyond the grid, its offsets fit in the previous range
+            i, j, k = block_indices((7, 1, 1), (3, 2, 2))
+            self.assertRaises(Exception, getter, i, j, k)
+            self.assertRaises(Exception, lambda: getter.asynchronous(i, j, k).result())
+            values = numpy.zeros(len(i)) | units.m / units.s
+            self.assertRaises(Exception, lambda: setter.asynchronous(i, j, k, values).result())
+        finally:
+            code.stop()
+
+
+class TestBlockFieldsMethod(TestWithMPI):
+
+    def test_block_fields(self):
+        code = MockDales(**kwargs)
+        try:
+            getter = BlockFieldsMethod(code, ["V", "U"])
+            U = numpy.arange(8 * 6 * 4, dtype=float).reshape((8, 6, 4))
+            i, j, k = block_indices((2, 1, 3), (5, 6, 2))
+            expected = U[i - 1, j - 1, k - 1] | units.m / units.s
+            for values in [getter(i, j, k), getter.asynchronous(i, j, k).result()]:
+                self.assertEqual(len(values), 2)
+                self.assertEqual(values[0], -expected)
+                self.assertEqual(values[1], expected)
+        finally:
+            code.stop()
+
+    def test_block_fields_errors(self):
+        code = MockDales(**kwargs)
+        try:
+            i, j, k = block_indices((7, 1, 1), (3, 2, 2))
+            getter = BlockFieldsMethod(code, ["U", "V"])
+            self.assertRaises(Exception, getter, i, j, k)
+            self.assertRaises(Exception, lambda: getter.asynchronous(i, j, k).result())
+            i, j, k = block_indices((1, 1, 1), (3, 2, 2))
+            getter = BlockFieldsMethod(code, ["U", "W"])
+            self.assertRaises(Exception, getter, i, j, k)
+            self.assertRaises(Exception, lambda: getter.asynchronous(i, j, k).result())
+        finally:
+            code.stop()
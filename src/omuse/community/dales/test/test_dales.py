@@ -327,6 +327,44 @@ class TestDalesInterface(TestWithMPI):
         instance.stop()
         cleanup_data(rundir)
 
+    def test_bomex_block_transfer(self):
+        rundir = "work-bomex46"
+        instance = Dales(case="bomex", workdir=rundir, **kwargs)
+        tim = instance.get_model_time()
+        instance.evolve_model(tim + (2 | units.s))
+        i, j, k = numpy.mgrid[1:instance.get_itot() + 1, 1:instance.get_jtot() + 1, 1:instance.get_ktot() + 1]
+        thl = instance.get_field_THL(i.flatten(), j.flatten(), k.flatten()).reshape(i.shape)
+        assert numpy.array_equal(thl, instance.fields.THL)
+        assert numpy.array_equal(thl, instance.get_field("THL"))
+        lwp = instance.get_field_LWP(i[:, :, 0].flatten(), j[:, :, 0].flatten()).reshape(i.shape[:2])
+        assert numpy.array_equal(lwp, instance.surface_fields.LWP)
+        ublock = numpy.random.random(i.shape[:2] + (2,)) | units.m / units.s
+        instance.fields[:, :, 3:5].U = ublock
+        u = instance.get_field("U", kmin=4, kmax=6)
+        assert numpy.array_equal(ublock, u)
+        instance.cleanup_code()
+        instance.stop()
+        cleanup_data(rundir)
+
+    def test_bomex_batched_getters(self):
+        rundir = "work-bomex47"
+        instance = Dales(case="bomex", workdir=rundir, **kwargs)
+        tim = instance.get_model_time()
+        instance.evolve_model(tim + (2 | units.s))
+        profiles = instance.get_profiles(["U", "THL", "A"])
+        assert sorted(profiles.keys()) == ["A", "THL", "U"]
+        assert numpy.array_equal(profiles["U"], instance.get_profile_U())
+        assert numpy.array_equal(profiles["A"], instance.get_cloudfraction(numpy.arange(1, instance.get_ktot() + 1)))
+        assert numpy.array_equal(profiles["THL"], instance.profiles.THL)
+        fields = instance.get_fields(["U", "THL", "QT"], kmin=2, kmax=5)
+        for name in ["U", "THL", "QT"]:
+            assert numpy.array_equal(fields[name], instance.get_field(name, kmin=2, kmax=5))
+        copy = instance.fields[:, :, 1:4].copy()
+        assert numpy.array_equal(copy.QT, instance.fields[:, :, 1:4].QT)
+        instance.cleanup_code()
+        instance.stop()
+        cleanup_data(rundir)
+
     def test_set_bomex_t_value(self):
         rundir = "work-bomex5"
         instance = Dales(case="bomex", workdir=rundir, **kwargs)
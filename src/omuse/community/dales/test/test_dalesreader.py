@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+
+import netCDF4
+import numpy
+from amuse.test.amusetest import TestCase
+from omuse.community.dales.dalesreader import EnsembleReader, NetcdfReader, SlabCache, make_file_reader
+
+
+# Writes a DALES-like profile output file with a time-dependent and a constant variable.
+def write_profiles(filepath, nt=50, nz=6, offset=0., format="NETCDF4", chunk=None):
+    with netCDF4.Dataset(filepath, 'w', format=format) as dataset:
+        dataset.createDimension("time", None)
+        dataset.createDimension("zt", nz)
+        dataset.createVariable("time", "f4", ("time",))[:] = 60. * numpy.arange(1, nt + 1)
+        dataset.createVariable("zt", "f4", ("zt",))[:] = 10. * numpy.arange(nz)
+        chunks = dict(chunksizes=(chunk, nz)) if chunk else {}
+        thl = dataset.createVariable("thl", "f4", ("time", "zt"), fill_value=-999., **chunks)
+        thl.units = "K"
+        data = offset + numpy.arange(nt * nz, dtype=numpy.float32).reshape(nt, nz)
+        data[3, 2] = -999.
+        thl[:] = data
+        dataset.createVariable("rhobf", "f8", ("zt",))[:] = numpy.linspace(1.2, 1., nz)
+    return data
+
+
+class TestDalesReader(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_slab_cache_eviction(self):
+        cache = SlabCache(max_bytes=3 * 80)
+        for i in range(3):
+            cache.put(i, numpy.zeros(10))
+        cache.get(0)
+        cache.put(3, numpy.zeros(10))
+        self.assertEqual(list(cache.slabs.keys()), [2, 0, 3])
+        self.assertEqual(cache.nbytes, 3 * 80)
+        cache.put(4, numpy.zeros(100))
+        self.assertEqual(len(cache.slabs), 3)
+
+    def test_time_slices(self):
+        for format in ["NETCDF4", "NETCDF3_CLASSIC"]:
+            for chunk in ([None, 7] if format == "NETCDF4" else [None]):
+                filepath = os.path.join(self.directory, "profiles.%s.%s.nc" % (format, chunk))
+                data = write_profiles(filepath, format=format, chunk=chunk)
+                reader = make_file_reader(filepath, slab_size=8)
+                try:
+                    self.assertEqual(reader.mmap_file is not None, format == "NETCDF3_CLASSIC")
+                    self.assertEqual(reader.get_slab_size("thl"), 14 if chunk else 8)
+                    thl = reader["thl"]
+                    self.assertEqual(thl.shape, (50, 6))
+                    for index in [slice(None), slice(5, 17), slice(-3, None), slice(40, 2, -3), 3, -1,
+                                  [1, 30, 12], (slice(10, 20), 2), (slice(2, 30, 5), slice(1, 3))]:
+                        expected = numpy.ma.masked_equal(data, -999.)[index]
+                        self.assertTrue(numpy.ma.allequal(thl[index], expected))
+                        self.assertTrue(numpy.array_equal(numpy.ma.getmaskarray(thl[index]),
+                                                          numpy.ma.getmaskarray(expected)))
+                    self.assertTrue(numpy.ma.getmaskarray(thl[3])[2])
+                    times, window = reader.get_time_window("thl", 120., 300.)
+                    self.assertEqual(list(times), [120., 180., 240., 300.])
+                    self.assertTrue(numpy.ma.allequal(window, data[1:5]))
+                    self.assertEqual(reader["rhobf"][:].shape, (6,))
+                    self.assertEqual(reader["missing"], [])
+                finally:
+                    reader.close()
+
+    def test_mmap_formats(self):
+        for format in ["NETCDF3_CLASSIC", "NETCDF3_64BIT_OFFSET", "NETCDF3_64BIT_DATA", "NETCDF4"]:
+            filepath = os.path.join(self.directory, "profiles.%s.nc" % format)
+            data = write_profiles(filepath, format=format)
+            reader = NetcdfReader(filepath, slab_size=8)
+            try:
+                self.assertEqual(reader.mmap_file is not None, format in ["NETCDF3_CLASSIC", "NETCDF3_64BIT_OFFSET"])
+                self.assertTrue(numpy.ma.allequal(reader["thl"][:], numpy.ma.masked_equal(data, -999.)))
+            finally:
+                reader.close()
+
+    def test_mmap_valid_range(self):
+        filepath = os.path.join(self.directory, "profiles.nc")
+        data = write_profiles(filepath, format="NETCDF3_CLASSIC")
+        with netCDF4.Dataset(filepath, 'a') as dataset:
+            for name, attributes in [("ql", dict(valid_max=100.)), ("qt", dict(valid_min=150.)),
+                                     ("w", dict(valid_range=[50., 250.], valid_max=1000.))]:
+                variable = dataset.createVariable(name, "f4", ("time", "zt"), fill_value=-999.)
+                variable.setncatts(attributes)
+                variable[:] = data
+        readers = [NetcdfReader(filepath, use_mmap=use_mmap) for use_mmap in [True, False]]
+        try:
+            self.assertTrue(readers[0].mmap_file is not None)
+            self.assertTrue(readers[1].mmap_file is None)
+            for name, masked in [("thl", 1), ("ql", 200), ("qt", 150), ("w", 99)]:
+                values, expected = [reader[name][:] for reader in readers]
+                self.assertEqual(numpy.ma.count_masked(expected), masked)
+                self.assertTrue(numpy.array_equal(numpy.ma.getmaskarray(values), numpy.ma.getmaskarray(expected)))
+                self.assertTrue(numpy.ma.allequal(values, expected))
+        finally:
+            for reader in readers:
+                reader.close()
+
+    def test_slabs_are_cached(self):
+        filepath = os.path.join(self.directory, "profiles.nc")
+        write_profiles(filepath)
+        reader = NetcdfReader(filepath, slab_size=10)
+        try:
+            reader["thl"][12:25]
+            self.assertEqual(sorted(k[3] for k in reader.cache.slabs), [1, 2])
+            reads = []
+            read = reader.read
+            reader.read = lambda *args: reads.append(args) or read(*args)
+            reader["thl"][15:22]
+            self.assertEqual(reads, [])
+            reader["thl"][5:45]
+            self.assertEqual(len(reads), 2)
+            self.assertEqual(sorted(k[3] for k in reader.cache.slabs), [0, 1, 2, 3, 4])
+        finally:
+            reader.close()
+
+    def test_shared_cache(self):
+        filepath = os.path.join(self.directory, "profiles.nc")
+        data = numpy.ma.masked_equal(write_profiles(filepath), -999.)
+        cache = SlabCache()
+        readers = [NetcdfReader(filepath, cache=cache, slab_size=size) for size in [8, 10]]
+        try:
+            self.assertTrue(numpy.ma.allequal(readers[0]["thl"][8:16], data[8:16]))
+            for index in [slice(10, 20), slice(5, 23), slice(40, 50)]:
+                for reader in readers:
+                    self.assertEqual(reader["thl"][index].shape, data[index].shape)
+                    self.assertTrue(numpy.ma.allequal(reader["thl"][index], data[index]))
+            self.assertEqual(sorted(set(k[2] for k in cache.slabs)), [8, 10])
+        finally:
+            for reader in readers:
+                reader.close()
+
+    def test_ensemble_reader(self):
+        filepaths = [os.path.join(self.directory, "profiles.%03d.nc" % i) for i in range(3)]
+        data = [write_profiles(f, offset=1000. * i) for i, f in enumerate(filepaths)]
+        for max_workers in [1, 2]:
+            reader = EnsembleReader(filepaths, max_workers=max_workers, slab_size=16)
+            try:
+                self.assertEqual(reader.get_shape("thl"), (3, 50, 6))
+                self.assertEqual(reader.get_unit("thl"), "K")
+                times, window = reader.get_time_window("thl", 600., 1200.)
+                self.assertEqual(len(times), 11)
+                self.assertEqual(window.shape, (3, 11, 6))
+                for i in range(3):
+                    self.assertTrue(numpy.ma.allequal(window[i], data[i][9:20]))
+            finally:
+                reader.close()
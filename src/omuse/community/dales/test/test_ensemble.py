@@ -0,0 +1,162 @@
+# relative import hack
+# https://stackoverflow.com/questions/16981921/relative-imports-in-python-3
+import os, sys; sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import time
+
+import numpy
+from amuse.rfi.core import PythonCodeInterface, remote_function
+from amuse.support.interface import InCodeComponentImplementation
+from amuse.test.amusetest import TestWithMPI
+from omuse.community.dales.ensemble import DalesEnsemble
+from omuse.community.dales.interface import DalesInterface
+from omuse.units import units
+
+# the mock workers are python processes on this machine
+kwargs = dict(channel_type="sockets", initialize_mpi=False)
+
+
+# Mock of the Dales worker with the functions used by the ensemble, evolving takes a given time.
+# The array functions get the length of the arrays as N, setting a NaN tendency is an error.
+class MockDalesImplementation(object):
+
+    def __init__(self):
+        self.kmax = 8
+        self.delay = 0.
+        self.model_time = 0.
+        self.interval = (0., 0.)
+        self.tendencies = dict((x, numpy.zeros(self.kmax)) for x in ["U", "V", "THL", "QT"])
+
+    def set_delay(self, delay):
+        self.delay = delay
+        return 0
+
+    def get_evolve_interval(self, start, end):
+        start.value, end.value = self.interval
+        return 0
+
+    def evolve_model(self, tend, exactEnd, walltime):
+        start = time.time()
+        time.sleep(self.delay)
+        self.model_time = tend
+        self.interval = (start, time.time())
+        walltime.value = self.interval[1] - start
+        return 0
+
+    def get_profiles_(self, k, a_u, a_v, a_w, a_thl, a_qt, a_ql, a_ql_ice, a_qr, a_e12, a_t, a_cf, a_presf, a_rhof,
+                      a_rhobf, N):
+        for name, profile in zip(["U", "V", "THL", "QT"], [a_u, a_v, a_thl, a_qt]):
+            profile.value = self.tendencies[name][numpy.asarray(k) - 1]
+        for profile in [a_w, a_ql, a_ql_ice, a_qr, a_e12, a_t, a_cf, a_presf, a_rhof, a_rhobf]:
+            profile.value = numpy.full(N, self.model_time)
+        return 0
+
+    def set_tendency(self, name, g_i, a):
+        if numpy.isnan(a).any():
+            return -1
+        self.tendencies[name][numpy.asarray(g_i) - 1] = a
+        return 0
+
+    def set_tendency_U_(self, g_i, a, N):
+        return self.set_tendency("U", g_i, a)
+
+    def set_tendency_V_(self, g_i, a, N):
+        return self.set_tendency("V", g_i, a)
+
+    def set_tendency_THL_(self, g_i, a, N):
+        return self.set_tendency("THL", g_i, a)
+
+    def set_tendency_QT_(self, g_i, a, N):
+        return self.set_tendency("QT", g_i, a)
+
+
+class MockDalesInterface(PythonCodeInterface):
+
+    def __init__(self, **options):
+        PythonCodeInterface.__init__(self, MockDalesImplementation, **options)
+
+    @remote_function
+    def set_delay(delay=0.):
+        returns()
+
+    @remote_function
+    def get_evolve_interval():
+        returns(start=0., end=0.)
+
+    evolve_model = DalesInterface.evolve_model
+    get_profiles_ = DalesInterface.get_profiles_
+    set_tendency_U_ = DalesInterface.set_tendency_U_
+    set_tendency_V_ = DalesInterface.set_tendency_V_
+    set_tendency_THL_ = DalesInterface.set_tendency_THL_
+    set_tendency_QT_ = DalesInterface.set_tendency_QT_
+
+
+class MockDales(InCodeComponentImplementation):
+
+    def __init__(self, **options):
+        InCodeComponentImplementation.__init__(self, MockDalesInterface(**options), **options)
+
+    def get_z_grid_range(self):
+        return 1, 8
+
+
+class TestDalesEnsemble(TestWithMPI):
+
+    def test_bounded_concurrency(self):
+        delays = [0.1, 0.4, 0.2, 0.3]
+        instances = [MockDales(**kwargs) for _ in delays]
+        try:
+            for instance, delay in zip(instances, delays):
+                instance.set_delay(delay)
+            ensemble = DalesEnsemble(instances, max_requests=2)
+            for tend in [60, 120] | units.s:
+                walltimes = ensemble.evolve_model(tend)
+                assert all(w >= d | units.s for w, d in zip(walltimes, delays))
+                intervals = [instance.get_evolve_interval() for instance in instances]
+                for start, end in intervals:
+                    running = sum(1 for s, e in intervals if s <= start < e)
+                    assert running <= 2
+            # the slowest instance starts first once the wall times are known
+            assert ensemble.get_order("evolve_model") == [1, 3, 2, 0]
+            statistics = ensemble.get_statistics("evolve_model")
+            assert list(statistics["count"]) == [2, 2, 2, 2]
+            assert all(statistics["mean"] >= delays)
+        finally:
+            for instance in instances:
+                instance.stop()
+
+    def test_profiles_and_tendencies(self):
+        instances = [MockDales(**kwargs) for _ in range(3)]
+        try:
+            ensemble = DalesEnsemble(instances)
+            tendencies = [{"U": numpy.arange(8.) * i | units.m / units.s ** 2,
+                           "QT": numpy.ones(8) * i | units.mfu / units.s} for i in range(3)]
+            ensemble.set_tendencies(tendencies)
+            ensemble.evolve_model(60 | units.s)
+            profiles = ensemble.get_profiles(["U", "QT", "T"])
+            for i, profile in enumerate(profiles):
+                assert sorted(profile.keys()) == ["QT", "T", "U"]
+                assert numpy.array_equal(profile["U"].value_in(units.m / units.s), numpy.arange(8.) * i)
+                assert numpy.array_equal(profile["QT"].value_in(units.mfu), numpy.ones(8) * i)
+                assert numpy.array_equal(profile["T"].value_in(units.K), numpy.full(8, 60.))
+            assert list(ensemble.get_statistics("get_profiles")["count"]) == [1, 1, 1]
+        finally:
+            for instance in instances:
+                instance.stop()
+
+    def test_empty_and_failing_tendencies(self):
+        instances = [MockDales(**kwargs) for _ in range(3)]
+        try:
+            ensemble = DalesEnsemble(instances)
+            ensemble.set_tendencies([{}, {"V": numpy.ones(8) | units.m / units.s ** 2}, {}])
+            profiles = ensemble.get_profiles(["V"])
+            assert [list(profile["V"].value_in(units.m / units.s)) for profile in profiles] == \
+                [[0.] * 8, [1.] * 8, [0.] * 8]
+            assert list(ensemble.get_statistics("set_tendencies")["count"]) == [0, 1, 0]
+
+            # the error of the first of the requests to an instance is raised
+            tendencies = [{"QT": numpy.full(8, numpy.nan) | units.mfu / units.s,
+                           "U": numpy.ones(8) | units.m / units.s ** 2}, {}, {}]
+            self.assertRaises(Exception, ensemble.set_tendencies, tendencies)
+        finally:
+            for instance in instances:
+                instance.stop()
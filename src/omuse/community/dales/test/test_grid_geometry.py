@@ -0,0 +1,138 @@
+# relative import hack
+# https://stackoverflow.com/questions/16981921/relative-imports-in-python-3
+import os, sys; sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import shutil
+import tempfile
+
+import numpy
+from amuse.rfi.core import PythonCodeInterface, remote_function
+from amuse.test.amusetest import TestWithMPI
+from omuse.community.dales import interface
+from omuse.community.dales.interface import Dales, DalesInterface, GridGeometry
+from omuse.units import units
+
+# the mock workers are python processes on this machine
+kwargs = dict(channel_type="sockets", initialize_mpi=False)
+
+
+# Mock of the Dales worker with the functions used to set up the model and read its grid.
+# The worker counts the calls of the level height getters.
+class MockDalesImplementation(object):
+
+    def __init__(self):
+        self.kmax = 6
+        self.calls = 0
+
+    def initialize_code(self):
+        return 0
+
+    def cleanup_code(self):
+        return 0
+
+    def change_dir(self, directory):
+        return 0
+
+    def set_input_file(self, input_file):
+        return 0
+
+    def set_qt_forcing(self, forcing_type):
+        return 0
+
+    def commit_parameters(self):
+        return 0
+
+    def commit_grid(self):
+        return 0
+
+    def get_params_grid(self, i, j, k, xsize, ysize):
+        i.value, j.value, k.value = 4, 4, self.kmax
+        xsize.value, ysize.value = 400., 400.
+        return 0
+
+    def get_zf_(self, k, out, N):
+        self.calls += 1
+        out.value = 20. * (numpy.asarray(k) - 0.5)
+        return 0
+
+    def get_zh_(self, k, out, N):
+        self.calls += 1
+        out.value = 20. * (numpy.asarray(k) - 1.)
+        return 0
+
+    def get_calls(self, calls):
+        calls.value = self.calls
+        return 0
+
+
+# The functions of the Dales interface that are not implemented by the mock are never called.
+class MockDalesInterface(PythonCodeInterface, DalesInterface):
+
+    def __init__(self, **options):
+        PythonCodeInterface.__init__(self, MockDalesImplementation, **options)
+
+    @remote_function
+    def get_calls():
+        returns(calls=0)
+
+
+class TestGridGeometry(TestWithMPI):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def new_instance(self):
+        """ Dales with the mock worker in place of the Dales worker """
+        interface.DalesInterface = MockDalesInterface
+        try:
+            return Dales(workdir=os.path.join(self.directory, "run"), **kwargs)
+        finally:
+            interface.DalesInterface = DalesInterface
+
+    def test_cached_levels(self):
+        instance = self.new_instance()
+        try:
+            # the parameters and the grid are committed before the levels are read
+            geometry = instance.get_grid_geometry()
+            self.assertEqual(instance.get_name_of_current_state(), "RUN")
+            self.assertEqual(instance.get_calls(), 2)
+            self.assertEqual(geometry.ktot, 6)
+            self.assertAlmostRelativeEqual(instance.get_zf(), [10., 30., 50., 70., 90., 110.] | units.m, 12)
+            self.assertAlmostRelativeEqual(instance.get_zh(), [0., 20., 40., 60., 80., 100., 120.] | units.m, 12)
+            self.assertAlmostRelativeEqual(instance.get_zf([2, 6]), [30., 110.] | units.m, 12)
+            self.assertAlmostRelativeEqual(instance.get_zh(7), 120. | units.m, 12)
+            self.assertAlmostRelativeEqual(instance.get_z_grid_position([1, 3]), [10., 50.] | units.m, 12)
+            self.assertTrue(instance.get_grid_geometry() is geometry)
+            self.assertEqual(instance.get_calls(), 2)
+        finally:
+            instance.stop()
+
+    def test_commit_resets_levels(self):
+        instance = self.new_instance()
+        stale = GridGeometry(1, 1, 1, 1. | units.m, 1. | units.m, [1.] | units.m, [0., 2.] | units.m)
+        try:
+            instance.grid_geometry_cache = stale
+            instance.commit_parameters()
+            self.assertEqual(instance.grid_geometry_cache, None)
+            instance.grid_geometry_cache = stale
+            instance.commit_grid()
+            self.assertEqual(instance.grid_geometry_cache, None)
+            self.assertEqual(instance.get_calls(), 0)
+            self.assertAlmostRelativeEqual(instance.get_zf(1), 10. | units.m, 12)
+            self.assertEqual(instance.get_calls(), 2)
+        finally:
+            instance.stop()
+
+    def test_levels_out_of_range(self):
+        instance = self.new_instance()
+        try:
+            for k in [0, -1, 7, [1, 0]]:
+                self.assertRaises(Exception, instance.get_z_grid_position, k)
+                self.assertRaises(Exception, instance.get_zf, k)
+            self.assertRaises(Exception, instance.get_zh, 0)
+            self.assertRaises(Exception, instance.get_zh, 8)
+            self.assertAlmostRelativeEqual(instance.get_zh([1, 7]), [0., 120.] | units.m, 12)
+        finally:
+            instance.stop()
@@ -1,7 +1,11 @@
 import os
+import glob
 import hashlib
 import numpy
 import datetime
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 from omuse.units import units
 from omuse.units import quantities
@@ -56,13 +60,53 @@ class ERA5(LiteratureReferencesMixIn):
     def __init__(self, maxcache=None, cachedir="./__era5_cache", 
                  start_datetime=datetime.datetime(1979,1,2), variables=[], 
                  grid_resolution=None, nwse_boundingbox=None,
-                 invariate_variables=["land_sea_mask"]):
+                 invariate_variables=["land_sea_mask"], maxcachefiles=None,
+                 prefetch=0, prefetch_workers=2, interpolation=None):
+        """
+        maxcache sets the maximum size of the download cache in bytes and maxcachefiles
+        the maximum number of files in it, when exceeded the least recently used files
+        are removed (files of the invariate variables are never removed).
+        prefetch sets the number of upcoming download_timespan chunks that are downloaded
+        in the background (using at most prefetch_workers concurrent downloads) while
+        the model evolves. With maxcachefiles set, prefetch is reduced so that the prefetched
+        files fit in the cache next to the current ones.
+        The decoded data of the current download_timespan chunk of each variable is kept
+        in memory, so stepping through the hours of a day does not reread the file. Call
+        close() to release these and stop any background downloads.
+        interpolation selects how the hourly records are interpolated in time: None (use
+        the record of the current hour), "linear" or "cubic" (Catmull-Rom, using the two
+        records on either side of the current time).
+        """
         self.maxcache=maxcache
+        self.maxcachefiles=maxcachefiles
         if not os.path.exists(cachedir):
             os.mkdir(cachedir)
         self.cachedir=cachedir
+        self.cache_hits=0
+        self.cache_misses=0
+        self.cache_evictions=0
+        self._protected_files=set()
+        self._in_use=set()
+        self._cache_lock=threading.Lock()
+
+        if maxcachefiles is not None and len(variables)>0:
+            # the cache holds the invariate files and the current and prefetched chunks of every variable
+            max_prefetch=max(0, (maxcachefiles-len(invariate_variables))//len(variables)-1)
+            if prefetch>max_prefetch:
+                print("prefetch reduced from {0} to {1} chunks to fit in {2} cache files".format(prefetch, max_prefetch, maxcachefiles))
+                prefetch=max_prefetch
+        self.prefetch=prefetch
+        self.prefetch_workers=prefetch_workers
+        self._executor=None
+        self._pending=dict()
+        self._slabs=dict()
+        self._buffers=dict()
         self.download_timespan="day"
 
+        if interpolation not in [None, "linear", "cubic"]:
+            raise Exception("unsupported interpolation %s"%str(interpolation))
+        self.interpolation=interpolation
+
         extra_lon=False
         if nwse_boundingbox is None or \
            nwse_boundingbox[3]-nwse_boundingbox[1]==360 | units.deg:
@@ -95,12 +139,14 @@ class ERA5(LiteratureReferencesMixIn):
             data=self.get_dataset(variable, 
                                  nwse_boundingbox=self.nwse_boundingbox,
                                  grid_resolution=self.grid_resolution)
-
-            shortname=self._get_shortname(data,variable)
-
-
-            lat=data["latitude"][:]
-            lon=data["longitude"][:]
+            with self._cache_lock:
+                try:
+                    shortname=self._get_shortname(data,variable)
+                    lat=data["latitude"][:]
+                    lon=data["longitude"][:]
+                    _value=data[shortname][0,:,:]
+                finally:
+                    data.close()
             
             dx=lon[1]-lon[0]
             dy=lat[1]-lat[0]
@@ -109,7 +155,7 @@ class ERA5(LiteratureReferencesMixIn):
             assert lat[1]<lat[0]                
             assert dx==-dy
                 
-            self.shape=data[shortname][0,:,:].shape
+            self.shape=_value.shape
             if self.extra_lon:
                 if self.nwse_boundingbox is None:
                   dlon=360
@@ -126,10 +172,10 @@ class ERA5(LiteratureReferencesMixIn):
  
             value=numpy.zeros(self.shape)
             if self.extra_lon:
-                value[:,:self.shape[1]-1]=data[shortname][0,::-1,:]
-                value[:,-1]=data[shortname][0,::-1,0]
+                value[:,:self.shape[1]-1]=_value[::-1,:]
+                value[:,-1]=_value[::-1,0]
             else:
-                value=data[shortname][0,::-1,:]
+                value=_value[::-1,:]
             
             setattr(grid, variable, value | _era5_units_to_omuse[era5.UNITS[variable]])
 
@@ -143,6 +189,53 @@ class ERA5(LiteratureReferencesMixIn):
     def update_grid(self):
         for v in self.variables:
             self.update_variable(v)
+        self.prefetch_datasets()
+
+    def _current_datetime(self):
+        return self.start_datetime+datetime.timedelta(days=self.tnow.value_in(units.day))
+
+    def prefetch_datasets(self):
+        """ start background downloads of the next prefetch chunks of all variables """
+        if self.prefetch<=0:
+            return
+        if self._executor is None:
+            self._executor=ThreadPoolExecutor(max_workers=self.prefetch_workers)
+
+        if self.download_timespan=="day":
+            step=datetime.timedelta(days=1)
+        else:
+            step=datetime.timedelta(hours=1)
+        time=self._current_datetime()
+        requests=[]
+        for i in range(1,self.prefetch+1):
+            for var in self.variables:
+                requests.append(self._build_request(var, time=time+i*step, download_timespan=self.download_timespan,
+                                                    nwse_boundingbox=self.nwse_boundingbox,
+                                                    grid_resolution=self.grid_resolution))
+        ahead=set([datafile for name,request,datafile in requests])
+
+        with self._cache_lock:
+            for datafile in [x for x,future in self._pending.items() if future.done()]:
+                if datafile in ahead and os.path.isfile(datafile):
+                    continue
+                # failed download (retried when needed) or a chunk that was skipped over,
+                # which no longer needs to be protected from eviction
+                del self._pending[datafile]
+            for name,request,datafile in requests:
+                if datafile in self._pending or os.path.isfile(datafile):
+                    continue
+                self._pending[datafile]=self._executor.submit(self._download, name, request, datafile)
+
+    def close(self):
+        """ stop background downloads and release the in-memory data """
+        if self._executor is not None:
+            for future in self._pending.values():
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor=None
+        self._pending=dict()
+        self._slabs=dict()
+        self._buffers=dict()
 
     def _get_shortname(self, dataset, var):
         # the netcdf hortname do not match the CDS website documentation
@@ -161,29 +254,91 @@ class ERA5(LiteratureReferencesMixIn):
             era5.SHORTNAME[var]=shortname
         return shortname
       
-    def update_variable(self, var):
-      
-        time=self.start_datetime+datetime.timedelta(days=self.tnow.value_in(units.day))
-      
+    def get_slab(self, var, time):
+        """ return the decoded data of the download_timespan chunk of var containing time,
+            flipped and extended to the grid shape (with the records along the first axis).
+            The last chunks read for each variable (one, or two when interpolating) are kept
+            in memory and their files are closed as soon as they have been read.
+        """
+        name,request,datafile=self._build_request(var, time=time, download_timespan=self.download_timespan,
+                                                  nwse_boundingbox=self.nwse_boundingbox,
+                                                  grid_resolution=self.grid_resolution)
+        slabs=self._slabs.setdefault(var, dict())
+        if datafile in slabs:
+            return slabs[datafile]
+
         dataset=self.get_dataset(var, time=time, download_timespan=self.download_timespan,
                                   nwse_boundingbox=self.nwse_boundingbox,
                                   grid_resolution=self.grid_resolution)
+        with self._cache_lock:
+            try:
+                shortname=self._get_shortname(dataset, var)
+                _value=dataset[shortname][...]
+            finally:
+                dataset.close()
 
-        shortname=self._get_shortname(dataset, var)
-      
+        assert len(_value.shape)==len(self.shape)+1
+
+        if self.extra_lon:
+            value=numpy.zeros((len(_value),)+self.shape)
+            value[:,:,:self.shape[1]-1]=_value[:,::-1,:]
+            value[:,:,-1]=_value[:,::-1,0]
+        else:
+            value=_value[:,::-1,:]
+
+        nkeep=1 if self.interpolation is None else 2
+        while len(slabs)>=nkeep:
+            del slabs[next(iter(slabs))] # drop the oldest chunk
+        slabs[datafile]=value
+        return value
+
+    def get_record(self, var, time):
+        """ return the hourly record of var containing time """
+        slab=self.get_slab(var, time)
         if self.download_timespan=="day":
-            _value=dataset[shortname][time.hour, ...]
+            return slab[time.hour]
         else:
-            _value=dataset[shortname][0, ...]
+            return slab[0]
 
-        assert len(_value.shape)==len(self.shape)
+    def interpolate_variable(self, var, time):
+        """ interpolate the hourly records of var to time, the result is written in
+            place into a buffer that is allocated once per variable
+        """
+        hour=time.replace(minute=0, second=0, microsecond=0)
+        f=(time-hour).total_seconds()/3600.
+        if f==0.:
+            return self.get_record(var, hour)
 
-        value=numpy.zeros(self.shape)
-        if self.extra_lon:
-            value[:,:self.shape[1]-1]=_value[::-1,:]
-            value[:,-1]=_value[::-1,0]
+        if var not in self._buffers:
+            self._buffers[var]=(numpy.empty(self.shape), numpy.empty(self.shape))
+        result, work=self._buffers[var]
+
+        step=datetime.timedelta(hours=1)
+        if self.interpolation=="linear":
+            offsets=[0, 1]
+            weights=[1-f, f]
+        else:
+            offsets=[-1, 0, 1, 2]
+            weights=[(-f**3+2*f**2-f)/2, (3*f**3-5*f**2+2)/2, (-3*f**3+4*f**2+f)/2, (f**3-f**2)/2]
+        
+        # records are requested in time order, so that at most two chunks are needed
+        for i,(offset, weight) in enumerate(zip(offsets, weights)):
+            record=numpy.ma.getdata(self.get_record(var, hour+offset*step))
+            if i==0:
+                numpy.multiply(record, weight, out=result)
+            else:
+                numpy.multiply(record, weight, out=work)
+                result+=work
+        return result
+
+    def update_variable(self, var):
+      
+        time=self._current_datetime()
+      
+        if self.interpolation is None:
+            value=self.get_record(var, time)
         else:
-            value=_value[::-1,:]          
+            value=self.interpolate_variable(var, time)
             
         setattr(self.grid, "_"+var, value | _era5_units_to_omuse[era5.UNITS[var]])
 
@@ -198,9 +353,44 @@ class ERA5(LiteratureReferencesMixIn):
         return os.path.join(directory, filename)
   
     def maintain_cache(self, datafile):
-        pass
+        """ evict the least recently accessed files until the cache fits within maxcache bytes
+            and maxcachefiles files. datafile, the files of invariate variables, the files that
+            are being opened and the prefetched files ahead of the model time that have not been
+            used yet are kept.
+            Must be called with _cache_lock held.
+        """
+        if self.maxcache is None and self.maxcachefiles is None:
+            return
+        
+        files=[]
+        for filename in glob.glob(os.path.join(self.cachedir, "_era5_cache_*.nc")):
+            try:
+                stat=os.stat(filename)
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, filename))
+        
+        total_size=sum([x[1] for x in files])
+        number_of_files=len(files)
+        keep=self._protected_files.union([os.path.abspath(datafile)], self._in_use,
+                                         [os.path.abspath(x) for x in self._pending])
+        
+        for atime, size, filename in sorted(files):
+            if (self.maxcache is None or total_size<=self.maxcache) and \
+               (self.maxcachefiles is None or number_of_files<=self.maxcachefiles):
+                break
+            if os.path.abspath(filename) in keep:
+                continue
+            os.remove(filename)
+            total_size-=size
+            number_of_files-=1
+            self.cache_evictions+=1
+
+    @property
+    def cache_statistics(self):
+        return dict(hits=self.cache_hits, misses=self.cache_misses, evictions=self.cache_evictions)
   
-    def get_dataset(self, variable="land_sea_mask", time=datetime.datetime(1979,1,1), 
+    def _build_request(self, variable="land_sea_mask", time=datetime.datetime(1979,1,1), 
                     download_timespan=None, grid_resolution=None, nwse_boundingbox=None):        
         if download_timespan=="day":
             hour=["%2.2i:00"%i for i in range(24)]
@@ -225,18 +415,55 @@ class ERA5(LiteratureReferencesMixIn):
         name,request=era5.build_request(variable=variable, year=year, month=month, 
                             day=day, hour=hour, area=area, grid=[g, g])
         datafile=self.generate_outputfile(name,request, self.cachedir)
-        if not os.path.isfile(datafile):
-            era5.fetch(name,request, datafile)
+        return name, request, datafile
+
+    def _download(self, name, request, datafile):
+        # download to a temporary file so that a partial download is never seen as cached
+        # netCDF is not thread safe, all access to the files is serialized with _cache_lock
+        tmpfile=datafile+".download"
+        era5.fetch(name,request, tmpfile)
+        with self._cache_lock:
+            self._append_history(name, request, tmpfile)
+            os.replace(tmpfile, datafile)
             self.maintain_cache(datafile)
-            self._append_history(name, request, datafile)
-        result=Dataset(datafile)
+
+    def get_dataset(self, variable="land_sea_mask", time=datetime.datetime(1979,1,1), 
+                    download_timespan=None, grid_resolution=None, nwse_boundingbox=None):        
+        name,request,datafile=self._build_request(variable, time, download_timespan, 
+                                                  grid_resolution, nwse_boundingbox)
+        # datafile is not evicted by the prefetch threads while it is in _in_use
+        with self._cache_lock:
+            if variable in self.invariate_variables:
+                self._protected_files.add(os.path.abspath(datafile))
+            self._in_use.add(os.path.abspath(datafile))
+            future=self._pending.pop(datafile, None)
+
+        try:
+            if future is not None:
+                try:
+                    future.result() # only blocks if the prefetch is still in progress
+                except Exception as ex:
+                    print("prefetch of {0} failed ({1}), retrying".format(datafile, ex))
+
+            if not os.path.isfile(datafile):
+                self.cache_misses+=1
+                self._download(name, request, datafile)
+            else:
+                self.cache_hits+=1
+            with self._cache_lock:
+                os.utime(datafile, None) # mark as recently used
+                result=Dataset(datafile)
+                ntime=len(result["time"])
+        finally:
+            with self._cache_lock:
+                self._in_use.discard(os.path.abspath(datafile))
         
         if download_timespan=="day":
-            assert len(result["time"])==24 
+            assert ntime==24 
         else:
-            assert len(result["time"])==1
+            assert ntime==1
             
-        return result
+        return result # the caller is responsible for closing the dataset
         
 
     def _append_history(self, name, request, filename):
@@ -13,9 +13,15 @@ from omuse.units import units
 from amuse.test.amusetest import TestWithMPI
 
 from omuse.community.era5 import era5
+from omuse.community.era5 import interface
 from omuse.community.era5.interface import ERA5, _era5_units_to_omuse
 
 import datetime
+import glob
+import shutil
+import tempfile
+
+import scipy.io
 
 class testera5(TestWithMPI):
     def test0(self):
@@ -29,3 +35,204 @@ class TestERA5(TestWithMPI):
     
     def test0(self):
         instance=ERA5()
+
+
+class fake_fetch(object):
+    """ writes a small netcdf file in place of a CDS download. The records of variable
+        at a time t hours after 1979-01-01 are value(t)+lat+0.01*lon. The file is written
+        with scipy, as the netCDF library is not used outside the lock of ERA5. """
+
+    def __init__(self, value=lambda t: t):
+        self.value=value
+        self.requests=[]
+
+    def __call__(self, name, request, outputfile):
+        variable=request["variable"]
+        date=datetime.datetime(int(request["year"]), int(request["month"]), int(request["day"]))
+        hours=request["time"] if isinstance(request["time"], list) else [request["time"]]
+        self.requests.append((variable, date, len(hours)))
+        north, west, south, east=request["area"]
+        step=request["grid"][0]
+        lat=numpy.arange(north, south-step/2, -step)
+        lon=numpy.arange(west, east+step/2, step)
+        t=numpy.array([(date-datetime.datetime(1979,1,1)).total_seconds()/3600.+int(h[:2]) for h in hours])
+        d=scipy.io.netcdf_file(outputfile, "w")
+        d.createDimension("time", len(t))
+        d.createDimension("latitude", len(lat))
+        d.createDimension("longitude", len(lon))
+        d.createVariable("latitude", "f8", ("latitude",))[:]=lat
+        d.createVariable("longitude", "f8", ("longitude",))[:]=lon
+        d.createVariable("time", "f8", ("time",))[:]=t
+        v=d.createVariable(era5.SHORTNAME[variable], "f8", ("time", "latitude", "longitude"))
+        v.long_name=variable.replace("_", " ")
+        value=numpy.zeros(len(t)) if variable=="land_sea_mask" else self.value(t)
+        v[:]=value[:,None,None]+lat[None,:,None]+0.01*lon[None,None,:]
+        d.close()
+
+class TestERA5Offline(TestWithMPI):
+    """ tests of the download cache and the time handling, with era5.fetch replaced by fake_fetch """
+
+    def setUp(self):
+        self.cachedir=tempfile.mkdtemp()
+        self.fetch=fake_fetch()
+        self._fetch=era5.fetch
+        era5.fetch=self.fetch
+
+    def tearDown(self):
+        era5.fetch=self._fetch
+        shutil.rmtree(self.cachedir)
+
+    def new_instance(self, **kwargs):
+        return ERA5(cachedir=self.cachedir, variables=["2m_temperature"],
+                    nwse_boundingbox=[52, 4, 50, 6] | units.deg, grid_resolution=1. | units.deg, **kwargs)
+
+    def datafile(self, instance, day):
+        return instance._build_request("2m_temperature", datetime.datetime(1979,1,day), "day",
+                                       instance.grid_resolution, instance.nwse_boundingbox)[2]
+
+    def cached_days(self, instance):
+        return [day for day in range(1,32) if os.path.isfile(self.datafile(instance, day))]
+
+    def set_atime(self, filename, atime):
+        os.utime(filename, (atime, os.path.getmtime(filename)))
+
+    def test1(self):
+        """ test the grid and the values of the hourly records """
+        instance=self.new_instance()
+        self.assertEqual(instance.grid.shape, (3,3))
+        self.assertEqual(self.fetch.requests, [("land_sea_mask", datetime.datetime(1979,1,1), 1),
+                                               ("2m_temperature", datetime.datetime(1979,1,2), 24)])
+        self.assertAlmostRelativeEqual(instance.grid.land_sea_mask, [[50.04, 50.05, 50.06],
+                                                                     [51.04, 51.05, 51.06],
+                                                                     [52.04, 52.05, 52.06]] | units.none, 12)
+        instance.evolve_model(5 | units.hour)
+        self.assertAlmostRelativeEqual(instance.grid._2m_temperature[0,0], (29+50.04) | units.K, 12)
+        self.assertAlmostRelativeEqual(instance.grid._2m_temperature[2,1], (29+52.05) | units.K, 12)
+        instance.close()
+
+    def test2(self):
+        """ test that the least recently accessed files are evicted and the invariate files are kept """
+        instance=self.new_instance(maxcachefiles=3)
+        lsm=instance._build_request("land_sea_mask", datetime.datetime(1979,1,1), None,
+                                    instance.grid_resolution, instance.nwse_boundingbox)[2]
+        instance.evolve_model(1 | units.day)
+        self.assertEqual(self.cached_days(instance), [2, 3])
+        self.set_atime(lsm, 1000.)
+        self.set_atime(self.datafile(instance, 3), 2000.)
+        self.set_atime(self.datafile(instance, 2), 3000.)
+        instance.evolve_model(2 | units.day)
+        self.assertEqual(self.cached_days(instance), [2, 4])
+        self.assertTrue(os.path.isfile(lsm))
+
+        # a cache hit marks the file as recently used
+        self.set_atime(self.datafile(instance, 2), 1000.)
+        self.set_atime(self.datafile(instance, 4), 2000.)
+        instance.evolve_model(0 | units.day)
+        instance.evolve_model(3 | units.day)
+        self.assertEqual(self.cached_days(instance), [2, 5])
+        self.assertEqual(instance.cache_statistics, dict(hits=1, misses=5, evictions=2))
+        self.assertEqual(len(self.fetch.requests), 5)
+        instance.close()
+
+    def test3(self):
+        """ test the limit on the total size, which keeps the file in use """
+        instance=self.new_instance(maxcache=1)
+        for day in range(1, 4):
+            instance.evolve_model(day | units.day)
+            self.assertEqual(self.cached_days(instance), [day+2])
+        self.assertEqual(len(glob.glob(os.path.join(self.cachedir, "_era5_cache_*.nc"))), 2)
+        self.assertEqual(instance.cache_statistics, dict(hits=0, misses=5, evictions=3))
+        instance.close()
+
+    def test4(self):
+        """ test that prefetched files are not evicted before they are used """
+        for maxcache, maxcachefiles in [(None, 4), (1, None)]:
+            self.fetch.requests=[]
+            for filename in glob.glob(os.path.join(self.cachedir, "*")):
+                os.remove(filename)
+            instance=self.new_instance(maxcache=maxcache, maxcachefiles=maxcachefiles, prefetch=2)
+            for day in range(1, 6):
+                instance.evolve_model(day | units.day)
+            instance.close()
+            days=[date.day for variable, date, n in self.fetch.requests if variable=="2m_temperature"]
+            self.assertEqual(len(days), len(set(days)))
+            self.assertTrue(set(range(2, 8)).issubset(days))
+            self.assertEqual(instance.cache_statistics["misses"], 2)
+            self.assertEqual(instance.cache_statistics["hits"], 5)
+            if maxcachefiles is not None:
+                self.assertTrue(len(glob.glob(os.path.join(self.cachedir, "_era5_cache_*.nc")))<=4)
+
+    def test5(self):
+        """ test that prefetch is limited to what fits in the cache """
+        instance=self.new_instance(maxcachefiles=2, prefetch=2)
+        self.assertEqual(instance.prefetch, 0)
+        instance.close()
+        instance=self.new_instance(maxcachefiles=6, prefetch=5)
+        self.assertEqual(instance.prefetch, 4)
+        instance.close()
+
+    def test6(self):
+        """ test that the current day is read once and that all datasets are closed """
+        datasets=[]
+        class recorded_dataset(interface.Dataset):
+            def __init__(self, *args, **kwargs):
+                super(recorded_dataset, self).__init__(*args, **kwargs)
+                datasets.append(self)
+        _dataset=interface.Dataset
+        interface.Dataset=recorded_dataset
+        try:
+            instance=self.new_instance()
+            reads=[]
+            get_dataset=instance.get_dataset
+            instance.get_dataset=lambda *args, **kwargs: reads.append(kwargs["time"]) or get_dataset(*args, **kwargs)
+            for hour in range(24):
+                instance.evolve_model(hour | units.hour)
+                self.assertAlmostRelativeEqual(instance.grid._2m_temperature[0,0], (24+hour+50.04) | units.K, 12)
+            self.assertEqual(reads, [])
+            instance.evolve_model(25 | units.hour)
+            self.assertEqual(reads, [datetime.datetime(1979,1,3,1)])
+            self.assertEqual(list(instance._slabs["2m_temperature"].keys()), [self.datafile(instance, 3)])
+            instance.close()
+            self.assertEqual(instance._slabs, dict())
+        finally:
+            interface.Dataset=_dataset
+        self.assertTrue(len(datasets)>=3)
+        self.assertFalse(any(d.isopen() for d in datasets))
+
+    def test7(self):
+        """ test linear and Catmull-Rom interpolation at and between the hourly records, across day boundaries """
+        value=lambda t: 10.*numpy.sin(t/3.)
+        self.fetch.value=value
+        offset=50.04 # latitude and longitude part of the values at [0,0]
+        linear=self.new_instance(interpolation="linear")
+        cubic=self.new_instance(interpolation="cubic")
+        for hour in [0, 0.25, 5, 5.5, 23, 23.5, 24, 24.75]:
+            t=24+hour # hours since 1979-01-01
+            t0=numpy.floor(t)
+            f=t-t0
+            p=[value(t0+i) for i in [-1, 0, 1, 2]]
+            expected_linear=(1-f)*p[1]+f*p[2]
+            expected_cubic=0.5*(2*p[1]+(p[2]-p[0])*f+(2*p[0]-5*p[1]+4*p[2]-p[3])*f**2+(3*p[1]-p[0]-3*p[2]+p[3])*f**3)
+            if f==0:
+                self.assertEqual(expected_cubic, p[1])
+            for instance, expected in [(linear, expected_linear), (cubic, expected_cubic)]:
+                instance.evolve_model(hour | units.hour)
+                self.assertAlmostRelativeEqual(instance.grid._2m_temperature[0,0], (expected+offset) | units.K, 8)
+        self.assertEqual(len(cubic._slabs["2m_temperature"]), 2)
+        linear.close()
+        cubic.close()
+
+    def test8(self):
+        """ test that prefetched files of skipped days are no longer protected from eviction """
+        instance=self.new_instance(maxcachefiles=4, prefetch=2)
+        for future in list(instance._pending.values()):
+            future.result()
+        self.assertEqual(self.cached_days(instance), [2, 3, 4])
+        instance.evolve_model(3 | units.day)
+        for future in list(instance._pending.values()):
+            future.result()
+        instance.prefetch_datasets()
+        self.assertEqual(sorted(instance._pending), sorted([self.datafile(instance, 6), self.datafile(instance, 7)]))
+        self.assertEqual(self.cached_days(instance), [5, 6, 7])
+        self.assertEqual(len(glob.glob(os.path.join(self.cachedir, "_era5_cache_*.nc"))), 4)
+        instance.close()
@@ -0,0 +1,379 @@
+from __future__ import print_function
+# -*- coding: utf-8 -*-
+
+"""
+Headless contour extraction for the eddy tracker.
+
+find_contours returns a ContourSet that offers the parts of the
+matplotlib ContourSet interface used by the eddy tracker (*collections*,
+*levels*, *cvalues* and *get_paths()* on each collection), without
+needing a figure or axis. The contour lines of every level are
+available directly as (N, 2) NumPy vertex arrays in *vertices*;
+closed contours repeat their first vertex at the end.
+
+The default backend is a marching squares implementation in NumPy,
+other backends can be added with register_contour_backend.
+"""
+import numpy as np
+
+
+# cyclic order of the corners (a=(j,i), b=(j,i+1), c=(j+1,i+1), d=(j+1,i))
+# and edges (bottom, right, top, left) of a cell, counterclockwise
+_EDGE_AFTER_CORNER = [0, 1, 2, 3]
+_EDGE_BEFORE_CORNER = [3, 0, 1, 2]
+
+
+def _runs(corners):
+    """
+    Contiguous runs of the corners that are set, in cyclic order,
+    as (first, last)
+    """
+    n = len(corners)
+    result = []
+    if all(corners):
+        return result
+    for k in range(n):
+        if corners[k] and not corners[k - 1]:
+            last = k
+            while corners[(last + 1) % n]:
+                last = (last + 1) % n
+            result.append((k, last))
+    return result
+
+
+def _marching_squares_table():
+    """
+    Segments (from edge, to edge) per cell case, oriented such that
+    values above the level are on the left. The case index is
+    a + 2 b + 4 c + 8 d with 1 for corners above the level. The
+    saddles (5 and 10) have a second entry for cells with their
+    centre above the level.
+    """
+    table = {}
+    for case in range(16):
+        above = [bool(case & (1 << k)) for k in range(4)]
+        if all(above) or not any(above):
+            table[case] = []
+            continue
+        table[case] = [(_EDGE_AFTER_CORNER[last], _EDGE_BEFORE_CORNER[first])
+                       for first, last in _runs(above)]
+        if case in (5, 10):
+            # centre above: the corners below are separated instead
+            below = [not x for x in above]
+            table[case + 16] = [(_EDGE_BEFORE_CORNER[first],
+                                 _EDGE_AFTER_CORNER[last])
+                                for first, last in _runs(below)]
+    return table
+
+
+_TABLE = _marching_squares_table()
+
+# triangles have corners (0, 1, 2) and edges 0: 0-1, 1: 1-2, 2: 2-0
+_TRIANGLE_TABLE = dict(
+    (case, [(last, (first - 1) % 3)
+            for first, last in _runs([bool(case & (1 << k)) for k in range(3)])])
+    for case in range(8))
+
+
+class _Field(object):
+    """
+    The cells of a field with their corner values and coordinates,
+    set up once and reused for every contour level. With corner_mask
+    (as in matplotlib) cells with a single masked corner are contoured
+    as the triangle of the other three corners.
+    """
+    def __init__(self, x, y, z, corner_mask=True):
+        z = np.ma.masked_invalid(np.ma.asarray(z, dtype=np.float64))
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.ndim == 1 and y.ndim == 1:
+            x, y = np.meshgrid(x, y)
+        if x.shape != z.shape or y.shape != z.shape:
+            raise Exception("x, y and z should have the same shape")
+        ny, nx = z.shape
+        self.x = x.ravel()
+        self.y = y.ravel()
+        self.z = np.ma.getdata(z).ravel()
+
+        mask = np.ma.getmaskarray(z)
+        masked = np.stack((mask[:-1, :-1], mask[:-1, 1:],
+                           mask[1:, 1:], mask[1:, :-1]), axis=-1)
+        nmasked = masked.sum(axis=-1)
+
+        # corner points and edge numbers (horizontal edges first, then
+        # vertical edges) of every cell
+        j, i = np.indices((ny - 1, nx - 1))
+        nh = ny * (nx - 1)
+        corners = np.stack((j * nx + i, j * nx + i + 1,
+                            (j + 1) * nx + i + 1, (j + 1) * nx + i), axis=-1)
+        edges = np.stack((j * (nx - 1) + i, nh + j * nx + i + 1,
+                          (j + 1) * (nx - 1) + i, nh + j * nx + i), axis=-1)
+
+        quads = nmasked == 0
+        self.corners = corners[quads]
+        self.edges = edges[quads]
+        self.values = self.z[self.corners]
+        self.zmin = self.values.min(axis=1)
+        self.zmax = self.values.max(axis=1)
+        self.centre = self.values.mean(axis=1)
+
+        # triangles: corners k+1, k+2, k+3 for masked corner k, their
+        # edges are the two cell edges and the diagonal, which is given
+        # a number beyond the grid edges
+        if corner_mask:
+            triangles = nmasked == 1
+        else:
+            triangles = np.zeros_like(quads)
+        k = np.argmax(masked[triangles], axis=-1)
+        k = (k[:, np.newaxis] + np.arange(1, 4)) % 4
+        self.tri_corners = np.take_along_axis(corners[triangles], k, axis=-1)
+        diagonal = nh + (ny - 1) * nx + np.arange(k.shape[0])
+        self.tri_edges = np.column_stack((
+            np.take_along_axis(edges[triangles], k[:, :2], axis=-1), diagonal))
+        self.tri_values = self.z[self.tri_corners]
+        self.tri_zmin = self.tri_values.min(axis=1)
+        self.tri_zmax = self.tri_values.max(axis=1)
+
+        # segment starting on each edge, reset after every level
+        self._start_of = np.full(nh + (ny - 1) * nx + k.shape[0], -1,
+                                 dtype=np.intp)
+
+    def _segments(self, level):
+        """
+        The segments of the contour at level, as the corner points of
+        their start and end edge and the numbers of these edges
+        """
+        cells = np.nonzero((self.zmin <= level) & (self.zmax > level))[0]
+        case = np.dot(self.values[cells] > level, [1, 2, 4, 8])
+        saddle = (case == 5) | (case == 10)
+        case[saddle & (self.centre[cells] > level)] += 16
+        quads = _cell_segments(self.corners, self.edges, cells, case,
+                               _QUAD_SEGMENTS)
+
+        cells = np.nonzero((self.tri_zmin <= level) &
+                           (self.tri_zmax > level))[0]
+        case = np.dot(self.tri_values[cells] > level, [1, 2, 4])
+        triangles = _cell_segments(self.tri_corners, self.tri_edges, cells,
+                                   case, _TRIANGLE_SEGMENTS)
+
+        return [np.concatenate(x) for x in zip(quads, triangles)]
+
+    def edge_points(self, points, level):
+        """
+        Linearly interpolated crossing of the level on the edges
+        between the pairs of grid points
+        """
+        # the same orientation in both cells sharing the edge, so that
+        # closed lines end exactly on their first vertex
+        p0 = np.minimum(points[:, 0], points[:, 1])
+        p1 = np.maximum(points[:, 0], points[:, 1])
+        z0 = self.z[p0]
+        z1 = self.z[p1]
+        t = (level - z0) / (z1 - z0)
+        return np.column_stack((self.x[p0] + t * (self.x[p1] - self.x[p0]),
+                                self.y[p0] + t * (self.y[p1] - self.y[p0])))
+
+    def contour(self, level):
+        """
+        Contour lines at level as a list of (N, 2) vertex arrays
+        """
+        from_points, to_points, start_edge, end_edge = self._segments(level)
+        n = start_edge.size
+        if n == 0:
+            return []
+
+        # link each segment to the one starting on the edge where it ends
+        self._start_of[start_edge] = np.arange(n)
+        nxt = self._start_of[end_edge]
+        self._start_of[start_edge] = -1
+
+        nxt = _break_cycles(nxt)
+        tail, rank = _rank_chains(nxt)
+
+        # number the lines in the order of their first segment
+        has_previous = np.zeros(n, dtype=bool)
+        has_previous[nxt[nxt >= 0]] = True
+        heads = np.nonzero(~has_previous)[0]
+        line = np.empty(n, dtype=np.intp)
+        line[tail[heads]] = np.arange(heads.size)
+        line = line[tail]
+
+        # a line of m segments has m+1 vertices: the start of its first
+        # segment followed by the end of each segment
+        length = rank[heads] + 2
+        offset = np.cumsum(length) - length
+        vertices = np.empty((n + heads.size, 2))
+        vertices[offset] = self.edge_points(from_points[heads], level)
+        vertices[offset[line] + length[line] - 1 - rank] = \
+            self.edge_points(to_points, level)
+        return np.split(vertices, offset[1:])
+
+
+def _segment_arrays(table, ncases):
+    """
+    The table as arrays of the number of segments and the from and to
+    edges of the segments (at most two) per case
+    """
+    count = np.zeros(ncases, dtype=np.intp)
+    edges = np.zeros((ncases, 2, 2), dtype=np.intp)
+    for case, segments in table.items():
+        count[case] = len(segments)
+        for k, segment in enumerate(segments):
+            edges[case, k] = segment
+    return count, edges
+
+
+_QUAD_SEGMENTS = _segment_arrays(_TABLE, 32)
+_TRIANGLE_SEGMENTS = _segment_arrays(_TRIANGLE_TABLE, 8)
+
+
+def _cell_segments(corners, edges, cells, case, segments):
+    """
+    The segments in the cells (with the given marching squares cases),
+    as the corner points of their start and end edge and the numbers
+    of these edges
+    """
+    count, table = segments
+    ncorners = corners.shape[1]
+    number = count[case]
+    cells = np.repeat(cells, number)
+    k = np.arange(cells.size) - np.repeat(np.cumsum(number) - number, number)
+    edge_from, edge_to = table[np.repeat(case, number), k].T
+    return (np.column_stack((corners[cells, edge_from],
+                             corners[cells, (edge_from + 1) % ncorners])),
+            np.column_stack((corners[cells, edge_to],
+                             corners[cells, (edge_to + 1) % ncorners])),
+            edges[cells, edge_from], edges[cells, edge_to])
+
+
+def _pointer_jump(nxt):
+    """
+    Successor pointers with the tails pointing to themselves
+    """
+    index = np.arange(nxt.size)
+    return np.where(nxt < 0, index, nxt)
+
+
+def _break_cycles(nxt):
+    """
+    Open every cycle of the successor list nxt just before its
+    lowest segment, so that all lines have a head and a tail
+    """
+    # by pointer jumping, the lowest segment and whether a tail can be
+    # reached within a window that doubles every step, until both no
+    # longer change
+    p = _pointer_jump(nxt)
+    lowest = np.arange(nxt.size)
+    reached = nxt < 0
+    while True:
+        new_lowest = np.minimum(lowest, lowest[p])
+        new_reached = reached | reached[p]
+        if (new_lowest == lowest).all() and (new_reached == reached).all():
+            break
+        lowest, reached = new_lowest, new_reached
+        p = p[p]
+    nxt = nxt.copy()
+    nxt[~reached & (nxt == lowest)] = -1
+    return nxt
+
+
+def _rank_chains(nxt):
+    """
+    For each segment the tail of its line and its distance to that
+    tail, by pointer jumping
+    """
+    p = _pointer_jump(nxt)
+    rank = (nxt >= 0).astype(np.intp)
+    while True:
+        rank = rank + rank[p]
+        pp = p[p]
+        if (pp == p).all():
+            return p, rank
+        p = pp
+
+
+def marching_squares(x, y, z, levels, corner_mask=True):
+    """
+    Contour lines of z on the (curvilinear) grid x, y for each of the
+    levels, as lists of (N, 2) vertex arrays. Masked and non-finite
+    values of z are left out.
+    """
+    field = _Field(x, y, z, corner_mask=corner_mask)
+    return [field.contour(level) for level in levels]
+
+
+def contourpy_backend(x, y, z, levels):
+    """
+    Contour lines computed by contourpy (the engine of matplotlib)
+    """
+    try:
+        import contourpy
+    except ImportError:
+        raise Exception("the contourpy contour backend requires contourpy")
+    generator = contourpy.contour_generator(x, y, np.ma.masked_invalid(z),
+                                            line_type='Separate')
+    return [[np.asarray(v) for v in generator.lines(level)]
+            for level in levels]
+
+
+CONTOUR_BACKENDS = {'marching_squares': marching_squares,
+                    'contourpy': contourpy_backend}
+
+
+def register_contour_backend(name, function):
+    """
+    Add a contour backend, function(x, y, z, levels) should return a
+    list with for each level a list of (N, 2) vertex arrays
+    """
+    CONTOUR_BACKENDS[name] = function
+
+
+class ContourCollection(object):
+    """
+    The contour lines of a single level
+    """
+    def __init__(self, vertices):
+        self.vertices = vertices
+        self._paths = None
+
+    def get_paths(self):
+        if self._paths is None:
+            from matplotlib.path import Path
+            self._paths = [Path(v) for v in self.vertices]
+        return self._paths
+
+
+class ContourSet(object):
+    """
+    Contour lines of a field for a sequence of levels
+    """
+    def __init__(self, levels, vertices):
+        self.levels = np.asarray(levels)
+        self.cvalues = self.levels
+        self.vertices = vertices
+        self.collections = [ContourCollection(v) for v in vertices]
+
+    def select(self, levels):
+        """
+        A ContourSet with the contours of the given levels (in that
+        order), which should all be levels of this set
+        """
+        index = dict((level, i) for i, level in enumerate(self.levels))
+        try:
+            index = [index[level] for level in levels]
+        except KeyError as ex:
+            raise Exception("level %s not in contour set" % ex)
+        result = ContourSet(levels, [self.vertices[i] for i in index])
+        result.collections = [self.collections[i] for i in index]
+        return result
+
+
+def find_contours(x, y, z, levels, backend='marching_squares'):
+    """
+    Contour lines of z on the grid x, y (1D or 2D coordinates) at each
+    of the levels, in the order given
+    """
+    if backend not in CONTOUR_BACKENDS:
+        raise Exception("unknown contour backend %s" % backend)
+    levels = np.atleast_1d(levels)
+    return ContourSet(levels, CONTOUR_BACKENDS[backend](x, y, z, levels))
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.spatial as spatial
 
 
 def get_haversine(lon1, lat1, lon2, lat2, d2r):
@@ -27,11 +28,10 @@ def distance_vector(lon1, lat1, lon2, lat2):
     erad = 6371315.0
     d2r = np.arctan2(0.,-1.)/ 180. # atan2(0.,-1.) == pi
     
-    m = np.shape(lon1)[0]
-    
-    dist = np.zeros((m))
-    for i in range(m):
-        dist[i] = get_haversine(lon1[i], lat1[i], lon2[i], lat2[i], d2r)
+    dist = get_haversine(np.asarray(lon1, dtype=np.float64),
+                         np.asarray(lat1, dtype=np.float64),
+                         np.asarray(lon2, dtype=np.float64),
+                         np.asarray(lat2, dtype=np.float64), d2r)
         
     dist = dist * erad
     
@@ -40,29 +40,76 @@ def distance_vector(lon1, lat1, lon2, lat2):
 
     
 def distance_matrix(xa, xb):
-
+    """
+    Distance between every point in xa (2 x m, lon and lat) and
+    every point in xb (2 x n), returned as an m x n matrix
+    """
     erad = 6371315.0
     d2r = np.arctan2(0.,-1.)/ 180. # atan2(0.,-1.) == pi
     
-    m = np.shape(xa)[1] #changed by Ben, used to be 0
-    n = np.shape(xb)[1] #changed by Ben, used to be 0
-
-    dist = np.zeros((m,n))
-
-    for j in range(m):
-        #for i in range(n):
-            #dist[j,i] = get_haversine(xa[j,0], xa[j,1], xb[i,0], xb[i,1],d2r)  #fiona probably had xa and xb zipped
-            #dist[j,i] = get_haversine(xa[0,j], xa[1,j], xb[0,i], xb[1,i], d2r)  #first edit by Ben
-        dist[j,:] = get_haversine(xa[0,j], xa[1,j], xb[0,:], xb[1,:], d2r)  #Ben's attempt to do entire row at once
-
-        
+    xa = np.asarray(xa, dtype=np.float64)
+    xb = np.asarray(xb, dtype=np.float64)
 
+    dist = get_haversine(xa[0][:, np.newaxis], xa[1][:, np.newaxis],
+                         xb[0][np.newaxis], xb[1][np.newaxis], d2r)
             
     dist = dist * erad
     
     return dist
 
 
+def lonlat_to_xyz(lon, lat):
+    """
+    Points on the unit sphere, one row per lon, lat point
+    """
+    d2r = np.arctan2(0.,-1.)/ 180. # atan2(0.,-1.) == pi
+
+    lon = d2r * np.asarray(lon, dtype=np.float64)
+    lat = d2r * np.asarray(lat, dtype=np.float64)
+    coslat = np.cos(lat)
+    return np.column_stack((coslat * np.cos(lon), coslat * np.sin(lon),
+                            np.sin(lat)))
+
+
+def distance_pairs(xa, xb, radius):
+    """
+    All pairs of a point in xa (2 x m, lon and lat) and a point in
+    xb (2 x n) that are at most radius metres apart, found with a
+    KD-tree on the unit sphere instead of a full distance matrix.
+    Returns the indices into xa and xb, sorted on xa and then xb,
+    and the haversine distances of the pairs.
+    """
+    erad = 6371315.0
+    d2r = np.arctan2(0.,-1.)/ 180. # atan2(0.,-1.) == pi
+
+    xa = np.asarray(xa, dtype=np.float64)
+    xb = np.asarray(xb, dtype=np.float64)
+
+    ia = np.array([], dtype=np.intp)
+    ib = np.array([], dtype=np.intp)
+    if xa.shape[1] == 0 or xb.shape[1] == 0:
+        return ia, ib, np.array([])
+
+    # chord length corresponding to radius, slightly widened for round-off
+    chord = 2. * np.sin(0.5 * min(radius / erad, np.pi))
+    chord *= 1. + 1e-9
+
+    tree_a = spatial.cKDTree(lonlat_to_xyz(xa[0], xa[1]))
+    tree_b = spatial.cKDTree(lonlat_to_xyz(xb[0], xb[1]))
+    pairs = tree_a.query_ball_tree(tree_b, chord)
+
+    counts = np.array([len(p) for p in pairs], dtype=np.intp)
+    if counts.sum() > 0:
+        ia = np.repeat(np.arange(xa.shape[1]), counts)
+        ib = np.concatenate([np.sort(p) for p in pairs if p]).astype(np.intp)
+
+    dist = get_haversine(xa[0][ia], xa[1][ia], xb[0][ib], xb[1][ib], d2r)
+    dist *= erad
+
+    within = dist <= radius
+    return ia[within], ib[within], dist[within]
+
+
 def distance(lon1, lat1, lon2, lat2):
 
     erad = 6371315.0
@@ -20,21 +20,45 @@ try:
 except:
     raise Exception("EddyTracker requires basemap to be installed")
 
+import os
 import numpy
 
 from .py_eddy_tracker_classes import plt, np, dt, Dataset, time, \
                                     datestr2datetime, gaussian_resolution, \
-                                    get_cax, collection_loop, track_eddies, \
+                                    get_cax, collection_loop, collection_loops, \
+                                    track_eddies, \
                                     anim_figure, pcol_2dxy
 from .py_eddy_tracker_property_classes import SwirlSpeed
 from .make_eddy_track_AVISO import *
+from .contours import find_contours
 
 
 
 class EddyTracker(object):
 
     def __init__(self, grid=None, lon=None, lat=None, domain='Regional',
-                 lonmin=0., lonmax=50., latmin=-45., latmax=-20., days_between=7):
+                 lonmin=0., lonmax=50., latmin=-45., latmax=-20., days_between=7,
+                 contour_backend='marching_squares', processes=1,
+                 checkpoint=None, checkpoint_interval=10, restart=False):
+
+        #contour_backend selects the engine used to extract the SLA contours,
+        #see contours.CONTOUR_BACKENDS
+        self.contour_backend = contour_backend
+
+        #number of processes used to evaluate the contours of a snapshot,
+        #None uses all cores, 1 evaluates them serially in this process
+        self.processes = processes
+
+        #the tracking state is saved to the file checkpoint every
+        #checkpoint_interval records, with restart the run resumes from it
+        #and the next record must be days_between after the checkpoint
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.record_count = 0
+        self.last_rtime = None
+        self.resumed = False
+        if restart and checkpoint is None:
+            raise Exception("Error: restarting EddyTracker requires a checkpoint file")
 
         #initialize using either lon lat or StructuredGrid passed
         if grid is not None:
@@ -132,9 +156,13 @@ class EddyTracker(object):
         A_eddy.PIXEL_THRESHOLD = [PIXMIN, PIXMAX]
         C_eddy.PIXEL_THRESHOLD = [PIXMIN, PIXMAX]
 
-        # Create nc files for saving of eddy tracks
-        A_eddy.create_netcdf(self.DATA_DIR, self.A_SAVEFILE)
-        C_eddy.create_netcdf(self.DATA_DIR, self.C_SAVEFILE)
+        # Create nc files for saving of eddy tracks, or continue
+        # writing to them from the checkpoint
+        if restart:
+            self.load_checkpoint(checkpoint)
+        else:
+            A_eddy.create_netcdf(self.DATA_DIR, self.A_SAVEFILE)
+            C_eddy.create_netcdf(self.DATA_DIR, self.C_SAVEFILE)
 
         # Get parameters for smoothing SLA field
         ZWL = numpy.atleast_1d(20.) # degrees, zonal wavelength (see Chelton etal 2011)
@@ -142,10 +170,6 @@ class EddyTracker(object):
         self.ZRES, self.MRES = gaussian_resolution(grd.get_resolution(),
                                  ZWL, MWL)
 
-        #create figure and axes for contour computation
-        contfig = plt.figure(99)
-        self.ax = contfig.add_subplot(111)
-
         #create figure, axes, and colorbar for output plot
         animfig = plt.figure(999)
         self.animax = animfig.add_subplot(111)
@@ -168,6 +192,14 @@ class EddyTracker(object):
         if is_quantity(rtime):
             rtime = rtime.value_in(units.day)
 
+        #the tracks of the checkpoint only continue into the next record
+        if self.resumed:
+            if (self.last_rtime is not None and
+                    not numpy.isclose(rtime, self.last_rtime + self.days_between)):
+                raise Exception("Error: the checkpoint saved at rtime %s does "
+                                "not continue at rtime %s" % (self.last_rtime, rtime))
+            self.resumed = False
+
         #if both sla and ssh are supplied use sla
         if (ssh is not None) and (sla is not None):
             ssh=None
@@ -246,16 +278,16 @@ class EddyTracker(object):
         if self.first_record:
             print('------ processing SLA contours for eddies')
 
-        A_CS = self.ax.contour(grd.lon(),
+        # A_eddy.sla and C_eddy.sla are the same field, so the contours
+        # of all levels are extracted at once
+        A_CS = find_contours(grd.lon(),
                   grd.lat(),
-                  A_eddy.sla, A_eddy.CONTOUR_PARAMETER)
+                  A_eddy.sla, np.union1d(A_eddy.CONTOUR_PARAMETER,
+                                         C_eddy.CONTOUR_PARAMETER),
+                  backend=self.contour_backend)
         # Note that C_CS is in reverse order
-        C_CS = self.ax.contour(grd.lon(),
-                  grd.lat(),
-                  C_eddy.sla, C_eddy.CONTOUR_PARAMETER)
-
-        # clear the current axis
-        self.ax.cla()
+        C_CS = A_CS.select(C_eddy.CONTOUR_PARAMETER)
+        A_CS = A_CS.select(A_eddy.CONTOUR_PARAMETER)
 
         # Set contour coordinates and indices for calculation of
         # speed-based radius
@@ -263,15 +295,23 @@ class EddyTracker(object):
         C_eddy.swirl = SwirlSpeed(C_CS)
 
         # Now we loop over the CS collection
-        A_eddy = collection_loop(A_CS, grd, rtime,
-                         A_list_obj=A_eddy, C_list_obj=None,
-                         sign_type=A_eddy.SIGN_TYPE,
-                         VERBOSE=A_eddy.VERBOSE)
-        # Note that C_CS is reverse order
-        C_eddy = collection_loop(C_CS, grd, rtime,
-                         A_list_obj=None, C_list_obj=C_eddy,
-                         sign_type=C_eddy.SIGN_TYPE,
-                         VERBOSE=C_eddy.VERBOSE)
+        if self.processes == 1:
+            A_eddy = collection_loop(A_CS, grd, rtime,
+                             A_list_obj=A_eddy, C_list_obj=None,
+                             sign_type=A_eddy.SIGN_TYPE,
+                             VERBOSE=A_eddy.VERBOSE)
+            # Note that C_CS is reverse order
+            C_eddy = collection_loop(C_CS, grd, rtime,
+                             A_list_obj=None, C_list_obj=C_eddy,
+                             sign_type=C_eddy.SIGN_TYPE,
+                             VERBOSE=C_eddy.VERBOSE)
+        else:
+            # Both passes share one pool of processes
+            A_eddy, C_eddy = collection_loops(
+                [(A_CS, A_eddy, None, A_eddy.SIGN_TYPE),
+                 (C_CS, None, C_eddy, C_eddy.SIGN_TYPE)],
+                grd, rtime, processes=self.processes,
+                VERBOSE=A_eddy.VERBOSE)
 
         if self.first_record:
             # Set old variables equal to new variables
@@ -295,6 +335,50 @@ class EddyTracker(object):
         # mark the end of the first record
         self.first_record = False
 
+        self.record_count += 1
+        self.last_rtime = rtime
+        if (self.checkpoint is not None and
+                self.record_count % self.checkpoint_interval == 0):
+            self.save_checkpoint()
+
+    def save_checkpoint(self, filename=None):
+        #save the state needed to resume tracking (active tracks, old eddies
+        #and counters) as flat arrays, buffered tracks are flushed first so
+        #the checkpoint matches the track files
+        if filename is None:
+            filename = self.checkpoint
+
+        state = dict(first_record=numpy.array(self.first_record),
+                     record_count=numpy.array(self.record_count),
+                     last_rtime=numpy.array(numpy.nan if self.last_rtime is None
+                                            else self.last_rtime))
+        for prefix, eddy in [('A_', self.A_eddy), ('C_', self.C_eddy)]:
+            eddy.flush_tracks()
+            for key, value in eddy.get_checkpoint().items():
+                state[prefix + key] = value
+
+        #write to a temporary file first, so a preempted write leaves
+        #the previous checkpoint intact
+        tmpname = filename + '.tmp'
+        with open(tmpname, 'wb') as f:
+            numpy.savez(f, **state)
+        os.replace(tmpname, filename)
+
+    def load_checkpoint(self, filename):
+        with numpy.load(filename) as data:
+            state = dict(data.items())
+
+        self.first_record = bool(state['first_record'])
+        self.record_count = int(state['record_count'])
+        self.last_rtime = float(state['last_rtime'])
+        if numpy.isnan(self.last_rtime):
+            self.last_rtime = None
+        self.resumed = True
+        for prefix, eddy in [('A_', self.A_eddy), ('C_', self.C_eddy)]:
+            eddy.set_checkpoint(dict((key[len(prefix):], value)
+                                     for key, value in state.items()
+                                     if key.startswith(prefix)))
+
 
 
     def rtime_to_ymdstr(self, rtime):
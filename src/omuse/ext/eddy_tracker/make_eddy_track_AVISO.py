@@ -78,6 +78,7 @@ class PyEddyTracker (object):
               set_initial_indices
               set_index_padding
               haversine_dist
+              nearest_index
               half_interp
       AVISO:  get_AVISO_f_pm_pn
       ROMS:   get_ROMS_f_pm_pn
@@ -114,6 +115,7 @@ class PyEddyTracker (object):
         self._dy = None
         self._umask = None
         self._vmask = None
+        self._index = None
 
     def read_nc(self, varfile, varname, indices=slice(None)):
         """
@@ -281,6 +283,16 @@ class PyEddyTracker (object):
                                     self._lon.shape)
         return i, j
 
+    def nearest_index(self, lon, lat):
+        """
+        Get indices i, j to the points (lon, lat) in the grid given by
+        lon() and lat(); lon and lat can be arrays. The GridIndex is
+        built on first use
+        """
+        if self._index is None:
+            self._index = eddy_tracker.GridIndex(self.lon(), self.lat())
+        return self._index.nearest(lon, lat)
+
     def half_interp(self, h_one, h_two):
         """
         Speed up frequent operations of type 0.5 * (arr[:-1] + arr[1:])
@@ -602,7 +614,7 @@ class AvisoGrid (PyEddyTracker):
         #print '--- removing unwanted attributes'
         pops = ('Mx', 'My', '_f', '_angle', '_dx', '_dy', '_gof', '_lon',
                 '_lat', '_pm', '_pn', '_umask', '_vmask', 'eke', 'u', 'v',
-                'mask', 'pad', 'vpad', 'upad')
+                'mask', 'pad', 'vpad', 'upad', '_index')
         result = self.__dict__.copy()
         for pop in pops:
             result.pop(pop)
@@ -34,6 +34,7 @@ Version 2.0.6
 
 """
 from .py_eddy_tracker_classes import *
+import os
 import scipy.spatial as spatial
 import scipy.interpolate as interpolate
 #from haversine import haversine # needs compiling with f2py
@@ -77,8 +78,8 @@ def nearest(lon_pt, lat_pt, lon2d, lat2d, theshape):
     """
     #print "nearest point for ", lon_pt , " ", lat_pt
 
-    lon_pt += -lon2d
-    lat_pt += -lat2d
+    lon_pt = lon_pt - lon2d
+    lat_pt = lat_pt - lat2d
     d = np.sqrt(lon_pt**2 + lat_pt**2)
     #print "argmin=", d.argmin()
 
@@ -95,6 +96,64 @@ def nearest(lon_pt, lat_pt, lon2d, lat2d, theshape):
     return i, j
 
 
+class GridIndex (object):
+    """
+    Index for nearest point lookups on a lon/lat grid
+
+    Gives the same i, j as nearest(), but answers many points at once
+    without computing the distance to every grid point. On a regular grid
+    (lon varying along i only, lat along j only) each axis is inverted
+    separately by bisection; a curvilinear grid is searched with a KD-tree.
+    """
+    def __init__(self, lon2d, lat2d):
+        lon2d, lat2d = np.asarray(lon2d), np.asarray(lat2d)
+        self.shape = lon2d.shape
+        self.regular = bool((lon2d == lon2d[:1]).all() and
+                            (lat2d == lat2d[:, :1]).all())
+        if self.regular:
+            self._axes = [self._sorted_axis(lon2d[0]),
+                          self._sorted_axis(lat2d[:, 0])]
+        else:
+            self._tree = spatial.cKDTree(
+                np.array([lon2d.ravel(), lat2d.ravel()]).T)
+
+    @staticmethod
+    def _sorted_axis(axis):
+        order = np.argsort(axis, kind='stable')
+        return order, axis[order]
+
+    @staticmethod
+    def _nearest_on_axis(order, axis, values):
+        if axis.size == 1:
+            return np.full(values.shape, order[0])
+        k = np.searchsorted(axis, values).clip(1, axis.size - 1)
+        below, above = order[k - 1], order[k]
+        d_below = np.abs(values - axis[k - 1])
+        d_above = np.abs(values - axis[k])
+        # Ties go to the lowest index, as with argmin in nearest()
+        use_above = (d_above < d_below) | ((d_above == d_below) &
+                                           (above < below))
+        return np.where(use_above, above, below)
+
+    def nearest(self, lon, lat):
+        """
+        Return the indices i, j of the grid points nearest to lon, lat,
+        scalars or arrays of any (broadcastable) shape
+        """
+        lon, lat = np.broadcast_arrays(np.asarray(lon, dtype=np.float64),
+                                       np.asarray(lat, dtype=np.float64))
+        if self.regular:
+            i = self._nearest_on_axis(*(self._axes[0] + (lon,)))
+            j = self._nearest_on_axis(*(self._axes[1] + (lat,)))
+        else:
+            ind = self._tree.query(np.array([lon.ravel(), lat.ravel()]).T)[1]
+            j, i = np.unravel_index(ind, self.shape)
+            i, j = i.reshape(lon.shape), j.reshape(lon.shape)
+        if lon.ndim == 0:
+            return i[()], j[()]
+        return i, j
+
+
 def uniform_resample(x, y, **kwargs):#, method='interp1d', kind='linear'):
     """
     Resample contours to have (nearly) equal spacing
@@ -150,6 +209,24 @@ def uniform_resample(x, y, **kwargs):#, method='interp1d', kind='linear'):
     return xnew, ynew
 
 
+def _pack_ragged(arrays):
+    """
+    Pack a list of 1d arrays into one flat array and their lengths
+    """
+    arrays = [np.ravel(array) for array in arrays]
+    lengths = np.array([array.size for array in arrays], dtype=np.int64)
+    if not arrays:
+        return np.zeros(0), lengths
+    return np.concatenate(arrays).astype(np.float64), lengths
+
+
+def _unpack_ragged(flat, lengths):
+    """
+    Inverse of _pack_ragged
+    """
+    return np.split(flat, np.cumsum(lengths)[:-1]) if lengths.size else []
+
+
 def strcompare(str1, str2):
     return str1 in str2 and str2 in str1
 
@@ -319,6 +396,12 @@ class TrackList (object):
 
         self.SAVE_FIGURES = kwargs.get('SAVE_FIGURES', False)
 
+        # Finished tracks are buffered and appended to the nc file every
+        # FLUSH_INTERVAL records, or sooner once FLUSH_SIZE observations
+        # are buffered
+        self.FLUSH_INTERVAL = kwargs.get('FLUSH_INTERVAL', 10)
+        self.FLUSH_SIZE = kwargs.get('FLUSH_SIZE', 100000)
+
         self.VERBOSE = kwargs.get('VERBOSE', False)
 
         self.M = grd.M
@@ -369,6 +452,7 @@ class TrackList (object):
         self.index = 0  # counter
         self.ncind = 0  # index to write to nc files, will increase and increase
         self.ch_index = 0  # index for Chelton style nc files
+        self.reset_track_buffer()
         self.PAD = 2
         self.search_ellipse = None
         self.PIXEL_THRESHOLD = None
@@ -390,6 +474,146 @@ class TrackList (object):
             result.pop(pop)
         return result
 
+    # Track variables and per eddy lists saved by get_checkpoint
+    TRACK_COLUMNS = ('lon', 'lat', 'ocean_time', 'uavg', 'teke',
+                     'radius_s', 'radius_e', 'amplitude')
+    TRACK_FLAGS = ('alive', 'dayzero', 'saved2nc')
+    CHECKPOINT_LISTS = ('new_lon', 'new_lat', 'new_radii_s', 'new_radii_e',
+                        'new_amp', 'new_uavg', 'new_teke', 'new_time',
+                        'old_lon', 'old_lat', 'old_radii_s', 'old_radii_e',
+                        'old_amp', 'old_uavg', 'old_teke')
+    CHECKPOINT_CONTOURS = ('new_contour_e', 'new_contour_s',
+                           'old_contour_e', 'old_contour_s')
+
+    def get_checkpoint(self):
+        """
+        Return the tracking state as a dict of flat arrays: the tracks in
+        tracklist (observations concatenated, with their lengths), the
+        new and old eddy lists and the counters. Finished tracks that are
+        still buffered are not included, call flush_tracks first
+        """
+        state = dict()
+        tracks = self.tracklist
+        state['track_len'] = np.array([len(track.lon) for track in tracks],
+                                      dtype=np.int64)
+        for name in self.TRACK_COLUMNS:
+            state['track_' + name] = np.array(
+                [value for track in tracks for value in getattr(track, name)],
+                dtype=np.float64)
+        for name in self.TRACK_FLAGS:
+            state['track_' + name] = np.array(
+                [getattr(track, name) for track in tracks], dtype=bool)
+        for name in self.CHECKPOINT_LISTS:
+            state[name] = np.array(getattr(self, name), dtype=np.float64)
+
+        if self.TRACK_EXTRA_VARIABLES:
+            state['track_shape_error'] = np.array(
+                [value for track in tracks for value in track.shape_error],
+                dtype=np.float64)
+            for name in ('contour_e', 'contour_s'):
+                state['track_' + name], state['track_' + name + '_len'] = \
+                    _pack_ragged([value for track in tracks
+                                  for value in getattr(track, name)])
+            for name in self.CHECKPOINT_CONTOURS:
+                contours = getattr(self, name)
+                if isinstance(contours, np.ndarray):
+                    # itemgetter returns a single contour unwrapped
+                    contours = [contours]
+                state[name], state[name + '_len'] = _pack_ragged(
+                    list(contours))
+            for name in ('new_shape_error', 'old_shape_error'):
+                state[name] = np.array(getattr(self, name), dtype=np.float64)
+
+        state['counters'] = np.array([self.index, self.ncind, self.ch_index,
+                                      self.new_list], dtype=np.int64)
+        state['savedir'] = np.array(self.savedir)
+        return state
+
+    def set_checkpoint(self, state):
+        """
+        Restore the tracking state returned by get_checkpoint. The nc
+        file is truncated to the observations written before the
+        checkpoint, tracks finished after it are written again
+        """
+        ends = np.cumsum(state['track_len'])
+        starts = ends - state['track_len']
+        columns = dict((name, state['track_' + name].tolist())
+                       for name in self.TRACK_COLUMNS)
+        if self.TRACK_EXTRA_VARIABLES:
+            columns['shape_error'] = state['track_shape_error'].tolist()
+            for name in ('contour_e', 'contour_s'):
+                columns[name] = _unpack_ragged(state['track_' + name],
+                                               state['track_' + name + '_len'])
+
+        self.tracklist = []
+        for k, (start, end) in enumerate(zip(starts, ends)):
+            track = Track(self.PRODUCT, *[None] * 8,
+                          save_extras=self.TRACK_EXTRA_VARIABLES)
+            for name, values in columns.items():
+                setattr(track, name, list(values[start:end]))
+            for name in self.TRACK_FLAGS:
+                setattr(track, name, bool(state['track_' + name][k]))
+            self.tracklist.append(track)
+
+        for name in self.CHECKPOINT_LISTS:
+            setattr(self, name, state[name].tolist())
+        if self.TRACK_EXTRA_VARIABLES:
+            for name in self.CHECKPOINT_CONTOURS:
+                setattr(self, name, _unpack_ragged(state[name],
+                                                   state[name + '_len']))
+            for name in ('new_shape_error', 'old_shape_error'):
+                setattr(self, name, state[name].tolist())
+
+        self.index, self.ncind, self.ch_index, new_list = \
+            state['counters'].tolist()
+        self.new_list = bool(new_list)
+        self.savedir = str(state['savedir'])
+        self.reset_track_buffer()
+
+        self.truncate_netcdf(self.ncind)
+        return self
+
+    def truncate_netcdf(self, nobs):
+        """
+        Drop the observations after nobs from the nc file. The unlimited
+        Nobs dimension can not shrink, so if there are more observations
+        the file is copied to a new file that replaces it
+        """
+        with Dataset(self.savedir) as nc:
+            size = len(nc.dimensions['Nobs'])
+        if size <= nobs:
+            with Dataset(self.savedir, 'a') as nc:
+                nc.NOBS_SAVED = np.int32(nobs)
+            return
+
+        tmpname = self.savedir + '.tmp'
+        with Dataset(self.savedir) as src, \
+             Dataset(tmpname, 'w', format=src.data_model) as dst:
+            dst.setncatts(dict((name, src.getncattr(name))
+                               for name in src.ncattrs()))
+            dst.NOBS_SAVED = np.int32(nobs)
+            for name, dimension in src.dimensions.items():
+                dst.createDimension(name, None if dimension.isunlimited()
+                                    else len(dimension))
+            for name, variable in src.variables.items():
+                attributes = dict((key, variable.getncattr(key))
+                                  for key in variable.ncattrs())
+                fill_value = attributes.pop('_FillValue', None)
+                truncated = dst.createVariable(name, variable.dtype,
+                                               variable.dimensions,
+                                               fill_value=fill_value)
+                truncated.setncatts(attributes)
+                index = tuple(slice(nobs) if dimension == 'Nobs'
+                              else slice(None)
+                              for dimension in variable.dimensions)
+                values = variable[index]
+                if values.size:
+                    truncated[index] = values
+                if name == 'track':
+                    truncated.max_val = np.int32(values.max() if values.size
+                                                 else 0)
+        os.replace(tmpname, self.savedir)
+
     def add_new_track(self, lon, lat, time, uavg, teke,
                       radius_s, radius_e, amplitude, temp=None, salt=None,
                       contour_e=None, contour_s=None, uavg_profile=None,
@@ -579,6 +803,9 @@ class TrackList (object):
         nc.EVOLVE_AREA_MIN = self.EVOLVE_AREA_MIN
         nc.EVOLVE_AREA_MAX = self.EVOLVE_AREA_MAX
 
+        # Number of observations completely written, see flush_tracks
+        nc.NOBS_SAVED = np.int32(0)
+
         # Create dimensions
         nc.createDimension('Nobs', None)#len(Eddy.tracklist))
         #nc.createDimension('time', None) #len(maxlen(ocean_time)))
@@ -768,102 +995,133 @@ class TrackList (object):
         self.tracklist = tracklist.tolist()
         return alive_inds
 
+    def reset_track_buffer(self):
+        """
+        Empty the buffer of finished tracks, it holds a list of
+        arrays (one per track) for every variable in the nc file
+        """
+        self.track_buffer = dict()
+        self.track_buffer_size = 0  # number of buffered observations
+        self.records_since_flush = 0
+
+    def buffer_track(self, track):
+        """
+        Add the observations of a finished track to the buffer
+        """
+        tsize = len(track.lon)
+        columns = dict()
+        columns['lon'] = np.array(track.lon)
+        columns['lat'] = np.array(track.lat)
+        columns['A'] = np.array(track.amplitude)
+        columns['U'] = np.array(track.uavg) * 100. # to cm/s
+        columns['Teke'] = np.array(track.teke)
+        columns['L'] = np.array(track.radius_s) * 1e-3 # to km
+        columns['radius_e'] = np.array(track.radius_e) * 1e-3 # to km
+        columns['n'] = np.arange(tsize, dtype=np.int32)
+        columns['track'] = np.full(tsize, self.ch_index, dtype=np.int32)
+        if 'Anticyclonic' in self.SIGN_TYPE:
+            columns['cyc'] = np.full(tsize, 1, dtype=np.int32)
+        elif 'Cyclonic' in self.SIGN_TYPE:
+            columns['cyc'] = np.full(tsize, -1, dtype=np.int32)
+        #eddy_duration = np.array([track.ocean_time]).ptp()
+
+        if 'ROMS' in self.PRODUCT:
+            #columns['temp'] = np.array(track.temp)
+            #columns['salt'] = np.array(track.salt)
+            pass
+
+        if self.INTERANNUAL:
+            # We add 1 because 'j1' is an integer in ncsavefile; julian day midnight has .5
+            # i.e., dt.julian2num(2448909.5) -> 727485.0
+            columns['j1'] = dt.num2julian(np.array(track.ocean_time)) + 1
+
+        else:
+            columns['ocean_time'] = np.array(track.ocean_time)
+
+        if self.TRACK_EXTRA_VARIABLES:
+            columns['shape_error'] = np.array(track.shape_error)
+            columns['contour_e'] = [np.array([contour]).ravel()
+                                    for contour in track.contour_e]
+            columns['contour_s'] = [np.array([contour]).ravel()
+                                    for contour in track.contour_s]
+            #columns['uavg_profile'] = [np.array([profile]).ravel()
+                                       #for profile in track.uavg_profile]
+
+        for name, column in columns.items():
+            self.track_buffer.setdefault(name, []).append(column)
+        self.track_buffer_size += tsize
+        self.ch_index += 1
+
+    def flush_tracks(self):
+        """
+        Append the buffered tracks to the nc file, with a single write
+        per variable. NOBS_SAVED is updated after all variables have been
+        written, so after a crash the file holds complete tracks up to
+        observation NOBS_SAVED
+        """
+        self.records_since_flush = 0
+        if not self.track_buffer_size:
+            return
+
+        tend = self.ncind + self.track_buffer_size
+        with Dataset(self.savedir, 'a') as nc:
+
+            for name, columns in self.track_buffer.items():
+
+                if name in ('contour_e', 'contour_s'):
+                    columns = [contour for track in columns
+                               for contour in track]
+                    npoints = max(contour.size for contour in columns)
+                    block = np.full((npoints, len(columns)), self.FILLVAL,
+                                    dtype=np.float32)
+                    for j, contour in enumerate(columns):
+                        block[:contour.size, j] = contour
+                    nc.variables[name][:npoints, self.ncind:tend] = block
+
+                else:
+                    nc.variables[name][self.ncind:tend] = np.concatenate(columns)
+
+            nc.variables['track'].max_val = np.array([
+                nc.variables['track'].max_val,
+                np.int32(self.ch_index - 1)]).max()
+            nc.NOBS_SAVED = np.int32(tend)
+
+        self.ncind = tend
+        self.reset_track_buffer()
+
     def write2netcdf(self, rtime, stopper=0):
         """
-        Write inactive tracks to netcdf file.
+        Buffer inactive tracks and write them to the netcdf file
+        every FLUSH_INTERVAL records or once FLUSH_SIZE observations
+        are buffered (see flush_tracks).
         'ncind' is important because prevents writing of
         already written tracks.
-        Each inactive track is 'emptied' after saving
-        
+        Inactive tracks are removed from tracklist after buffering
+
         rtime - current timestamp
-        stopper - dummy value (either 0 or 1)
+        stopper - dummy value (either 0 or 1), 1 also flushes the buffer
         """
         rtime += stopper
-        tracks2save = np.array([self.get_inactive_tracks(rtime)])
         DBR = self.DAYS_BTWN_RECORDS
 
-        if np.any(tracks2save): # Note, this could break if all eddies become inactive at same time
+        for i in self.get_inactive_tracks(rtime):
 
-            with Dataset(self.savedir, 'a') as nc:
+            # saved2nc is a flag indicating if track[i] has been saved
+            if (not self.tracklist[i].saved2nc) and \
+               (np.all(self.tracklist[i].ocean_time)):
+
+                tsize = len(self.tracklist[i].lon)
+
+                if (tsize >= self.TRACK_DURATION_MIN / DBR) and tsize >= 1.:
+                    self.buffer_track(self.tracklist[i])
 
-                for i in np.nditer(tracks2save):
-
-                    # saved2nc is a flag indicating if track[i] has been saved
-                    if (not self.tracklist[i].saved2nc) and \
-                       (np.all(self.tracklist[i].ocean_time)):
-
-                        tsize = len(self.tracklist[i].lon)
-
-                        if (tsize >= self.TRACK_DURATION_MIN / DBR) and tsize >= 1.:
-                            lon = np.array([self.tracklist[i].lon])
-                            lat = np.array([self.tracklist[i].lat])
-                            amp = np.array([self.tracklist[i].amplitude])
-                            uavg = np.array([self.tracklist[i].uavg]) * 100. # to cm/s
-                            teke = np.array([self.tracklist[i].teke])
-                            radius_s = np.array([self.tracklist[i].radius_s]) * 1e-3 # to km
-                            radius_e = np.array([self.tracklist[i].radius_e]) * 1e-3 # to km
-                            n = np.arange(tsize, dtype=np.int32)
-                            track = np.full(tsize, self.ch_index)
-                            if 'Anticyclonic' in self.SIGN_TYPE:
-                                cyc = np.full(tsize, 1)
-                            elif 'Cyclonic' in self.SIGN_TYPE:
-                                cyc = np.full(tsize, -1)
-                            track_max_val = np.array([nc.variables['track'].max_val,
-                                                      np.int32(self.ch_index)]).max()
-                            #print self.tracklist[i].ocean_time
-                            #exit()
-                            #eddy_duration = np.array([self.tracklist[i].ocean_time]).ptp()
-
-                            tend = self.ncind + tsize
-                            nc.variables['cyc'][self.ncind:tend] = cyc
-                            nc.variables['lon'][self.ncind:tend] = lon
-                            nc.variables['lat'][self.ncind:tend] = lat
-                            nc.variables['A'][self.ncind:tend] = amp
-                            nc.variables['U'][self.ncind:tend] = uavg
-                            nc.variables['Teke'][self.ncind:tend] = teke
-                            nc.variables['L'][self.ncind:tend] = radius_s
-                            nc.variables['radius_e'][self.ncind:tend] = radius_e
-                            nc.variables['n'][self.ncind:tend] = n
-                            nc.variables['track'][self.ncind:tend] = track
-                            nc.variables['track'].max_val = track_max_val
-                            #nc.variables['eddy_duration'][self.ncind:tend] = eddy_duration
-
-                            if 'ROMS' in self.PRODUCT:
-                                #temp = np.array([self.tracklist[i].temp])
-                                #salt = np.array([self.tracklist[i].salt])
-                                pass
-                                #nc.variables['temp'][self.ncind:tend] = temp
-                                #nc.variables['salt'][self.ncind:tend] = salt
-
-                            if self.INTERANNUAL:
-                                # We add 1 because 'j1' is an integer in ncsavefile; julian day midnight has .5
-                                # i.e., dt.julian2num(2448909.5) -> 727485.0
-                                j1 = dt.num2julian(np.array([self.tracklist[i].ocean_time])) + 1
-                                nc.variables['j1'][self.ncind:tend] = j1
-
-                            else:
-                                ocean_time = np.array([self.tracklist[i].ocean_time])
-                                nc.variables['ocean_time'][self.ncind:tend] = ocean_time
-
-                            if self.TRACK_EXTRA_VARIABLES:
-                                shape_error = np.array([self.tracklist[i].shape_error])
-                                nc.variables['shape_error'][self.ncind:tend] = shape_error
-
-                                for j in np.arange(tend - self.ncind):
-                                    jj = j + self.ncind
-                                    contour_e_arr = np.array([self.tracklist[i].contour_e[j]]).ravel()
-                                    contour_s_arr = np.array([self.tracklist[i].contour_s[j]]).ravel()
-                                    #uavg_profile_arr = np.array([self.tracklist[i].uavg_profile[j]]).ravel()
-                                    nc.variables['contour_e'][:contour_e_arr.size, jj] = contour_e_arr
-                                    nc.variables['contour_s'][:contour_s_arr.size, jj] = contour_s_arr
-                                    nc.variables['contour_s'][contour_s_arr.size:, jj] = self.FILLVAL
-                                    #nc.variables['uavg_profile'][:uavg_profile_arr.size, jj] = uavg_profile_arr
-
-                            # Flag indicating track[i] is now saved
-                            self.tracklist[i].saved2nc = True
-                            self.ncind += tsize
-                            self.ch_index += 1
-                            nc.sync()
+                    # Flag indicating track[i] is now saved
+                    self.tracklist[i].saved2nc = True
+
+        self.records_since_flush += 1
+        if (stopper or self.records_since_flush >= self.FLUSH_INTERVAL or
+                self.track_buffer_size >= self.FLUSH_SIZE):
+            self.flush_tracks()
 
         # Print final message and return
         if stopper:
@@ -955,13 +1213,9 @@ class TrackList (object):
         """
         lonmin, lonmax = contlon.min(), contlon.max()
         latmin, latmax = contlat.min(), contlat.max()
-        bl_i, bl_j = nearest(lonmin, latmin, grd.lon(), grd.lat(), grd.shape)
-        tl_i, tl_j = nearest(lonmin, latmax, grd.lon(), grd.lat(), grd.shape)
-        br_i, br_j = nearest(lonmax, latmin, grd.lon(), grd.lat(), grd.shape)
-        tr_i, tr_j = nearest(lonmax, latmax, grd.lon(), grd.lat(), grd.shape)
-
-        iarr = np.array([bl_i, tl_i, br_i, tr_i])
-        jarr = np.array([bl_j, tl_j, br_j, tr_j])
+        # Bottom left, top left, bottom right and top right corners
+        iarr, jarr = grd.nearest_index([lonmin, lonmin, lonmax, lonmax],
+                                       [latmin, latmax, latmin, latmax])
         self.imin, self.imax = iarr.min(), iarr.max()
         self.jmin, self.jmax = jarr.min(), jarr.max()
 
@@ -1045,6 +1299,15 @@ class RossbyWaveSpeed (object):
         Return the distance required by SearchEllipse
         to construct a search ellipse for eddy tracking.
         """
+        self.distance = self.get_rwdistances(xpt, ypt, 1.)
+        return self.distance * DAYS_BTWN_RECORDS
+
+    def get_rwdistances(self, xpt, ypt, DAYS_BTWN_RECORDS):
+        """
+        Return the distances required by SearchEllipse for arrays
+        of points xpt, ypt, the deformation radius data is queried
+        once for all points.
+        """
         def get_lon_lat(xpt, ypt):
             """
             
@@ -1060,43 +1323,42 @@ class RossbyWaveSpeed (object):
             elif lat >= 0:
                 lat = "".join((str(lat), 'N'))
             return lon, lat
-            
+
+        xpt, ypt = np.atleast_1d(xpt, ypt)
+
         if self.THE_DOMAIN in ('Global', 'Regional', 'ROMS'):
-            #print 'xpt, ypt', xpt, ypt
-            self.distance[:] = self._get_rlongwave_spd(xpt, ypt)
-            self.distance *= 86400.
+            distance = self._get_rlongwave_spd(xpt, ypt) * 86400.
             #if self.THE_DOMAIN in 'ROMS':
-                #self.distance *= 1.5
+                #distance *= 1.5
 
         elif 'BlackSea' in self.THE_DOMAIN:
-            self.distance[:] = 15000.  # e.g., Blokhina & Afanasyev, 2003
+            distance = np.full(xpt.shape, 15000.)  # e.g., Blokhina & Afanasyev, 2003
 
         elif 'MedSea' in self.THE_DOMAIN:
-            self.distance[:] = 20000.
+            distance = np.full(xpt.shape, 20000.)
 
         else:
-            Exception  # Unknown THE_DOMAIN
+            raise Exception("Unknown THE_DOMAIN %s" % self.THE_DOMAIN)
+
+        distance = np.abs(distance)
 
-        if self.start:
-            lon, lat = get_lon_lat(xpt, ypt)
+        if self.start and xpt.size:
+            lon, lat = get_lon_lat(xpt[0], ypt[0])
             if 'Global' in self.THE_DOMAIN:
                 print("".join(('--------- setting ellipse for first tracked ',
                             'eddy at %s, %s in the %s domain'
                                 % (lon, lat, self.THE_DOMAIN))))
-                c = np.abs(self._get_rlongwave_spd(xpt, ypt))[0]
+                c = distance[0] / 86400.
                 print("".join(('--------- with extratropical long baroclinic ',
                             'Rossby wave phase speed of %s m/s' % c)))
             elif self.THE_DOMAIN in ('BlackSea', 'MedSea'):
                 print("".join(('--------- setting search radius of %s m for '
-                                % self.distance[0],
+                                % distance[0],
                             'first tracked eddy at %s, %s in the %s domain'
                                 % (lon, lat, self.THE_DOMAIN))))
-            else:
-                Exception
             self.start = False
 
-        self.distance = np.abs(self.distance)
-        return self.distance * DAYS_BTWN_RECORDS
+        return distance * DAYS_BTWN_RECORDS
 
     def _make_subset(self):
         """
@@ -1140,25 +1402,25 @@ class RossbyWaveSpeed (object):
     def _get_defrad(self, xpt, ypt):
         """
         Get a point average of the deformation radius
-        at xpt, ypt
+        at xpt, ypt, these may be arrays of points
         """
-        weights, i = self._tree.query(np.array([xpt, ypt]), k=4, p=2)
-        weights /= weights.sum()
+        weights, i = self._tree.query(np.array([xpt, ypt]).T, k=4, p=2)
+        weights /= weights.sum(axis=-1)[..., np.newaxis]
         self._weights = weights
         self.i = i
-        return np.average(self._defrad[i], weights=weights)
+        return (self._defrad[i] * weights).sum(axis=-1)
 
     def _get_rlongwave_spd(self, xpt, ypt):
         """
         Get the longwave phase speed, see Chelton etal (1998) pg 446:
           c = -beta * defrad ** 2 (this only for extratropical waves...)
         """
-        self.r_spd_long[:] = self._get_defrad(xpt, ypt)
+        self.r_spd_long = np.atleast_1d(self._get_defrad(xpt, ypt))
         self.r_spd_long *= 1000.  # km to m
         self.r_spd_long **= 2
-        self.beta[:] = np.average(self._lat[self.i],
-                                  weights=self._weights)  # lat
-        self.beta[:] = np.cos(self.pio180 * self.beta)
+        self.beta = np.atleast_1d((self._lat[self.i] *
+                                   self._weights).sum(axis=-1))  # lat
+        self.beta = np.cos(self.pio180 * self.beta)
         self.beta *= 1458e-7  # 1458e-7 ~ (2 * 7.29*10**-5)
         self.beta /= self.EARTH_RADIUS
         self.r_spd_long *= -self.beta
@@ -1237,7 +1499,7 @@ class SearchEllipse (object):
         part is used to build the search ellipse.
         """
         self.west_ellipse = patch.Ellipse((self.xpt, self.ypt),
-                                          self.rw_c_mod, self.n_s_minor)
+                                          self.rw_c_mod[0], self.n_s_minor)
         return self
 
     def _set_global_ellipse(self):
@@ -1247,11 +1509,9 @@ class SearchEllipse (object):
         """
         self._set_east_ellipse()._set_west_ellipse()
         e_verts = self.east_ellipse.get_verts()
-        e_size = e_verts[:, 0].size
-        e_size *= 0.5
+        e_size = e_verts[:, 0].size // 2
         w_verts = self.west_ellipse.get_verts()
-        w_size = w_verts[:, 0].size
-        w_size *= 0.5
+        w_size = w_verts[:, 0].size // 2
         ew_x = np.hstack((e_verts[e_size:, 0], w_verts[:w_size, 0]))
         ew_y = np.hstack((e_verts[e_size:, 1], w_verts[:w_size, 1]))
         #print self.xpt, ew_x.min(), ew_x.max()
@@ -1265,7 +1525,7 @@ class SearchEllipse (object):
         Set *ellipse_path* for the *black_sea_ellipse*.
         """
         self.black_sea_ellipse = patch.Ellipse((self.xpt, self.ypt),
-                               2. * self.rw_c_mod, 2. * self.rw_c_mod)
+                               2. * self.rw_c_mod[0], 2. * self.rw_c_mod[0])
         verts = self.black_sea_ellipse.get_verts()
         self.ellipse_path = path.Path(np.array([verts[:, 0],
                                                 verts[:, 1]]).T)
@@ -1290,8 +1550,7 @@ class SearchEllipse (object):
             self.rw_c[:] = self.rwv.get_rwdistance(xpt, ypt,
                                   self.DAYS_BTWN_RECORDS)
             self.rw_c_mod *= self.rw_c
-            self.rw_c_mod[:] = np.array([self.rw_c_mod,
-                                         self.semi_n_s_minor]).max()
+            self.rw_c_mod[:] = np.maximum(self.rw_c_mod, self.semi_n_s_minor)
             #self.rw_c_mod *= 2. #Ben: I don't understand why this is multiplied by 2.0
             self._set_global_ellipse()
 
@@ -1306,6 +1565,52 @@ class SearchEllipse (object):
 
         return self
 
+    def get_search_ellipses(self, xpt, ypt):
+        """
+        Get the search ellipses around arrays of points, the batched
+        counterpart of set_search_ellipse.
+
+        args:
+
+            *xpt*: lon coordinates (Basemap projection)
+
+            *ypt*: lat coordinates (Basemap projection)
+
+        returns arrays of *rw_c_mod* and the eastern, western and
+        north-south semi axes of the ellipses, which are passed on
+        to in_search_ellipses.
+        """
+        rw_c = self.rwv.get_rwdistances(xpt, ypt, self.DAYS_BTWN_RECORDS)
+        rw_c_mod = self.rw_c_fac * rw_c
+
+        if self.THE_DOMAIN in ('Global', 'Regional', 'ROMS'):
+            rw_c_mod = np.maximum(rw_c_mod, self.semi_n_s_minor)
+            # As in _set_global_ellipse the larger half ellipse
+            # is always the western one
+            semi_east = np.minimum(0.5 * self.e_w_major, 0.5 * rw_c_mod)
+            semi_west = np.maximum(0.5 * self.e_w_major, 0.5 * rw_c_mod)
+            semi_n_s = np.full(rw_c_mod.shape, 0.5 * self.n_s_minor)
+
+        elif self.THE_DOMAIN in ('BlackSea', 'MedSea'):
+            semi_east = semi_west = semi_n_s = rw_c_mod
+
+        else:
+            raise Exception("Unknown THE_DOMAIN %s" % self.THE_DOMAIN)
+
+        return rw_c_mod, semi_east, semi_west, semi_n_s
+
+    @staticmethod
+    def in_search_ellipses(xpt, ypt, x, y, semi_east, semi_west, semi_n_s):
+        """
+        Test whether the points x, y are inside the search ellipses
+        centred at xpt, ypt, all arguments are arrays over the
+        candidate pairs. The semi axes come from get_search_ellipses.
+        """
+        dx = np.asarray(x) - xpt
+        dy = np.asarray(y) - ypt
+        semi_e_w = np.where(dx >= 0., semi_east, semi_west)
+        return (dx / semi_e_w) ** 2 + (dy / semi_n_s) ** 2 <= 1.
+
     def view_search_ellipse(self, Eddy):
         """
         Input A_eddy or C_eddy
@@ -37,6 +37,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from netCDF4 import Dataset
 import time
+import multiprocessing
 import matplotlib.dates as dt
 import matplotlib.path as path
 import matplotlib.patches as patch
@@ -45,7 +46,6 @@ from . import make_eddy_tracker_list_obj as eddy_tracker
 from .py_eddy_tracker_property_classes import Amplitude, EddyProperty, interpolate
 #from haversine import haversine # needs compiling with f2py
 from . import haversine_distmat_python as haversine 
-import scipy.sparse as sparse
 
 
 def datestr2datetime(datestr):
@@ -549,16 +549,429 @@ def get_uavg(Eddy, CS, collind, centlon_e, centlat_e, poly_eff,
                 inner_seglon, inner_seglat, any_inner_contours, all_uavg)
 
 
-def collection_loop(CS, grd, rtime, A_list_obj, C_list_obj,
-                    xi=None, CSxi=None, sign_type='None', VERBOSE=False):
+class ContourEddy(object):
     """
-    Loop over each collection of contours
+    Result of evaluating a single closed contour with evaluate_contour
+
+    Holds the grid indices the evaluation depended on and, if the contour
+    bounds an eddy, its properties together with the bounding box and mask
+    used to mask the eddy out of the field
+    """
+    def __init__(self, centi, centj):
+        # Indices of the centroid as read from the field
+        self.centi, self.centj = centi, centj
+        self.bounds = None
+        self.mask_eff = None
+        self.properties = None
+
+    def depends_on(self, masked):
+        """
+        True if any of the grid points read during the evaluation is
+        set in the boolean array masked
+        """
+        if masked[self.centj, self.centi]:
+            return True
+        if self.bounds is not None:
+            imin, imax, jmin, jmax = self.bounds
+            return masked[jmin:jmax, imin:imax].any()
+        return False
+
+
+def evaluate_contour(Eddy, CS, collind, cont, grd, rtime,
+                     xi=None, CSxi=None, sign_type='None'):
+    """
+    Test if contour cont of collection collind bounds an eddy
+
+    Returns None if the contour is rejected on its geometry alone, otherwise
+    a ContourEddy whose properties are None if the contour is not an eddy.
+    The speed based properties are left to set_speed_properties and
+    masking the eddy out of Eddy.sla (or xi) to mask_contour_eddy
+    """
+    contlon_e, contlat_e = cont.vertices[:, 0].copy(), \
+                           cont.vertices[:, 1].copy()
+
+    # Filter for closed contours
+    if not np.all([contlon_e[0] == contlon_e[-1],
+                   contlat_e[0] == contlat_e[-1],
+                   np.ptp(contlon_e),
+                   np.ptp(contlat_e)]):
+        return None
+
+    # Instantiate new EddyProperty object
+    properties = EddyProperty(TRACK_EXTRA_VARIABLES=
+                              Eddy.TRACK_EXTRA_VARIABLES)
+
+    # Prepare for shape test and get eddy_radius_e
+    #cx, cy = Eddy.M(contlon_e, contlat_e)
+
+    #proj = pyproj.Proj(proj='aeqd', lat_0=contlat_e.mean(), lon_0=contlon_e.mean())#, width=5.e2, height=5.e2)
+    # http://www.geo.hunter.cuny.edu/~jochen/gtech201/lectures/lec6concepts/map%20coordinate%20systems/how%20to%20choose%20a%20projection.htm
+    contlon_e_mean = contlon_e.mean()
+    proj = pyproj.Proj('+proj=aeqd +lat_0=%s +lon_0=%s'
+                       % (contlat_e.mean(), contlon_e_mean))
+    cx, cy = proj(contlon_e, contlat_e)
+    #print '--------------', cx.ptp(), cx.min(), cx.max()
+    centlon_e, centlat_e, eddy_radius_e, aerr = fit_circle(cx, cy)
+
+    aerr = np.atleast_1d(aerr)
+
+    # Filter for shape: >35% (>55%) is not an eddy for Q (SLA)
+    #shape test disabled by Ben
+    #if not (aerr >= 0. and aerr <= Eddy.SHAPE_ERROR[collind]):
+        #return None
+
+    # Get centroid in lon lat
+    centlon_e, centlat_e = proj(centlon_e, centlat_e, inverse=True)
+
+    # Proj makes lons < -180 positive, and vice-versa for +180
+    # FIXME (this is a fix for global grid, but it may cause
+    # problems later for, say, Pacific grids ... need to check)
+    if contlon_e_mean < -180.:
+        centlon_e -= 360.
+    if contlon_e_mean >= 180.:
+        centlon_e += 360.
+
+    # For some reason centlat_e is transformed
+    # by projtran to 'float'...
+    centlon_e, centlat_e = (np.float64(centlon_e),
+                            np.float64(centlat_e))
+
+    # Get eddy_radius_e (NOTE: if Q, we overwrite
+    # eddy_radius_e defined several lines above)
+    if 'Q' in Eddy.DIAGNOSTIC_TYPE:
+        xilon, xilat = CSxi.find_nearest_contour(
+            centlon_e, centlat_e, pixel=False)[3:5]
+        eddy_radius_e = haversine.distance(centlon_e,
+                                           centlat_e,
+                                           xilon, xilat)
+        if (eddy_radius_e >= Eddy.radmin and
+                eddy_radius_e <= Eddy.radmax):
+            proceed0 = True
+        else:
+            proceed0 = False
+
+    elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
+        # If 'SLA' is defined we filter below with pixel count
+        proceed0 = True
+
+    else:
+        raise Exception
+    if not proceed0:
+        return None
+
+    # Get indices of centroid
+    centi, centj = grd.nearest_index(centlon_e, centlat_e)
+
+    result = ContourEddy(centi, centj)
+
+    if 'Q' in Eddy.DIAGNOSTIC_TYPE:
+
+        if xi[centj, centi] != Eddy.FILLVAL:
+            proceed1 = True
+        else:
+            proceed1 = False
+
+    elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
+
+        if Eddy.sla[centj, centi] != Eddy.FILLVAL:
+            acyc_not_cyc = (Eddy.sla[centj, centi] >=
+                            CS.cvalues[collind])
+            if ('Anticyclonic' in sign_type and
+                    acyc_not_cyc):
+                proceed1 = True
+            elif ('Cyclonic' in sign_type and not
+                  acyc_not_cyc):
+                proceed1 = True
+            else:
+                proceed1 = False  # no eddy
+        else:
+            proceed1 = False
+    else:
+        raise Exception
+
+    if not proceed1:
+        return result
+
+    # Set indices to bounding box around eddy
+    Eddy.set_bounds(contlon_e, contlat_e, grd)
+
+    # Unpack indices for convenience
+    imin, imax, jmin, jmax = (Eddy.imin, Eddy.imax,
+                              Eddy.jmin, Eddy.jmax)
+    result.bounds = (imin, imax, jmin, jmax)
+
+    # Set masked points within bounding box around eddy
+    Eddy.set_mask_eff(cont, grd)
+
+    # sum(mask) between 8 and 1000, CSS11 criterion 2
+    if (Eddy.mask_eff_sum >= Eddy.PIXEL_THRESHOLD[0] and
+            Eddy.mask_eff_sum <= Eddy.PIXEL_THRESHOLD[1]):
+
+        Eddy.reshape_mask_eff(grd)
+
+        # Resample the contour points for a more even
+        # circumferential distribution
+        contlon_e, contlat_e = \
+            eddy_tracker.uniform_resample(
+                contlon_e, contlat_e)
+
+        if 'Q' in Eddy.DIAGNOSTIC_TYPE:
+            # Note, eddy amplitude == max(abs(vort/f)) within eddy, KCCMC11
+            #amplitude = np.abs(xi[jmin:jmax,imin:imax].flat[mask_eff]).max()
+            amplitude = np.abs(xi[jmin:jmax,imin:imax][Eddy.mask_eff]).max()
+
+        elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
+
+            # Instantiate Amplitude object
+            amp = Amplitude(contlon_e, contlat_e, Eddy, grd)
+
+            if 'Anticyclonic' in sign_type:
+                reset_centroid = amp.all_pixels_above_h0(
+                                      CS.levels[collind])
+            elif 'Cyclonic' in sign_type:
+                reset_centroid = amp.all_pixels_below_h0(
+                                      CS.levels[collind])
+            else:
+                Exception
+
+            if reset_centroid:
+                centi = reset_centroid[0]
+                centj = reset_centroid[1]
+                centlon_e = grd.lon()[centj, centi]
+                centlat_e = grd.lat()[centj, centi]
+
+            #amp.debug_figure(grd)
+
+            if amp.within_amplitude_limits():
+                properties.amplitude = amp.amplitude
+
+    if not properties.amplitude:
+        return result
+
+    # Get sum of eke within Ceff
+    teke = grd.eke[jmin:jmax, imin:imax][Eddy.mask_eff].sum()
+
+    # Define T and S if needed
+    #if has_ts:
+        ## Temperature at centroid
+        #cent_temp = temp[centj, centi]
+        ## Salinity at centroid
+        #cent_salt = salt[centj, centi]
+
+    properties.eddy_radius_e = eddy_radius_e
+    properties.rtime = rtime
+    properties.teke = teke
+
+    if 'Q' in Eddy.DIAGNOSTIC_TYPE:
+        # Keep what is needed to update the Q eddy properties
+        result.amplitude = amplitude
+        result.xi_index = (centj, centi)
+
+    result.centlon_e, result.centlat_e = centlon_e, centlat_e
+    result.contlon_e, result.contlat_e = contlon_e, contlat_e
+    result.mask_eff = Eddy.mask_eff
+    result.properties = properties
+    return result
+
+
+def set_speed_properties(result, Eddy, CS, collind, cont, grd):
+    """
+    Set the speed based properties of the eddy found by evaluate_contour,
+    these depend on Eddy.uspd but not on Eddy.sla
+    """
+    properties = result.properties
+    centlon_e, centlat_e = result.centlon_e, result.centlat_e
+    contlon_e, contlat_e = result.contlon_e, result.contlat_e
+    eddy_radius_e = properties.eddy_radius_e
+
+    # get_uavg works on the bounding box around the eddy
+    Eddy.imin, Eddy.imax, Eddy.jmin, Eddy.jmax = result.bounds
+
+    if 'Q' in Eddy.DIAGNOSTIC_TYPE:
+        #print 'change to rectbispline'
+        #uavg = interpolate.griddata(points, Eddy.uspd[jmin:jmax,imin:imax].ravel(),
+                                    #(contlon_e, contlat_e), 'linear')
+        #uavg = np.nan_to_num(uavg).max()
+        ##uavg = 0; print 'fix me'
+        ## Get indices of speed-based centroid
+        #centi, centj = eddy_tracker.nearest(centlon_s, centlat_s,
+                                            #grd.lon(), grd.lat(), grd.shape)
+        pass
+
+    elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
+
+        args = (Eddy, CS, collind,
+                centlon_e, centlat_e,
+                cont, grd, eddy_radius_e)
+
+        if not Eddy.TRACK_EXTRA_VARIABLES:
+            #(uavg, centlon_s, centlat_s,
+             #eddy_radius_s, contlon_s, contlat_s,
+             #inner_contlon, inner_contlat) = get_uavg(*args)
+            (uavg, contlon_s, contlat_s,
+             inner_contlon, inner_contlat,
+             any_inner_contours) = get_uavg(*args)
+        else:
+            #(uavg, centlon_s, centlat_s,
+             #eddy_radius_s, contlon_s, contlat_s,
+             #inner_contlon, inner_contlat,
+             #uavg_profile) = get_uavg(*args, save_all_uavg=True)
+            (uavg, contlon_s, contlat_s,
+             inner_contlon, inner_contlat,
+             any_inner_contours, uavg_profile) = get_uavg(
+                 *args, save_all_uavg=True)
+
+        if any_inner_contours:
+            # Use azimuth equal projection for radius
+            inner_contlon_mean = inner_contlon.mean()
+            proj = pyproj.Proj('+proj=aeqd +lat_0=%s +lon_0=%s'
+                            % (inner_contlat.mean(),
+                               inner_contlon_mean))
+
+            # First, get position based on innermost contour
+            cx, cy = proj(inner_contlon, inner_contlat)
+            centx_s, centy_s, _, _ = fit_circle(cx, cy)
+            centlon_s, centlat_s = proj(centx_s, centy_s,
+                                        inverse=True)
+
+            # Proj makes lons < -180 positive, and vice-versa for +180
+            # FIXME (this is a fix for global grid, but it may cause
+            # problems later for, say, Pacific grids ... need to check)
+            if inner_contlon_mean < -180.:
+                centlon_s -= 360.
+            if inner_contlon_mean >= 180.:
+                centlon_s += 360.
+        else:
+            # Projection used for eddy_radius_e
+            proj = pyproj.Proj('+proj=aeqd +lat_0=%s +lon_0=%s'
+                               % (cont.vertices[:, 1].mean(),
+                                  cont.vertices[:, 0].mean()))
+            centlon_s, centlat_s = centlon_e, centlat_e
+
+        # NOTE This can be instructive, there's some strange
+        # things sometimes...
+        #if abs(centlon_s - centlon_e) > 0.25 and not any_inner_contours:
+            #print any_inner_contours
+            #print centlon_s - centlon_e
+            #plt.figure()
+            #plt.plot(contlon_s, contlat_s, '-+g', lw=2)
+            #plt.plot(contlon_e, contlat_e, '-or', alpha=.5)
+            #plt.scatter(centlon_s, centlat_s, s=50, c='g')
+            #plt.scatter(centlon_e, centlat_e, s=50, c='r')
+            #plt.axis('image')
+            #plt.show()
+
+        # Second, get speed-based radius based on
+        # contour of max uavg
+        # (perhaps we could make a new proj here based on
+        #  contlon_s, contlat_s but I'm not sure it's
+        #  that important ... )
+        cx, cy = proj(contlon_s, contlat_s)
+        _, _, eddy_radius_s, _ = fit_circle(cx, cy)
+
+        # See CSS11 section B4
+        properties.centlon = np.copy(centlon_s)
+        properties.centlat = np.copy(centlat_s)
+
+        if Eddy.TRACK_EXTRA_VARIABLES:
+            properties.contour_e = np.concatenate(
+                [contlon_e, contlat_e], axis=0)
+            properties.contour_s = np.concatenate(
+                [contlon_s, contlat_s], axis=0)
+        else:
+            properties.contour_e = None
+            properties.contour_s = None
+            #properties.uavg_profile = None
+
+    properties.eddy_radius_s = eddy_radius_s
+    properties.uavg = uavg
+    return properties
+
+
+def store_contour_eddy(result, rtime, A_list_obj, C_list_obj,
+                       xi=None, sign_type='None', has_ts=False):
+    """
+    Update the eddy properties with the eddy found by evaluate_contour
     """
     if A_list_obj is not None:
         Eddy = A_list_obj
     if C_list_obj is not None:
         Eddy = C_list_obj
 
+    properties = result.properties
+
+    # Update Q eddy properties
+    if 'Q' in Eddy.DIAGNOSTIC_TYPE:
+        # We pass eddy_radius_e as a dummy for eddy_radius_s
+        centlon_e, centlat_e = result.centlon_e, result.centlat_e
+        eddy_radius_e, amplitude = properties.eddy_radius_e, result.amplitude
+        uavg, teke = properties.uavg, properties.teke
+        centj, centi = result.xi_index
+
+        if has_ts:  # for ocean model
+            if xi[centj, centi] <= 0.:  # Anticyclone
+                A_list_obj.update_eddy_properties(centlon_e, centlat_e,
+                                              eddy_radius_e, eddy_radius_e,
+                                              amplitude, uavg, teke, rtime,
+                                              cent_temp=cent_temp,
+                                              cent_salt=cent_salt)
+            elif xi[centj, centi] >= 0.:  # Cyclone
+                C_list_obj.update_eddy_properties(centlon_e, centlat_e,
+                                              eddy_radius_e, eddy_radius_e,
+                                              amplitude, uavg, teke, rtime,
+                                              cent_temp=cent_temp,
+                                              cent_salt=cent_salt)
+        else:  # for AVISO
+            if xi[centj, centi] <= 0.:  # Anticyclone
+                A_list_obj.update_eddy_properties(centlon_e, centlat_e,
+                                              eddy_radius_e, eddy_radius_e,
+                                              amplitude, uavg, teke, rtime,)
+            elif xi[centj, centi] >= 0.:  # Cyclone
+                C_list_obj.update_eddy_properties(centlon_e, centlat_e,
+                                              eddy_radius_e, eddy_radius_e,
+                                              amplitude, uavg, teke, rtime,)
+
+    # Update SLA eddy properties
+    elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
+
+        if has_ts: # for ocean model
+            pass
+            #if 'Anticyclonic' in sign_type:
+                #A_list_obj.update_eddy_properties(centlon, centlat,
+                                                  #eddy_radius_s, eddy_radius_e,
+                                                  #amplitude, uavg, teke, rtime,
+                                                  #cent_temp=cent_temp,
+                                                  #cent_salt=cent_salt)
+            #elif 'Cyclonic' in sign_type:
+                #C_list_obj.update_eddy_properties(centlon, centlat,
+                                                  #eddy_radius_s, eddy_radius_e,
+                                                  #amplitude, uavg, teke, rtime,
+                                                  #cent_temp=cent_temp,
+                                                  #cent_salt=cent_salt)
+        else:  # for AVISO
+
+            if 'Anticyclonic' in sign_type:
+                A_list_obj.update_eddy_properties(properties)
+
+            elif 'Cyclonic' in sign_type:
+                C_list_obj.update_eddy_properties(properties)
+
+            #print '------- updated properties i %s seconds' %(time.time() - tt)
+
+
+def mask_contour_eddy(result, Eddy, xi=None):
+    """
+    Mask out the eddy found by evaluate_contour
+    """
+    imin, imax, jmin, jmax = result.bounds
+    if 'Q' in Eddy.DIAGNOSTIC_TYPE:
+        xi[jmin:jmax, imin:imax].flat[result.mask_eff] = Eddy.FILLVAL
+
+    elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
+        Eddy.sla[jmin:jmax, imin:imax][result.mask_eff] = Eddy.FILLVAL
+
+
+def _has_ts(Eddy):
     if 'ROMS' in Eddy.PRODUCT:
         #has_ts = True
         has_ts = False
@@ -568,9 +981,20 @@ def collection_loop(CS, grd, rtime, A_list_obj, C_list_obj,
         has_ts = False
     else:
         Exception  # unknown PRODUCT
+    return has_ts
 
-    # Unpack indices for convenience
-    istr, iend, jstr, jend = Eddy.i0, Eddy.i1, Eddy.j0, Eddy.j1
+
+def collection_loop(CS, grd, rtime, A_list_obj, C_list_obj,
+                    xi=None, CSxi=None, sign_type='None', VERBOSE=False):
+    """
+    Loop over each collection of contours
+    """
+    if A_list_obj is not None:
+        Eddy = A_list_obj
+    if C_list_obj is not None:
+        Eddy = C_list_obj
+
+    has_ts = _has_ts(Eddy)
 
     # Set contour coordinates and indices for calculation of
     # speed-based radius
@@ -586,341 +1010,18 @@ def collection_loop(CS, grd, rtime, A_list_obj, C_list_obj,
         # Loop over individual CS contours (i.e., every eddy in field)
         for cont in coll.get_paths():
 
-            contlon_e, contlat_e = cont.vertices[:, 0].copy(), \
-                                   cont.vertices[:, 1].copy()
+            result = evaluate_contour(Eddy, CS, collind, cont, grd, rtime,
+                                      xi=xi, CSxi=CSxi, sign_type=sign_type)
 
-            # Filter for closed contours
-            if np.alltrue([contlon_e[0] == contlon_e[-1],
-                           contlat_e[0] == contlat_e[-1],
-                           contlon_e.ptp(),
-                           contlat_e.ptp()]):
+            if result is None or result.properties is None:
+                continue
 
-                # Instantiate new EddyProperty object
-                properties = EddyProperty(TRACK_EXTRA_VARIABLES=
-                                          Eddy.TRACK_EXTRA_VARIABLES)
+            set_speed_properties(result, Eddy, CS, collind, cont, grd)
+            store_contour_eddy(result, rtime, A_list_obj, C_list_obj,
+                               xi=xi, sign_type=sign_type, has_ts=has_ts)
 
-                # Prepare for shape test and get eddy_radius_e
-                #cx, cy = Eddy.M(contlon_e, contlat_e)
-                
-                #proj = pyproj.Proj(proj='aeqd', lat_0=contlat_e.mean(), lon_0=contlon_e.mean())#, width=5.e2, height=5.e2)
-                # http://www.geo.hunter.cuny.edu/~jochen/gtech201/lectures/lec6concepts/map%20coordinate%20systems/how%20to%20choose%20a%20projection.htm
-                contlon_e_mean = contlon_e.mean()
-                proj = pyproj.Proj('+proj=aeqd +lat_0=%s +lon_0=%s'
-                                   % (contlat_e.mean(), contlon_e_mean))
-                cx, cy = proj(contlon_e, contlat_e)
-                #print '--------------', cx.ptp(), cx.min(), cx.max()
-                centlon_e, centlat_e, eddy_radius_e, aerr = fit_circle(cx, cy)
-
-                aerr = np.atleast_1d(aerr)
-
-                # Filter for shape: >35% (>55%) is not an eddy for Q (SLA)
-                if True: #shape test disabled by Ben
-                #if aerr >= 0. and aerr <= Eddy.SHAPE_ERROR[collind]:
-
-                    # Get centroid in lon lat
-                    centlon_e, centlat_e = proj(centlon_e, centlat_e, inverse=True)
-
-                    # Proj makes lons < -180 positive, and vice-versa for +180
-                    # FIXME (this is a fix for global grid, but it may cause
-                    # problems later for, say, Pacific grids ... need to check)
-                    if contlon_e_mean < -180.:
-                        centlon_e -= 360.
-                    if contlon_e_mean >= 180.:
-                        centlon_e += 360.
-                        
-                    # For some reason centlat_e is transformed
-                    # by projtran to 'float'...
-                    centlon_e, centlat_e = (np.float64(centlon_e),
-                                            np.float64(centlat_e))
-
-                    # Get eddy_radius_e (NOTE: if Q, we overwrite
-                    # eddy_radius_e defined several lines above)
-                    if 'Q' in Eddy.DIAGNOSTIC_TYPE:
-                        xilon, xilat = CSxi.find_nearest_contour(
-                            centlon_e, centlat_e, pixel=False)[3:5]
-                        eddy_radius_e = haversine.distance(centlon_e,
-                                                           centlat_e,
-                                                           xilon, xilat)
-                        if (eddy_radius_e >= Eddy.radmin and
-                                eddy_radius_e <= Eddy.radmax):
-                            proceed0 = True
-                        else:
-                            proceed0 = False
-
-                    elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
-                        # If 'SLA' is defined we filter below with pixel count
-                        proceed0 = True
-
-                    else:
-                        raise Exception
-                    if proceed0:
-
-                        # Get indices of centroid
-                        centi, centj = eddy_tracker.nearest(
-                            centlon_e, centlat_e,
-                            grd.lon(), grd.lat(), grd.shape)
-
-                        if 'Q' in Eddy.DIAGNOSTIC_TYPE:
-
-                            if xi[centj, centi] != Eddy.FILLVAL:
-                                proceed1 = True
-                            else:
-                                proceed1 = False
-
-                        elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
-
-                            if Eddy.sla[centj, centi] != Eddy.FILLVAL:
-                                acyc_not_cyc = (Eddy.sla[centj, centi] >=
-                                                CS.cvalues[collind])
-                                if ('Anticyclonic' in sign_type and
-                                        acyc_not_cyc):
-                                    proceed1 = True
-                                elif ('Cyclonic' in sign_type and not
-                                      acyc_not_cyc):
-                                    proceed1 = True
-                                else:
-                                    proceed1 = False  # no eddy
-                            else:
-                                proceed1 = False
-                        else:
-                            raise Exception
-
-                        if proceed1:
-
-                            # Set indices to bounding box around eddy
-                            Eddy.set_bounds(contlon_e, contlat_e, grd)
-
-                            # Unpack indices for convenience
-                            imin, imax, jmin, jmax = (Eddy.imin, Eddy.imax,
-                                                      Eddy.jmin, Eddy.jmax)
-
-                            # Set masked points within bounding box around eddy
-                            Eddy.set_mask_eff(cont, grd)
-
-                            # sum(mask) between 8 and 1000, CSS11 criterion 2
-                            if (Eddy.mask_eff_sum >= Eddy.PIXEL_THRESHOLD[0] and
-                                    Eddy.mask_eff_sum <= Eddy.PIXEL_THRESHOLD[1]):
-
-                                Eddy.reshape_mask_eff(grd)
-
-                                # Resample the contour points for a more even
-                                # circumferential distribution
-                                contlon_e, contlat_e = \
-                                    eddy_tracker.uniform_resample(
-                                        contlon_e, contlat_e)
-
-                                if 'Q' in Eddy.DIAGNOSTIC_TYPE:
-                                    # Note, eddy amplitude == max(abs(vort/f)) within eddy, KCCMC11
-                                    #amplitude = np.abs(xi[jmin:jmax,imin:imax].flat[mask_eff]).max()
-                                    amplitude = np.abs(xi[jmin:jmax,imin:imax][Eddy.mask_eff]).max()
-
-                                elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
-
-                                    # Instantiate Amplitude object
-                                    amp = Amplitude(contlon_e, contlat_e, Eddy, grd)
-
-                                    if 'Anticyclonic' in sign_type:
-                                        reset_centroid = amp.all_pixels_above_h0(
-                                                              CS.levels[collind])
-                                    elif 'Cyclonic' in sign_type:
-                                        reset_centroid = amp.all_pixels_below_h0(
-                                                              CS.levels[collind])
-                                    else:
-                                        Exception
-
-                                    if reset_centroid:
-                                        centi = reset_centroid[0]
-                                        centj = reset_centroid[1]
-                                        centlon_e = grd.lon()[centj, centi]
-                                        centlat_e = grd.lat()[centj, centi]
-
-                                    #amp.debug_figure(grd)
-
-                                    if amp.within_amplitude_limits():
-                                        properties.amplitude = amp.amplitude
-
-                            if properties.amplitude:
-
-                                # Get sum of eke within Ceff
-                                teke = grd.eke[jmin:jmax, imin:imax][Eddy.mask_eff].sum()
-
-                                if 'Q' in Eddy.DIAGNOSTIC_TYPE:
-                                    #print 'change to rectbispline'
-                                    #uavg = interpolate.griddata(points, Eddy.uspd[jmin:jmax,imin:imax].ravel(),
-                                                                #(contlon_e, contlat_e), 'linear')
-                                    #uavg = np.nan_to_num(uavg).max()
-                                    ##uavg = 0; print 'fix me'
-                                    ## Get indices of speed-based centroid
-                                    #centi, centj = eddy_tracker.nearest(centlon_s, centlat_s,
-                                                                        #grd.lon(), grd.lat(), grd.shape)
-                                    pass
-
-                                elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
-
-                                    args = (Eddy, CS, collind,
-                                            centlon_e, centlat_e,
-                                            cont, grd, eddy_radius_e)
-
-                                    if not Eddy.TRACK_EXTRA_VARIABLES:
-                                        #(uavg, centlon_s, centlat_s,
-                                         #eddy_radius_s, contlon_s, contlat_s,
-                                         #inner_contlon, inner_contlat) = get_uavg(*args)
-                                        (uavg, contlon_s, contlat_s,
-                                         inner_contlon, inner_contlat,
-                                         any_inner_contours) = get_uavg(*args)
-                                    else:
-                                        #(uavg, centlon_s, centlat_s,
-                                         #eddy_radius_s, contlon_s, contlat_s,
-                                         #inner_contlon, inner_contlat,
-                                         #uavg_profile) = get_uavg(*args, save_all_uavg=True)
-                                        (uavg, contlon_s, contlat_s,
-                                         inner_contlon, inner_contlat,
-                                         any_inner_contours, uavg_profile) = get_uavg(
-                                             *args, save_all_uavg=True)
-
-                                    if any_inner_contours:
-                                        # Use azimuth equal projection for radius
-                                        inner_contlon_mean = inner_contlon.mean()
-                                        proj = pyproj.Proj('+proj=aeqd +lat_0=%s +lon_0=%s'
-                                                        % (inner_contlat.mean(),
-                                                           inner_contlon_mean))
-                                        
-                                        # First, get position based on innermost contour
-                                        cx, cy = proj(inner_contlon, inner_contlat)
-                                        centx_s, centy_s, _, _ = fit_circle(cx, cy)
-                                        centlon_s, centlat_s = proj(centx_s, centy_s,
-                                                                    inverse=True)
-                                        
-                                        # Proj makes lons < -180 positive, and vice-versa for +180
-                                        # FIXME (this is a fix for global grid, but it may cause
-                                        # problems later for, say, Pacific grids ... need to check)
-                                        if inner_contlon_mean < -180.:
-                                            centlon_s -= 360.
-                                        if inner_contlon_mean >= 180.:
-                                            centlon_s += 360.
-                                    else:
-                                        centlon_s, centlat_s = centlon_e, centlat_e
-
-                                    # NOTE This can be instructive, there's some strange
-                                    # things sometimes...
-                                    #if abs(centlon_s - centlon_e) > 0.25 and not any_inner_contours:
-                                        #print any_inner_contours
-                                        #print centlon_s - centlon_e
-                                        #plt.figure()
-                                        #plt.plot(contlon_s, contlat_s, '-+g', lw=2)
-                                        #plt.plot(contlon_e, contlat_e, '-or', alpha=.5)
-                                        #plt.scatter(centlon_s, centlat_s, s=50, c='g')
-                                        #plt.scatter(centlon_e, centlat_e, s=50, c='r')
-                                        #plt.axis('image')
-                                        #plt.show()
-                                    
-                                    # Second, get speed-based radius based on
-                                    # contour of max uavg
-                                    # (perhaps we could make a new proj here based on
-                                    #  contlon_s, contlat_s but I'm not sure it's
-                                    #  that important ... )
-                                    cx, cy = proj(contlon_s, contlat_s)
-                                    _, _, eddy_radius_s, _ = fit_circle(cx, cy)
-
-                                # Define T and S if needed
-                                #if has_ts:
-                                    ## Temperature at centroid
-                                    #cent_temp = temp[centj, centi]
-                                    ## Salinity at centroid
-                                    #cent_salt = salt[centj, centi]
-
-                                properties.eddy_radius_s = eddy_radius_s
-                                properties.uavg = uavg
-                                properties.eddy_radius_e = eddy_radius_e
-                                properties.rtime = rtime
-                                properties.teke = teke
-
-                                # Update Q eddy properties
-                                if 'Q' in Eddy.DIAGNOSTIC_TYPE:
-                                    # We pass eddy_radius_e as a dummy for eddy_radius_s
-
-                                    if has_ts:  # for ocean model
-                                        if xi[centj, centi] <= 0.:  # Anticyclone
-                                            A_list_obj.update_eddy_properties(centlon_e, centlat_e,
-                                                                          eddy_radius_e, eddy_radius_e,
-                                                                          amplitude, uavg, teke, rtime,
-                                                                          cent_temp=cent_temp,
-                                                                          cent_salt=cent_salt)
-                                        elif xi[centj, centi] >= 0.:  # Cyclone
-                                            C_list_obj.update_eddy_properties(centlon_e, centlat_e,
-                                                                          eddy_radius_e, eddy_radius_e,
-                                                                          amplitude, uavg, teke, rtime,
-                                                                          cent_temp=cent_temp,
-                                                                          cent_salt=cent_salt)
-                                    else:  # for AVISO
-                                        if xi[centj, centi] <= 0.:  # Anticyclone
-                                            A_list_obj.update_eddy_properties(centlon_e, centlat_e,
-                                                                          eddy_radius_e, eddy_radius_e,
-                                                                          amplitude, uavg, teke, rtime,)
-                                        elif xi[centj, centi] >= 0.:  # Cyclone
-                                            C_list_obj.update_eddy_properties(centlon_e, centlat_e,
-                                                                          eddy_radius_e, eddy_radius_e,
-                                                                          amplitude, uavg, teke, rtime,)
-
-                                # Update SLA eddy properties
-                                elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
-
-                                    # See CSS11 section B4
-                                    properties.centlon = np.copy(centlon_s)
-                                    properties.centlat = np.copy(centlat_s)
-
-                                    if has_ts: # for ocean model
-                                        pass
-                                        #if 'Anticyclonic' in sign_type:
-                                            #A_list_obj.update_eddy_properties(centlon, centlat,
-                                                                              #eddy_radius_s, eddy_radius_e,
-                                                                              #amplitude, uavg, teke, rtime,
-                                                                              #cent_temp=cent_temp,
-                                                                              #cent_salt=cent_salt)
-                                        #elif 'Cyclonic' in sign_type:
-                                            #C_list_obj.update_eddy_properties(centlon, centlat,
-                                                                              #eddy_radius_s, eddy_radius_e,
-                                                                              #amplitude, uavg, teke, rtime,
-                                                                              #cent_temp=cent_temp,
-                                                                              #cent_salt=cent_salt)
-                                    else:  # for AVISO
-
-                                        if 'Anticyclonic' in sign_type:
-
-                                            if A_list_obj.TRACK_EXTRA_VARIABLES:
-                                                properties.contour_e = np.concatenate(
-                                                    [contlon_e, contlat_e], axis=0)
-                                                properties.contour_s = np.concatenate(
-                                                    [contlon_s, contlat_s], axis=0)
-                                            else:
-                                                properties.contour_e = None
-                                                properties.contour_s = None
-                                                #properties.uavg_profile = None
-
-                                            A_list_obj.update_eddy_properties(properties)
-
-                                        elif 'Cyclonic' in sign_type:
-
-                                            if C_list_obj.TRACK_EXTRA_VARIABLES:
-                                                properties.contour_e = np.concatenate(
-                                                    [contlon_e, contlat_e], axis=0)
-                                                properties.contour_s = np.concatenate(
-                                                    [contlon_s, contlat_s], axis=0)
-                                            else:
-                                                properties.contour_e = None
-                                                properties.contour_s = None
-                                                #properties.uavg_profile = None
-
-                                            C_list_obj.update_eddy_properties(properties)
-
-                                        #print '------- updated properties i %s seconds' %(time.time() - tt)
-
-                                # Mask out already found eddies
-                                if 'Q' in Eddy.DIAGNOSTIC_TYPE:
-                                    xi[jmin:jmax, imin:imax].flat[mask_eff] = Eddy.FILLVAL
-
-                                elif 'SLA' in Eddy.DIAGNOSTIC_TYPE:
-                                    Eddy.sla[jmin:jmax, imin:imax][Eddy.mask_eff] = Eddy.FILLVAL
+            # Mask out already found eddies
+            mask_contour_eddy(result, Eddy, xi=xi)
 
     # Leave collection_loop
     if 'SLA' in Eddy.DIAGNOSTIC_TYPE:
@@ -932,11 +1033,147 @@ def collection_loop(CS, grd, rtime, A_list_obj, C_list_obj,
         return A_list_obj, C_list_obj
 
 
+# Passes shared with the forked workers of collection_loops
+_loop_state = None
+
+
+def _evaluate_contours(tasks):
+    """
+    Evaluate a chunk of (passind, collind, pathind) contours
+    """
+    passes, grd, rtime = _loop_state
+    results = []
+    for passind, collind, pathind in tasks:
+        CS, Eddy, sign_type = passes[passind]
+        cont = CS.collections[collind].get_paths()[pathind]
+        results.append(evaluate_contour(Eddy, CS, collind, cont, grd, rtime,
+                                        sign_type=sign_type))
+    return results
+
+
+def _speed_properties(tasks):
+    """
+    Set the speed based properties for a chunk of
+    (passind, collind, pathind, result) eddies
+    """
+    passes, grd, rtime = _loop_state
+    results = []
+    for passind, collind, pathind, result in tasks:
+        CS, Eddy, sign_type = passes[passind]
+        cont = CS.collections[collind].get_paths()[pathind]
+        results.append(set_speed_properties(result, Eddy, CS, collind,
+                                            cont, grd))
+    return results
+
+
+def _chunked_map(function, pool, tasks, chunksize):
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+    if pool is None:
+        results = map(function, chunks)
+    else:
+        results = pool.map(function, chunks, 1)
+    return [result for chunk in results for result in chunk]
+
+
+def collection_loops(passes, grd, rtime, processes=None, chunksize=16,
+                     VERBOSE=False):
+    """
+    Loop over the collections of several SLA passes in parallel
+
+    passes is a list of (CS, A_list_obj, C_list_obj, sign_type), e.g. the
+    anticyclonic and the cyclonic pass over one snapshot; all their contours
+    share one pool of processes (os.cpu_count() if processes is None).
+    The eddies found are the same as with collection_loop:
+
+    1. every contour is evaluated in parallel against the unmasked field
+    2. the results are merged in the order of collection_loop, a contour
+       depending on grid points masked out by an eddy found before it
+       is evaluated again
+    3. the speed based properties are set in parallel for the eddies found
+
+    The workers are forked so they inherit the passes and grid instead of
+    receiving them pickled; without fork everything runs in this process.
+    Returns the list objects of the passes.
+    """
+    global _loop_state
+
+    state = []
+    for CS, A_list_obj, C_list_obj, sign_type in passes:
+        Eddy = A_list_obj if C_list_obj is None else C_list_obj
+        if 'SLA' not in Eddy.DIAGNOSTIC_TYPE:
+            raise Exception("collection_loops only supports SLA")
+        state.append((CS, Eddy, sign_type))
+
+    tasks = [(passind, collind, pathind)
+             for passind, (CS, Eddy, sign_type) in enumerate(state)
+             for collind, coll in enumerate(CS.collections)
+             for pathind in range(len(coll.get_paths()))]
+
+    _loop_state = (state, grd, rtime)
+    pool = None
+    try:
+        if (processes != 1 and
+                'fork' in multiprocessing.get_all_start_methods()):
+            pool = multiprocessing.get_context('fork').Pool(processes)
+
+        evaluated = dict(zip(tasks, _chunked_map(_evaluate_contours, pool,
+                                                 tasks, chunksize)))
+
+        found = []
+        for passind, (CS, Eddy, sign_type) in enumerate(state):
+            # Grid points masked out during this pass
+            masked = np.zeros(Eddy.sla.shape, dtype=bool)
+
+            for collind, coll in enumerate(CS.collections):
+
+                if VERBOSE:
+                    message = '------ doing collection %s, contour value %s'
+                    print(message % (collind, CS.cvalues[collind]))
+
+                for pathind, cont in enumerate(coll.get_paths()):
+                    result = evaluated[passind, collind, pathind]
+
+                    if result is not None and result.depends_on(masked):
+                        if Eddy.sla[result.centj, result.centi] == Eddy.FILLVAL:
+                            # Centroid is within an eddy found before
+                            continue
+                        result = evaluate_contour(Eddy, CS, collind, cont,
+                                                  grd, rtime,
+                                                  sign_type=sign_type)
+
+                    if result is None or result.properties is None:
+                        continue
+
+                    found.append((passind, collind, pathind, result))
+
+                    # Mask out already found eddies
+                    mask_contour_eddy(result, Eddy)
+                    imin, imax, jmin, jmax = result.bounds
+                    masked[jmin:jmax, imin:imax][result.mask_eff] = True
+
+        properties = _chunked_map(_speed_properties, pool, found,
+                                  max(1, chunksize // 4))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _loop_state = None
+
+    for (passind, collind, pathind, result), props in zip(found, properties):
+        CS, A_list_obj, C_list_obj, sign_type = passes[passind]
+        Eddy = state[passind][1]
+        result.properties = props
+        store_contour_eddy(result, rtime, A_list_obj, C_list_obj,
+                           sign_type=sign_type, has_ts=_has_ts(Eddy))
+
+    return [Eddy for CS, Eddy, sign_type in state]
+
+
 def track_eddies(Eddy, first_record):
     """
-    Track the eddies. First a distance matrix is calculated between
-    all new and old eddies. Then loop through each old eddy, sorting the
-    distances, and selecting that/those within range.
+    Track the eddies. First the pairs of new and old eddies within
+    200 km of each other are found. Then loop through each old eddy, sorting
+    the distances, and selecting that/those within range.
     """
     DIST0 = Eddy.DIST0
     AMP0 = Eddy.AMP0
@@ -947,49 +1184,29 @@ def track_eddies(Eddy, first_record):
     # True to debug
     debug_dist = False
 
-    far_away = 1e9
-
     # We will need these in M for ellipse method below
     old_x, old_y = Eddy.M(np.array(Eddy.old_lon), np.array(Eddy.old_lat))
     new_x, new_y = Eddy.M(np.array(Eddy.new_lon_tmp),
                           np.array(Eddy.new_lat_tmp))
 
-    #X_old = np.asfortranarray([Eddy.old_lon, Eddy.old_lat]).T
     X_old = np.asarray([Eddy.old_lon, Eddy.old_lat])
-    #X_new = np.asfortranarray([Eddy.new_lon_tmp, Eddy.new_lat_tmp]).T
     X_new = np.asarray([Eddy.new_lon_tmp, Eddy.new_lat_tmp])
 
-    # Use haversine distance for distance matrix between every old and new eddy
-    #dist_mat = np.empty((X_old.shape[0], X_new.shape[0]), order='F')
-
     if first_record:
         # At first time step k and k+1 eddies are at the same places,
-        # therefore move X_old a small distance away in preparation
-        # for sparse matrix below.
+        # therefore move X_old a small distance away
         X_old += 0.01
 
-    #haversine.distance_matrix(X_old, X_new, dist_mat)
-    dist_mat = haversine.distance_matrix(X_old, X_new)
-    #dist_mat = np.ascontiguousarray(dist_mat)
-    
-    dist_mat_copy = dist_mat.copy()
-
-    #if np.any(dist_mat < 0): aaaaaaaaaaa
-    # Prepare distance matrix for sparse operation
+    # Use a KD-tree radius query for the pairs of old and new eddies
+    # within 200 km, with their haversine distances, rather than
+    # a dense distance matrix between every old and new eddy
     # NOTE: need to find optimal (+dynamic) choice of filter here
-    dist_mat[dist_mat > 200000.] = 0
-    
-
-    # Use a coordinate format (COO) sparse matrix
-    # https://scipy-lectures.github.io/advanced/scipy_sparse/coo_matrix.html
-    sparse_mat = sparse.coo_matrix((dist_mat))
-    old_sparse_inds = sparse_mat.row
-    new_sparse_inds = sparse_mat.col
-
-    #print "old_sparse_inds=", old_sparse_inds
-    #print "new_sparse_inds=", new_sparse_inds
-
+    old_sparse_inds, new_sparse_inds, sparse_dist = haversine.distance_pairs(
+        X_old, X_new, 200000.)
 
+    # Pairs are sorted on the old eddy, split them per old eddy
+    old_inds, first_pair = np.unique(old_sparse_inds, return_index=True)
+    last_pair = np.append(first_pair[1:], old_sparse_inds.size)
 
     # *new_eddy_inds* contains indices to every newly identified eddy
     # that are initially set to True on the assumption that it is a new
@@ -999,8 +1216,23 @@ def track_eddies(Eddy, first_record):
     new_eddy_inds = np.ones_like(new_x, dtype=bool)
     new_eddy = False
 
+    # Make the ellipses at the old eddy locations (See CSS11 sec. B4,
+    # pg. 208) and test all candidate pairs against them at once
+    if 'ellipse' in Eddy.SEPARATION_METHOD:
+        rw_c_mod, semi_east, semi_west, semi_n_s = \
+            Eddy.search_ellipse.get_search_ellipses(old_x[old_inds],
+                                                    old_y[old_inds])
+        pair_ellipse = np.repeat(np.arange(old_inds.size),
+                                 last_pair - first_pair)
+        within_ellipse = Eddy.search_ellipse.in_search_ellipses(
+            old_x[old_sparse_inds], old_y[old_sparse_inds],
+            new_x[new_sparse_inds], new_y[new_sparse_inds],
+            semi_east[pair_ellipse], semi_west[pair_ellipse],
+            semi_n_s[pair_ellipse])
+
     # Loop over the old eddies looking for active eddies
-    for old_ind in old_sparse_inds:
+    for ellipse_ind, (old_ind, pair0, pair1) in enumerate(
+            zip(old_inds, first_pair, last_pair)):
 
         dist_arr = np.array([])
         new_ln, new_lt, new_rd_s, new_rd_e, new_am, \
@@ -1012,50 +1244,25 @@ def track_eddies(Eddy, first_record):
         new_cntr_e, new_cntr_s = [], []
         new_shp_err = np.array([])
 
-        #new_inds, backup_ind, backup_dist = np.array([], dtype=np.int16), \
-                                            #np.array([], dtype=np.int16), \
-                                            #np.array([])
         backup_ind = np.array([], dtype=np.int16)
-        
-        if debug_dist:
-            debug_distmax = 5e6
-            debug_cmap = plt.cm.Set3
-
-            fig = plt.figure(225)
-            #plt.clf()
-            debug_ax = fig.add_subplot(131)
-            #im = plt.imshow(dist_mat_copy, interpolation='none',
-            #                origin='lower', cmap=debug_cmap)
-            im = plt.matshow(dist_mat_copy,
-                            origin='lower', cmap=debug_cmap)
-            im.cmap.set_over('k')
-            im.set_clim(0, debug_distmax)
-            plt.colorbar()
-            plt.xlabel('new')
-            plt.ylabel('old')
-            plt.title('original')
-            plt.show()
-
-        # Make an ellipse at current old_eddy location
-        # (See CSS11 sec. B4, pg. 208)
+
         if 'ellipse' in Eddy.SEPARATION_METHOD:
-            
-            Eddy.search_ellipse.set_search_ellipse(old_x[old_ind],
-                                                   old_y[old_ind])
-            #Eddy.search_ellipse.view_search_ellipse(Eddy)
+            search_dist = rw_c_mod[ellipse_ind]
+        else:
+            search_dist = Eddy.search_ellipse.rw_c_mod
 
         # Loop over separation distances between old and new
-        #for new_ind, new_dist in enumerate(dist_mat[old_ind]):
-        for new_ind in new_sparse_inds:
-            
-            new_dist = dist_mat[old_ind, new_ind]
+        for pair in range(pair0, pair1):
+
+            new_ind = new_sparse_inds[pair]
+            new_dist = sparse_dist[pair]
             within_range = False
 
-            if new_dist < Eddy.search_ellipse.rw_c_mod: #far_away:
+            # Skip new eddies already assigned to an old eddy
+            if new_eddy_inds[new_ind] and new_dist < search_dist:
 
                 if 'ellipse' in Eddy.SEPARATION_METHOD:
-                    within_range = Eddy.search_ellipse.ellipse_path.contains_point(
-                                            (new_x[new_ind], new_y[new_ind]))
+                    within_range = within_ellipse[pair]
                 elif 'sum_radii' in Eddy.SEPARATION_METHOD:
                     sep_dist = Eddy.new_radii_tmp_e[new_ind]
                     sep_dist += Eddy.old_radii_e[old_ind]
@@ -1098,8 +1305,6 @@ def track_eddies(Eddy, first_record):
                 #new_eddy_inds[np.nonzero(Eddy.new_lon_tmp ==
                                             #Eddy.new_lon_tmp[new_ind])] = False
                 new_eddy_inds[new_ind] = False
-                
-                dist_mat[:, new_ind] = far_away # km
                     
         if Eddy.TRACK_EXTRA_VARIABLES:
             #kwargs = {'contour_e': new_cntr_e, 'contour_s': new_cntr_s,
@@ -1195,40 +1400,14 @@ def track_eddies(Eddy, first_record):
 
             Eddy = accounting(*args, **kwargs)
 
-            if debug_dist:
-                debug_ax = fig.add_subplot(132)
-                im = plt.imshow(dist_mat, interpolation='none',
-                                origin='lower', cmap=debug_cmap)
-                im.cmap.set_over('k')
-                im.set_clim(0, debug_distmax)
-                plt.axis('image')
-                plt.colorbar()
-                plt.xlabel('new')
-                plt.ylabel('old')
-                plt.title('before')
-
-            # Use backup_ind to reinsert distances into dist_mat for the unused eddy/eddies
+            # Use backup_ind to release the unused eddy/eddies for other old eddies
             for bind in backup_ind[dx_unused]:
-                dist_mat[:, bind] = dist_mat_copy[:, bind]
                 new_eddy_inds[bind] = True
 
             if debug_dist:
                 print('backup_ind', backup_ind)
                 print('backup_ind[dx_unused]', backup_ind[dx_unused])
                 print('backup_ind[dx_unused].shape', backup_ind[dx_unused].shape)
-                debug_ax = fig.add_subplot(133)
-                im = plt.imshow(dist_mat, interpolation='none',
-                                origin='lower', cmap=debug_cmap)
-                im.cmap.set_over('k')
-                im.set_clim(0, debug_distmax)
-                plt.axis('image')
-                plt.colorbar()
-                plt.xlabel('new')
-                plt.ylabel('old')
-                plt.title('after')
-                plt.tight_layout()
-                plt.show()
-                plt.close(225)
 
     # Finished looping over old eddy tracks
 
@@ -289,7 +289,7 @@ class Amplitude (object):
         background = (arr == 0)
         eroded_background = nd.morphology.binary_erosion(
             background, structure=neighborhood, border_value=1)
-        detected_minima -= eroded_background
+        detected_minima ^= eroded_background
         self.local_extrema_inds = detected_minima
         self.local_extrema = detected_minima.sum()
         return self
@@ -349,7 +349,7 @@ class SwirlSpeed(object):
     
     Attributes:
       contour:
-        A matplotlib contour object of high-pass filtered SLA
+        A contour set (see contours.find_contours) of high-pass filtered SLA
         
       eddy:
         A tracklist object holding the SLA data
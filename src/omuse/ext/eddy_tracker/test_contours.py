@@ -0,0 +1,76 @@
+import numpy as np
+
+from amuse.test.amusetest import TestCase
+
+from omuse.ext.eddy_tracker.contours import find_contours
+
+
+def curvilinear_field(ny=40, nx=50, seed=7):
+    """
+    A field of positive and negative bumps on a sheared and curved grid,
+    with a masked block and scattered masked points
+    """
+    random = np.random.RandomState(seed)
+    j, i = np.indices((ny, nx), dtype=np.float64)
+    x = i + 0.3 * j + 0.05 * j ** 1.5
+    y = j + 0.1 * np.sin(i / 5.)
+    z = np.zeros((ny, nx))
+    for k in range(12):
+        x0, y0 = random.uniform(0., nx), random.uniform(0., ny)
+        z += random.uniform(-1., 1.) * np.exp(-((i - x0) ** 2 + (j - y0) ** 2) / random.uniform(4., 30.))
+    mask = np.zeros(z.shape, dtype=bool)
+    mask[5:12, 30:38] = True
+    mask[random.randint(0, ny, 15), random.randint(0, nx, 15)] = True
+    return x, y, np.ma.masked_array(z, mask=mask)
+
+
+def canonical(vertices):
+    """
+    A contour line as a tuple of rounded vertices, with closed lines
+    starting at their smallest vertex, and whether it is closed
+    """
+    v = [tuple(p) for p in np.round(vertices, 9)]
+    closed = len(v) > 2 and v[0] == v[-1]
+    if closed:
+        v = v[:-1]
+        start = v.index(min(v))
+        v = v[start:] + v[:start]
+    return tuple(v), closed
+
+
+class TestFindContours(TestCase):
+
+    def setUp(self):
+        self.x, self.y, self.z = curvilinear_field()
+        self.levels = np.linspace(-0.8, 0.8, 17)
+
+    def test1(self):
+        """ test that marching squares gives the same lines as contourpy """
+        ms = find_contours(self.x, self.y, self.z, self.levels, backend='marching_squares')
+        cp = find_contours(self.x, self.y, self.z, self.levels, backend='contourpy')
+        self.assertEqual(list(ms.levels), list(cp.levels))
+        nclosed = nopen = 0
+        for level, a, b in zip(self.levels, ms.vertices, cp.vertices):
+            lines_a = sorted(canonical(v) for v in a)
+            lines_b = sorted(canonical(v) for v in b)
+            self.assertEqual(lines_a, lines_b)
+            nclosed += sum(1 for line, closed in lines_a if closed)
+            nopen += sum(1 for line, closed in lines_a if not closed)
+        self.assertTrue(nclosed > 10 and nopen > 10)
+
+    def test2(self):
+        """ test select and the paths of the collections for both backends """
+        levels = [self.levels[12], self.levels[3], self.levels[8]]
+        selected = [find_contours(self.x, self.y, self.z, self.levels, backend=backend).select(levels)
+                    for backend in ['marching_squares', 'contourpy']]
+        for cs in selected:
+            self.assertEqual(list(cs.levels), levels)
+            self.assertEqual(list(cs.cvalues), levels)
+            for collection, vertices in zip(cs.collections, cs.vertices):
+                paths = collection.get_paths()
+                self.assertEqual(len(paths), len(vertices))
+                for path, v in zip(paths, vertices):
+                    self.assertTrue(np.array_equal(path.vertices, v))
+        for a, b in zip(selected[0].vertices, selected[1].vertices):
+            self.assertEqual(sorted(canonical(v) for v in a), sorted(canonical(v) for v in b))
+        self.assertRaises(Exception, selected[0].select, [0.123])
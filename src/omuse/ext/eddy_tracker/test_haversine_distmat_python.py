@@ -0,0 +1,43 @@
+import numpy as np
+
+from amuse.test.amusetest import TestCase
+
+from omuse.ext.eddy_tracker import haversine_distmat_python as haversine
+
+
+class TestDistancePairs(TestCase):
+
+    def random_points(self, random, n):
+        # cluster some points around the dateline and a pole
+        lon = np.concatenate((random.uniform(-180., 180., n), random.uniform(179., 181., n // 4)))
+        lat = np.concatenate((random.uniform(-80., 80., n), random.uniform(88., 90., n // 4)))
+        return np.array([lon, lat])
+
+    def test1(self):
+        """ test that distance_pairs matches the thresholded distance_matrix """
+        random = np.random.RandomState(3)
+        for radius in [1e5, 5e5, 2e6]:
+            xa = self.random_points(random, 200)
+            xb = self.random_points(random, 150)
+            ia, ib, dist = haversine.distance_pairs(xa, xb, radius)
+
+            matrix = haversine.distance_matrix(xa, xb)
+            ja, jb = np.nonzero(matrix <= radius)
+            self.assertTrue(len(ja) > 0)
+            self.assertEqual(list(ia), list(ja))
+            self.assertEqual(list(ib), list(jb))
+            self.assertAlmostRelativeEqual(dist, matrix[ja, jb], 14)
+
+    def test2(self):
+        """ test empty inputs and the distance at the radius """
+        empty = np.zeros((2, 0))
+        points = np.array([[0., 1.], [0., 0.]])
+        for xa, xb in [(empty, points), (points, empty)]:
+            ia, ib, dist = haversine.distance_pairs(xa, xb, 1e6)
+            self.assertEqual((len(ia), len(ib), len(dist)), (0, 0, 0))
+
+        d = haversine.distance_matrix(points, points)[0, 1]
+        ia, ib, dist = haversine.distance_pairs(points, points, d)
+        self.assertEqual(list(zip(ia, ib)), [(0, 0), (0, 1), (1, 0), (1, 1)])
+        ia, ib, dist = haversine.distance_pairs(points, points, 0.999 * d)
+        self.assertEqual(list(zip(ia, ib)), [(0, 0), (1, 1)])
@@ -0,0 +1,301 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from netCDF4 import Dataset
+
+from amuse.test.amusetest import TestCase
+
+from omuse.ext.eddy_tracker.make_eddy_tracker_list_obj import SearchEllipse, TrackList, \
+    _pack_ragged, _unpack_ragged
+
+RW_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'rossrad.dat')
+
+
+class Equirectangular (object):
+    """
+    Projection with the call signature of a Basemap instance
+    """
+    def __init__(self, earth_radius, lat_ts=30.):
+        self.xscale = earth_radius * np.pi / 180. * np.cos(np.radians(lat_ts))
+        self.yscale = earth_radius * np.pi / 180.
+
+    def __call__(self, lon, lat):
+        return np.asarray(lon) * self.xscale, np.asarray(lat) * self.yscale
+
+    def projtran(self, x, y, inverse=False):
+        assert inverse
+        return np.asarray(x) / self.xscale, np.asarray(y) / self.yscale
+
+
+class Grid (object):
+    """
+    The attributes of an AvisoGrid used by SearchEllipse and TrackList
+    """
+    def __init__(self, lonmin=-40., lonmax=-10., latmin=20., latmax=40.):
+        self.EARTH_RADIUS = 6371315.
+        self.M = Equirectangular(self.EARTH_RADIUS)
+        self.ZERO_CROSSING = False
+        self.LONMIN, self.LONMAX = lonmin, lonmax
+        self.LATMIN, self.LATMAX = latmin, latmax
+        self.PRODUCT = 'Generic'
+        self.FILLVAL = -9999.
+        self.i0, self.i1, self.j0, self.j1 = 0, 31, 0, 21
+        self._lon, self._lat = np.meshgrid(np.linspace(lonmin, lonmax, 31),
+                                           np.linspace(latmin, latmax, 21))
+
+    def lon(self):
+        return self._lon
+
+    def lat(self):
+        return self._lat
+
+
+class TestSearchEllipse(TestCase):
+
+    def check_ellipses(self, THE_DOMAIN, days):
+        grd = Grid()
+        ellipse = SearchEllipse(THE_DOMAIN, grd, days, RW_PATH=RW_PATH)
+        random = np.random.RandomState(5)
+        lon = random.uniform(grd.LONMIN + 2., grd.LONMAX - 2., 20)
+        lat = random.uniform(grd.LATMIN + 2., grd.LATMAX - 2., 20)
+        xpt, ypt = grd.M(lon, lat)
+        rw_c_mod, semi_east, semi_west, semi_n_s = ellipse.get_search_ellipses(xpt, ypt)
+
+        compared = 0
+        for i in range(len(xpt)):
+            ellipse.set_search_ellipse(xpt[i], ypt[i])
+            self.assertAlmostRelativeEqual(rw_c_mod[i], ellipse.rw_c_mod[0], 12)
+
+            extent = 1.5 * max(semi_east[i], semi_west[i], semi_n_s[i])
+            x = xpt[i] + random.uniform(-extent, extent, 500)
+            y = ypt[i] + random.uniform(-extent, extent, 500)
+            inside = SearchEllipse.in_search_ellipses(xpt[i], ypt[i], x, y,
+                                                      semi_east[i], semi_west[i], semi_n_s[i])
+            expected = ellipse.ellipse_path.contains_points(np.array([x, y]).T)
+
+            # the path is a polygon approximation of the ellipse, skip points on its edge
+            dx, dy = x - xpt[i], y - ypt[i]
+            r = np.hypot(dx / np.where(dx >= 0., semi_east[i], semi_west[i]), dy / semi_n_s[i])
+            clear = np.abs(r - 1.) > 0.01
+            self.assertEqual(list(inside[clear]), list(expected[clear]))
+            self.assertTrue(inside.any() and not inside.all())
+            compared += clear.sum()
+        self.assertTrue(compared > 9000)
+
+    def test1(self):
+        """ test the batched search ellipses against the matplotlib paths for the Global domain """
+        for days in [1, 7]:
+            self.check_ellipses('Global', days)
+
+    def test2(self):
+        """ test the batched search circles against the matplotlib paths for the BlackSea domain """
+        self.check_ellipses('BlackSea', 1)
+
+
+def simulate_tracks(eddy, records=range(12), stop=True, seed=3):
+    """
+    Run eddy through records of random eddies: every record some tracks
+    continue and some new ones start, the tracks are written with
+    write2netcdf as in EddyTracker.find_eddies. Track 0 lives throughout,
+    with stop all tracks are killed and saved after the last record
+    """
+
+    def observation(rtime):
+        values = [random.uniform(-40., -10.), random.uniform(20., 40.), rtime]
+        values += list(random.uniform(0.1, 1., 5))
+        extras = dict()
+        if eddy.TRACK_EXTRA_VARIABLES:
+            extras = dict(contour_e=random.uniform(size=random.randint(2, 20)),
+                          contour_s=random.uniform(size=random.randint(2, 20)),
+                          shape_error=random.uniform(0., 55.))
+        return values, extras
+
+    for record in records:
+        random = np.random.RandomState(seed + record)
+        rtime = 700000. + record
+        for i, track in enumerate(eddy.tracklist):
+            if i == 0 or random.uniform() < 0.6:
+                values, extras = observation(rtime)
+                eddy.update_track(i, *values, **extras)
+        for k in range(random.randint(1, 4)):
+            values, extras = observation(rtime)
+            eddy.add_new_track(*values, **extras)
+
+        # the new eddy lists, as set by track_eddies
+        tracks = eddy.tracklist
+        eddy.new_lon = [track.lon[-1] for track in tracks]
+        eddy.new_lat = [track.lat[-1] for track in tracks]
+        eddy.new_radii_s = [track.radius_s[-1] for track in tracks]
+        eddy.new_radii_e = [track.radius_e[-1] for track in tracks]
+        eddy.new_amp = [track.amplitude[-1] for track in tracks]
+        eddy.new_uavg = [track.uavg[-1] for track in tracks]
+        eddy.new_teke = [track.teke[-1] for track in tracks]
+        eddy.new_time = [track.ocean_time[-1] for track in tracks]
+        if eddy.TRACK_EXTRA_VARIABLES:
+            eddy.new_contour_e = [track.contour_e[-1] for track in tracks]
+            eddy.new_contour_s = [track.contour_s[-1] for track in tracks]
+            eddy.new_shape_error = [track.shape_error[-1] for track in tracks]
+
+        if record:
+            eddy.write2netcdf(rtime)
+
+    if stop:
+        eddy.kill_all_tracks()
+        eddy.write2netcdf(rtime, stopper=1)
+
+
+def write_unbuffered(eddy, tracks):
+    """
+    Write tracks to the nc file of eddy one track at a time, with
+    the contours written one observation at a time
+    """
+    with Dataset(eddy.savedir, 'a') as nc:
+        for k, track in enumerate(tracks):
+            tsize = len(track.lon)
+            tend = eddy.ncind + tsize
+            nc.variables['cyc'][eddy.ncind:tend] = np.full(tsize, 1)
+            nc.variables['lon'][eddy.ncind:tend] = np.array(track.lon)
+            nc.variables['lat'][eddy.ncind:tend] = np.array(track.lat)
+            nc.variables['A'][eddy.ncind:tend] = np.array(track.amplitude)
+            nc.variables['U'][eddy.ncind:tend] = np.array(track.uavg) * 100.
+            nc.variables['Teke'][eddy.ncind:tend] = np.array(track.teke)
+            nc.variables['L'][eddy.ncind:tend] = np.array(track.radius_s) * 1e-3
+            nc.variables['radius_e'][eddy.ncind:tend] = np.array(track.radius_e) * 1e-3
+            nc.variables['n'][eddy.ncind:tend] = np.arange(tsize)
+            nc.variables['track'][eddy.ncind:tend] = np.full(tsize, k)
+            nc.variables['track'].max_val = np.int32(k)
+            nc.variables['ocean_time'][eddy.ncind:tend] = np.array(track.ocean_time)
+            if eddy.TRACK_EXTRA_VARIABLES:
+                nc.variables['shape_error'][eddy.ncind:tend] = np.array(track.shape_error)
+                for j in range(tsize):
+                    for name in ('contour_e', 'contour_s'):
+                        contour = np.ravel(getattr(track, name)[j])
+                        nc.variables[name][:contour.size, eddy.ncind + j] = contour
+            eddy.ncind = tend
+        nc.NOBS_SAVED = np.int32(eddy.ncind)
+
+
+def read_tracks(filename):
+    with Dataset(filename) as nc:
+        variables = dict((name, np.ma.filled(variable[:], np.nan))
+                         for name, variable in nc.variables.items())
+        attributes = dict(NOBS_SAVED=nc.NOBS_SAVED,
+                          track_max_val=nc.variables['track'].max_val)
+    return variables, attributes
+
+
+class TestTrackList(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def new_tracklist(self, name=None, **kwargs):
+        eddy = TrackList('Anticyclonic', self.tmpdir, Grid(), None,
+                         TRACK_DURATION_MIN=0, DAYS_BTWN_RECORDS=1.,
+                         INTERANNUAL=False, **kwargs)
+        eddy.PIXEL_THRESHOLD = [1, 100]
+        if name is not None:
+            eddy.create_netcdf(self.tmpdir, os.path.join(self.tmpdir, name + '.nc'))
+        return eddy
+
+    def assertStateEqual(self, state, expected):
+        self.assertEqual(sorted(state), sorted(expected))
+        for name in expected:
+            self.assertEqual(state[name].shape, expected[name].shape)
+            self.assertTrue(np.array_equal(state[name], expected[name]), name)
+
+    def check_buffered_writes(self, **kwargs):
+        saved = []
+        eddy = self.new_tracklist('buffered', **kwargs)
+        buffer_track = eddy.buffer_track
+        def record_track(track):
+            saved.append(track)
+            buffer_track(track)
+        eddy.buffer_track = record_track
+        simulate_tracks(eddy)
+        self.assertEqual(eddy.track_buffer_size, 0)
+        self.assertEqual(eddy.ch_index, len(saved))
+        self.assertTrue(len(saved) > 10)
+
+        reference = self.new_tracklist('unbuffered', **kwargs)
+        write_unbuffered(reference, saved)
+        self.assertEqual(eddy.ncind, reference.ncind)
+
+        variables, attributes = read_tracks(eddy.savedir)
+        expected, expected_attributes = read_tracks(reference.savedir)
+        self.assertEqual(attributes, expected_attributes)
+        self.assertEqual(sorted(variables), sorted(expected))
+        for name in expected:
+            self.assertEqual(variables[name].shape, expected[name].shape)
+            self.assertTrue(np.array_equal(variables[name], expected[name], equal_nan=True), name)
+        return variables
+
+    def test1(self):
+        """ test that buffered tracks give the same nc file as unbuffered writes """
+        for FLUSH_INTERVAL, FLUSH_SIZE in [(1, 100000), (4, 100000), (100, 100000), (100, 5)]:
+            variables = self.check_buffered_writes(FLUSH_INTERVAL=FLUSH_INTERVAL,
+                                                   FLUSH_SIZE=FLUSH_SIZE)
+            self.assertEqual(list(np.unique(variables['track'])),
+                             list(range(int(variables['track'].max()) + 1)))
+
+    def test2(self):
+        """ test that buffered contours give the same nc file as unbuffered writes """
+        for FLUSH_INTERVAL in [1, 4]:
+            self.check_buffered_writes(FLUSH_INTERVAL=FLUSH_INTERVAL,
+                                       TRACK_EXTRA_VARIABLES=True)
+
+    def test3(self):
+        """ test packing lists of arrays into flat arrays """
+        random = np.random.RandomState(4)
+        arrays = [random.uniform(size=n) for n in [3, 0, 1, 7]] + [random.uniform(size=(2, 3))]
+        flat, lengths = _pack_ragged(arrays)
+        self.assertEqual(flat.dtype, np.float64)
+        self.assertEqual(list(lengths), [3, 0, 1, 7, 6])
+        unpacked = _unpack_ragged(flat, lengths)
+        self.assertEqual(len(unpacked), len(arrays))
+        for array, expected in zip(unpacked, arrays):
+            self.assertEqual(list(array), list(np.ravel(expected)))
+
+        flat, lengths = _pack_ragged([])
+        self.assertEqual((flat.size, lengths.size), (0, 0))
+        self.assertEqual(_unpack_ragged(flat, lengths), [])
+
+    def test4(self):
+        """ test that a TrackList restored from a checkpoint continues as the original """
+        for extras in [False, True]:
+            config = dict(FLUSH_INTERVAL=3, TRACK_EXTRA_VARIABLES=extras)
+            reference = self.new_tracklist('reference', **config)
+            simulate_tracks(reference)
+
+            eddy = self.new_tracklist('restarted', **config)
+            simulate_tracks(eddy, range(7), stop=False)
+            eddy.flush_tracks()
+            state = eddy.get_checkpoint()
+            nobs = eddy.ncind
+            self.assertTrue(len(eddy.tracklist) > 1 and nobs > 0)
+
+            # the run continues past the checkpoint before it is stopped
+            simulate_tracks(eddy, range(7, 10), stop=False)
+            eddy.flush_tracks()
+            self.assertTrue(eddy.ncind > nobs)
+
+            restored = self.new_tracklist(**config)
+            restored.set_checkpoint(state)
+            self.assertStateEqual(restored.get_checkpoint(), state)
+            with Dataset(restored.savedir) as nc:
+                self.assertEqual(len(nc.dimensions['Nobs']), nobs)
+                self.assertEqual(nc.NOBS_SAVED, nobs)
+                self.assertEqual(nc.variables['track'].max_val, nc.variables['track'][:].max())
+
+            simulate_tracks(restored, range(7, 12))
+            variables, attributes = read_tracks(restored.savedir)
+            expected, expected_attributes = read_tracks(reference.savedir)
+            self.assertEqual(attributes, expected_attributes)
+            self.assertEqual(sorted(variables), sorted(expected))
+            for name in expected:
+                self.assertTrue(np.array_equal(variables[name], expected[name], equal_nan=True), name)
@@ -0,0 +1,163 @@
+import numpy as np
+
+from amuse.test.amusetest import TestCase
+
+from omuse.ext.eddy_tracker.make_eddy_track_AVISO import PyEddyTracker
+from omuse.ext.eddy_tracker.make_eddy_tracker_list_obj import TrackList
+from omuse.ext.eddy_tracker.py_eddy_tracker_classes import collection_loop, collection_loops
+from omuse.ext.eddy_tracker.py_eddy_tracker_property_classes import SwirlSpeed
+from omuse.ext.eddy_tracker.contours import find_contours
+
+from omuse.ext.eddy_tracker.test_make_eddy_tracker_list_obj import Equirectangular
+
+LONMIN, LONMAX, LATMIN, LATMAX = -40., -25., 20., 35.
+
+
+class SyntheticGrid (PyEddyTracker):
+    """
+    Regular all ocean grid with the methods of GenericGrid,
+    set up without Basemap
+    """
+    def __init__(self, resolution=0.2):
+        super(SyntheticGrid, self).__init__()
+        self.PRODUCT = 'Generic'
+        self.THE_DOMAIN = 'Regional'
+        self.LONMIN, self.LONMAX = LONMIN, LONMAX
+        self.LATMIN, self.LATMAX = LATMIN, LATMAX
+        self.FILLVAL = 0.0
+        self._lon, self._lat = np.meshgrid(
+            np.arange(LONMIN - 2., LONMAX + 2. + resolution / 2, resolution),
+            np.arange(LATMIN - 2., LATMAX + 2. + resolution / 2, resolution))
+        self.resolution = resolution
+        self.set_initial_indices()
+        self.set_index_padding()
+        self.get_AVISO_f_pm_pn()
+        self.M = Equirectangular(self.EARTH_RADIUS)
+        self.set_u_v_eke()
+        self.shape = self.lon().shape
+        self.mask = np.ones(self.lonpad().shape, dtype=int)
+        self.uvmask()
+
+    def set_index_padding(self, pad=2):
+        # the grid extends 2 degrees beyond the domain on all sides
+        self.ip0, self.ip1 = self.i0 - pad, self.i1 + pad
+        self.jp0, self.jp1 = self.j0 - pad, self.j1 + pad
+        self.iup0, self.iup1 = pad, -pad
+        self.jup0, self.jup1 = pad, -pad
+        return self
+
+    def lon(self):
+        return self._lon[self.j0:self.j1, self.i0:self.i1]
+
+    def lat(self):
+        return self._lat[self.j0:self.j1, self.i0:self.i1]
+
+    def lonpad(self):
+        return self._lon[self.jp0:self.jp1, self.ip0:self.ip1]
+
+    def latpad(self):
+        return self._lat[self.jp0:self.jp1, self.ip0:self.ip1]
+
+    def get_resolution(self):
+        return self.resolution
+
+    def umask(self):
+        return self._umask
+
+    def vmask(self):
+        return self._vmask
+
+    def gof(self):
+        return self._gof
+
+    def pm(self):
+        return self._pm
+
+    def pn(self):
+        return self._pn
+
+
+def synthetic_sla(grd, neddies=40, seed=2):
+    """
+    Sea level anomaly (cm) of random Gaussian eddies on the padded grid
+    """
+    random = np.random.RandomState(seed)
+    lon, lat = grd.lonpad(), grd.latpad()
+    sla = random.normal(0., 0.05, lon.shape)
+    for k in range(neddies):
+        lon0 = random.uniform(LONMIN, LONMAX)
+        lat0 = random.uniform(LATMIN, LATMAX)
+        radius = random.uniform(0.4, 1.2)
+        amplitude = random.choice([-1., 1.]) * random.uniform(5., 30.)
+        sla += amplitude * np.exp(-((lon - lon0) ** 2 + (lat - lat0) ** 2) / radius ** 2)
+    return sla
+
+
+def find_eddies(processes, chunksize=4):
+    """
+    Find the eddies of the synthetic SLA as EddyTracker.find_eddies does,
+    serially (processes is 1) or over a pool of processes
+    """
+    grd = SyntheticGrid()
+    config = dict(THE_DOMAIN='Regional', LONMIN=LONMIN, LONMAX=LONMAX,
+                  LATMIN=LATMIN, LATMAX=LATMAX, RADMIN=0.35, RADMAX=4.461)
+    A_eddy = TrackList('Anticyclonic', '', grd, None, **config)
+    C_eddy = TrackList('Cyclonic', '', grd, None, **config)
+    for eddy in (A_eddy, C_eddy):
+        eddy.PIXEL_THRESHOLD = [np.round(np.pi * 0.35 ** 2 / grd.get_resolution() ** 2),
+                                np.round(np.pi * 4.461 ** 2 / grd.get_resolution() ** 2)]
+        eddy.reset_holding_variables()
+
+    sla = np.ma.masked_where(grd.mask == 0, synthetic_sla(grd))
+    grd.set_geostrophic_velocity(sla * 0.01)
+    grd.getEKE()
+    uspd = np.sqrt(grd.u ** 2 + grd.v ** 2)
+    sla = sla[grd.jup0:grd.jup1, grd.iup0:grd.iup1]
+    grd.set_interp_coeffs(sla, uspd)
+    for eddy in (A_eddy, C_eddy):
+        eddy.sla = sla.copy()
+        eddy.slacopy = sla.copy()
+        eddy.uspd = uspd.copy()
+        eddy.sla_coeffs = grd.sla_coeffs
+        eddy.uspd_coeffs = grd.uspd_coeffs
+
+    A_CS = find_contours(grd.lon(), grd.lat(), A_eddy.sla,
+                         np.union1d(A_eddy.CONTOUR_PARAMETER, C_eddy.CONTOUR_PARAMETER))
+    C_CS = A_CS.select(C_eddy.CONTOUR_PARAMETER)
+    A_CS = A_CS.select(A_eddy.CONTOUR_PARAMETER)
+    A_eddy.swirl = SwirlSpeed(A_CS)
+    C_eddy.swirl = SwirlSpeed(C_CS)
+
+    rtime = 700000.
+    if processes == 1:
+        A_eddy = collection_loop(A_CS, grd, rtime, A_list_obj=A_eddy, C_list_obj=None,
+                                 sign_type=A_eddy.SIGN_TYPE)
+        C_eddy = collection_loop(C_CS, grd, rtime, A_list_obj=None, C_list_obj=C_eddy,
+                                 sign_type=C_eddy.SIGN_TYPE)
+    else:
+        A_eddy, C_eddy = collection_loops(
+            [(A_CS, A_eddy, None, A_eddy.SIGN_TYPE),
+             (C_CS, None, C_eddy, C_eddy.SIGN_TYPE)],
+            grd, rtime, processes=processes, chunksize=chunksize)
+    return A_eddy, C_eddy
+
+
+def eddy_lists(eddy):
+    names = ('new_lon_tmp', 'new_lat_tmp', 'new_radii_s_tmp', 'new_radii_e_tmp',
+             'new_amp_tmp', 'new_uavg_tmp', 'new_teke_tmp', 'new_time_tmp')
+    return dict((name, [float(value) for value in getattr(eddy, name)])
+                for name in names)
+
+
+class TestCollectionLoops(TestCase):
+
+    def test1(self):
+        """ test that the pooled contour evaluation finds the same eddies as the serial loop """
+        serial = find_eddies(processes=1)
+        self.assertTrue(len(serial[0].new_lon_tmp) > 10)
+        self.assertTrue(len(serial[1].new_lon_tmp) > 10)
+        for processes, chunksize in [(2, 4), (3, 16)]:
+            pooled = find_eddies(processes=processes, chunksize=chunksize)
+            for expected, eddy in zip(serial, pooled):
+                self.assertEqual(eddy_lists(eddy), eddy_lists(expected))
+                self.assertEqual(list(eddy.sla.ravel()), list(expected.sla.ravel()))
@@ -1,17 +1,139 @@
 from amuse.ext.grid_remappers import *
 
+from amuse.datamodel import StructuredGrid
 from amuse.datamodel.staggeredgrid import StaggeredGrid
+from amuse.units.quantities import is_quantity
+
+import os
+import glob
+import hashlib
+import tempfile
+
+def _grid_geometry_arrays(grid):
+    """ return the center and corner coordinates of grid as plain arrays in radians """
+    result = [numpy.array(grid.shape)]
+    for attribute in ['lon', 'lat']:
+        values = getattr(grid, attribute)
+        if is_quantity(values):
+            values = values.value_in(units.rad)
+        result.append(numpy.asarray(values, dtype=numpy.double))
+    result.append(numpy.asarray(grid._cell_corners, dtype=numpy.double))
+    return result
+
+class remapping_weights_cache(object):
+
+    def __init__(self, directory, max_size=2*1024**3, max_files=None):
+        """ This class stores the remapping links computed by the CDORemapper
+            on disk, keyed by a hash of the geometry (centers and corners) of
+            the source and target grid. When the total size of the cache
+            exceeds max_size bytes (or the number of files exceeds max_files)
+            the least recently used files are removed.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_files = max_files
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, source, target, method="conservative"):
+        sha = hashlib.sha1(method.encode())
+        for grid in [source, target]:
+            sha.update(type(grid).__name__.encode())
+            for values in _grid_geometry_arrays(grid):
+                sha.update(numpy.ascontiguousarray(values).tobytes())
+        return sha.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + ".remap")
+
+    def lookup(self, key):
+        filename = self.filename(key)
+        if not os.path.isfile(filename):
+            return None
+        os.utime(filename, None)
+        return filename
+
+    def store(self, key, save_function):
+        """ save_function is called with a filename to write the remapping to,
+            the file is moved into place once it has been written completely
+        """
+        handle, tmpname = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(handle)
+        try:
+            save_function(tmpname)
+            os.replace(tmpname, self.filename(key))
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+        self.maintain()
+        return self.filename(key)
+
+    def maintain(self):
+        files = [(os.path.getmtime(f), os.path.getsize(f), f) for f in glob.glob(os.path.join(self.directory, "*.remap"))]
+        files.sort(reverse=True)
+
+        total_size = 0
+        for i, (mtime, size, filename) in enumerate(files):
+            total_size += size
+            if (total_size > self.max_size and i > 0) or (self.max_files is not None and i >= self.max_files):
+                os.remove(filename)
+
+def conservative_remapping_matrix(src_address, dst_address, weights1, weights2, weights3, src_shape, dst_size):
+    """ build the sparse matrix that performs a second-order conservative
+        remapping, i.e. CDO's remap() combined with the gradients computed
+        by CDO's remap_gradients() on a logically rectangular source grid
+        (periodic in the first dimension, all cells unmasked).
+        The matrix maps source values in Fortran order to target values.
+    """
+    try:
+        import scipy.sparse
+    except ImportError:
+        raise Exception("computing the remapping locally requires scipy")
+
+    nx, ny = src_shape
+    src_size = nx * ny
+    index = numpy.arange(src_size)
+    i = index % nx
+    j = index // nx
+
+    #i-gradient: centered difference with periodic wrap
+    east = (i+1) % nx + j*nx
+    west = (i-1) % nx + j*nx
+    half = numpy.full(src_size, 0.5)
+    grad_i = scipy.sparse.coo_matrix((numpy.concatenate([half, -half]),
+                                      (numpy.concatenate([index, index]), numpy.concatenate([east, west]))),
+                                     shape=(src_size, src_size))
+
+    #j-gradient: centered difference, one-sided at the first and last row
+    north = i + numpy.minimum(j+1, ny-1)*nx
+    south = i + numpy.maximum(j-1, 0)*nx
+    delns = numpy.where((j == 0) | (j == ny-1), 1.0, 0.5)
+    grad_j = scipy.sparse.coo_matrix((numpy.concatenate([delns, -delns]),
+                                      (numpy.concatenate([index, index]), numpy.concatenate([north, south]))),
+                                     shape=(src_size, src_size))
+
+    links = (numpy.asarray(dst_address), numpy.asarray(src_address))
+    w1 = scipy.sparse.coo_matrix((weights1, links), shape=(dst_size, src_size)).tocsr()
+    w2 = scipy.sparse.coo_matrix((weights2, links), shape=(dst_size, src_size)).tocsr()
+    w3 = scipy.sparse.coo_matrix((weights3, links), shape=(dst_size, src_size)).tocsr()
+
+    return (w1 + w2.dot(grad_i.tocsr()) + w3.dot(grad_j.tocsr())).tocsr()
 
 class conservative_spherical_remapper(object):
 
-    def __init__(self, source, target, axes_names=['lon', 'lat'], cdo_remapper=None):
+    def __init__(self, source, target, axes_names=['lon', 'lat'], cdo_remapper=None, weights_cache=None, local_remap=False):
         """ This class maps a source grid to a target grid using second-
             order conservative remapping by calling the re-implementation of
             SCRIP within CDO. The source grid should be a structured grid
             the target grid can be of any type. This class is able to deal
             with staggered grids for both source and target grid.
             Instantiating this class may take a while, as the remapping
-            weights are being computed.
+            weights are being computed. To avoid recomputing the weights
+            for grids that have been used before, weights_cache can be set
+            to a remapping_weights_cache or to a directory to store one.
+            With local_remap the remapping links are retrieved once and
+            applied in-process as a sparse matrix, instead of sending
+            every field to the CDORemapper.
         """
         self.src_staggered = False
         self.source = source
@@ -41,21 +163,74 @@ class conservative_spherical_remapper(object):
             self.cdo_remapper.parameters.src_grid = self.src_elements
             self.cdo_remapper.parameters.dst_grid = self.tgt_elements
 
+            if isinstance(weights_cache, str):
+                weights_cache = remapping_weights_cache(weights_cache)
+
+            cache_key = None
+            if weights_cache is not None:
+                cache_key = weights_cache.key(self.src_elements, self.tgt_elements)
+                filename = weights_cache.lookup(cache_key)
+                if filename is not None:
+                    self.cdo_remapper.parameters.remap_file = filename
+                    cache_key = None
+
             #force start of the computation of remapping weights
             self.cdo_remapper.commit_parameters()
+
+            if cache_key is not None:
+                weights_cache.store(cache_key, self.cdo_remapper.save_remapping_to_file)
         else:
             self.cdo_remapper = cdo_remapper
 
+        self.local_remap = local_remap
+        self._remapping_matrix = None
+        self._grid_copies = dict()
+
+    def get_remapping_matrix(self):
+        if self._remapping_matrix is None:
+            num_links = self.cdo_remapper.get_num_links()
+            (src, dst, w1, w2, w3) = self.cdo_remapper.get_remap_links(numpy.arange(num_links))
+            self._remapping_matrix = conservative_remapping_matrix(src, dst, w1, w2, w3,
+                self.src_elements.shape, self.tgt_elements.size)
+        return self._remapping_matrix
+
+    def _remap(self, values):
+        """ remap values on the source elements (Fortran order) to the target
+            elements, values can be 2D with one column per field
+        """
+        if self.local_remap:
+            return self.get_remapping_matrix().dot(values)
+
+        if values.ndim > 1:
+            return numpy.column_stack([self._remap(column) for column in values.T])
+
+        #indices for interacting with CDORemapper
+        index_i_src = numpy.arange(self.src_elements.size)
+        index_i_dst = numpy.arange(self.tgt_elements.size)
+
+        self.cdo_remapper.set_src_grid_values(index_i_src, values)
+        self.cdo_remapper.perform_remap()
+        return numpy.asarray(self.cdo_remapper.get_dst_grid_values(index_i_dst))
+
 
-    def _get_grid_copies_and_channel(self, source, target, attributes):
-        source_copy=source.empty_copy()
-        channel1=source.new_channel_to(source_copy)
-        target_copy=target.empty_copy()
-        channel2=target.new_channel_to(target_copy)
-        channel3=target_copy.new_channel_to(target)
+    def _get_grid_copies_and_channel(self, source, target, attributes, key=None):
+        """ the in-memory copies and channels are created once per key and
+            reused on subsequent calls, only the attributes are copied again
+        """
+        if key is not None and key in self._grid_copies:
+            source_copy, target_copy, channel1, channel3 = self._grid_copies[key]
+        else:
+            source_copy=source.empty_copy()
+            channel1=source.new_channel_to(source_copy)
+            target_copy=target.empty_copy()
+            channel2=target.new_channel_to(target_copy)
+            channel3=target_copy.new_channel_to(target)
+
+            channel2.copy_attributes(self._axes_names)
+            if key is not None:
+                self._grid_copies[key] = (source_copy, target_copy, channel1, channel3)
 
         channel1.copy_attributes(attributes)
-        channel2.copy_attributes(self._axes_names)
 
         return source_copy, target_copy, channel3
 
@@ -79,62 +254,63 @@ class conservative_spherical_remapper(object):
 
 
     def _forward_mapping_elements_to_elements(self, source, target, attributes):
+        attributes = list(attributes)
+        if len(attributes) == 0:
+            return
 
         #create in-memory copies of the grids and a channel to the target in-code grid
-        source_copy, target_copy, channel3 = self._get_grid_copies_and_channel(source, target, attributes)
+        source_copy, target_copy, channel3 = self._get_grid_copies_and_channel(source, target, attributes, key="elements")
 
-        #indices for interacting with CDORemapper
-        index_i_src = list(range(source.size))         
-        index_i_dst = list(range(target.size))         
-       
+        #obtain source values and units, stacked as one column per attribute
+        units_list = []
+        columns = []
         for attribute in attributes:
-            #obtain source values and unit
             values=to_quantity( getattr(source_copy, attribute) )
-            unit=values.unit
-            values=numpy.array(values.number)
+            units_list.append(values.unit)
+            columns.append(numpy.array(values.number).ravel('F'))
 
-            #do the remapping
-            self.cdo_remapper.set_src_grid_values(index_i_src, values.ravel('F'))
-            self.cdo_remapper.perform_remap()
-            result = self.cdo_remapper.get_dst_grid_values(index_i_dst).reshape(target.shape, order='F')
+        #do the remapping for all attributes at once
+        result = self._remap(numpy.column_stack(columns))
+
+        for attribute, unit, column in zip(attributes, units_list, result.T):
+            column = column.reshape(target.shape, order='F')
 
             #store result in copy target grid
-            setattr(target_copy, attribute, (result if unit is units.none else (result | unit)))
+            setattr(target_copy, attribute, (column if unit is units.none else (column | unit)))
 
         #push in-memory copy target grid to in-code storage grid
         channel3.copy_attributes(attributes)    
 
 
     def _forward_mapping_nodes_to_nodes(self, source, target, attributes):
+        attributes = list(attributes)
 
         #create in-memory copies of the grids and a channel to the target in-code grid
-        source_copy, target_copy, channel3 = self._get_grid_copies_and_channel(source.nodes, target.nodes, attributes)
+        source_copy, target_copy, channel3 = self._get_grid_copies_and_channel(source.nodes, target.nodes, attributes, key="nodes")
 
-        #indices for interacting with CDORemapper
-        index_i_src = list(range(source.elements.size))
-        index_i_dst = list(range(target.elements.size))
-       
+        #obtain source values and units, stacked as one column per attribute
+        units_list = []
+        columns = []
         for attribute in attributes:
-            #obtain source values and unit
             values=to_quantity( getattr(source_copy, attribute) ) 
-            unit=values.unit
+            units_list.append(values.unit)
             values=values.number
             if len(values.shape) > 1:
                 values = numpy.swapaxes(values, 0, 1)
 
             #remap to elements within source grid
             values = source.map_nodes_to_elements(values)
+            columns.append(values.flatten())
 
-            #do the remapping
-            self.cdo_remapper.set_src_grid_values(index_i_src, values.flatten())
-            self.cdo_remapper.perform_remap()
-            result = self.cdo_remapper.get_dst_grid_values(index_i_dst)
+        #do the remapping for all attributes at once
+        result = self._remap(numpy.column_stack(columns))
 
+        for attribute, unit, column in zip(attributes, units_list, result.T):
             #remap to nodes within target grid
-            result = target.map_elements_to_nodes(result)
+            column = target.map_elements_to_nodes(column)
 
             #store result in copy target grid
-            setattr(target_copy, attribute, (result if unit is units.none else (result | unit)))
+            setattr(target_copy, attribute, (column if unit is units.none else (column | unit)))
 
         #push in-memory copy target grid to in-code storage target grid
         channel3.copy_attributes(attributes)
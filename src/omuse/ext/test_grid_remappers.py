@@ -0,0 +1,141 @@
+import os
+import tempfile
+import shutil
+
+import numpy
+
+from amuse.test.amusetest import TestCase
+from omuse.units import units
+
+from omuse.ext.grid_remappers import remapping_weights_cache, conservative_remapping_matrix
+from omuse.ext.testing import regular_structured_grid
+
+
+class TestRemappingWeightsCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, size):
+        def save_function(filename):
+            with open(filename, "wb") as f:
+                f.write(b"x" * size)
+        return save_function
+
+    def test1(self):
+        """ test a cache miss, store and hit """
+        cache = remapping_weights_cache(self.directory)
+        source = regular_structured_grid(8, 4)
+        target = regular_structured_grid(6, 3)
+        key = cache.key(source, target)
+        self.assertEqual(cache.lookup(key), None)
+
+        filename = cache.store(key, self.write(10))
+        self.assertEqual(filename, cache.filename(key))
+        self.assertEqual(os.path.getsize(filename), 10)
+        os.utime(filename, (1000., 1000.))
+        self.assertEqual(cache.lookup(key), filename)
+        self.assertTrue(os.path.getmtime(filename) > 1000.)
+        self.assertEqual(cache.lookup(cache.key(target, source)), None)
+        self.assertEqual([f for f in os.listdir(self.directory) if f.endswith(".tmp")], [])
+
+    def test2(self):
+        """ test that the key depends on the method and the geometry of both grids """
+        cache = remapping_weights_cache(self.directory)
+        source = regular_structured_grid(8, 4)
+        target = regular_structured_grid(6, 3)
+        key = cache.key(source, target)
+        self.assertEqual(cache.key(regular_structured_grid(8, 4), regular_structured_grid(6, 3)), key)
+        self.assertNotEqual(cache.key(source, target, method="bilinear"), key)
+        self.assertNotEqual(cache.key(source, regular_structured_grid(3, 6)), key)
+
+        moved = regular_structured_grid(8, 4)
+        moved.lon = moved.lon + (0.01 | units.rad)
+        self.assertNotEqual(cache.key(moved, target), key)
+
+        corners = regular_structured_grid(8, 4)
+        corners._cell_corners = corners._cell_corners.copy()
+        corners._cell_corners[1, 2, 2] += 0.01
+        self.assertNotEqual(cache.key(corners, target), key)
+
+    def test3(self):
+        """ test that the least recently used files are evicted first """
+        cache = remapping_weights_cache(self.directory, max_files=2)
+        cache.store("a", self.write(10))
+        os.utime(cache.filename("a"), (1000., 1000.))
+        cache.store("b", self.write(10))
+        os.utime(cache.filename("b"), (2000., 2000.))
+        self.assertNotEqual(cache.lookup("a"), None)
+        cache.store("c", self.write(10))
+        self.assertEqual(cache.lookup("b"), None)
+        self.assertNotEqual(cache.lookup("a"), None)
+        self.assertNotEqual(cache.lookup("c"), None)
+
+    def test4(self):
+        """ test eviction by total size, keeping the most recent file even if it is too large """
+        cache = remapping_weights_cache(self.directory, max_size=250)
+        for i, key in enumerate(["a", "b", "c"]):
+            cache.store(key, self.write(100))
+            os.utime(cache.filename(key), (1000.*(i+1), 1000.*(i+1)))
+        cache.maintain()
+        self.assertEqual(sorted(os.listdir(self.directory)), ["b.remap", "c.remap"])
+
+        cache.store("d", self.write(300))
+        self.assertEqual(sorted(os.listdir(self.directory)), ["d.remap"])
+
+
+class TestConservativeRemappingMatrix(TestCase):
+
+    def remap_links(self, src_address, dst_address, weights1, weights2, weights3, src_shape, dst_size, values):
+        """ apply the links one by one, as CDO's remap() with the gradients of remap_gradients() """
+        nx, ny = src_shape
+        field = values.reshape((nx, ny), order='F')
+        result = numpy.zeros(dst_size)
+        for n in range(len(src_address)):
+            i, j = src_address[n] % nx, src_address[n] // nx
+            grad_i = 0.5*(field[(i+1) % nx, j] - field[(i-1) % nx, j])
+            if j == 0:
+                grad_j = field[i, j+1] - field[i, j]
+            elif j == ny-1:
+                grad_j = field[i, j] - field[i, j-1]
+            else:
+                grad_j = 0.5*(field[i, j+1] - field[i, j-1])
+            result[dst_address[n]] += weights1[n]*field[i, j] + weights2[n]*grad_i + weights3[n]*grad_j
+        return result
+
+    def links(self, src_shape, dst_size, num_links):
+        random = numpy.random.RandomState(42)
+        src_address = random.randint(0, src_shape[0]*src_shape[1], num_links)
+        dst_address = random.randint(0, dst_size, num_links)
+        return src_address, dst_address, random.random(num_links), random.random(num_links), random.random(num_links)
+
+    def test1(self):
+        """ test the first-order term """
+        src_shape, dst_size = (5, 4), 3
+        src_address, dst_address, weights1, _, _ = self.links(src_shape, dst_size, 12)
+        zeros = numpy.zeros(len(src_address))
+        matrix = conservative_remapping_matrix(src_address, dst_address, weights1, zeros, zeros, src_shape, dst_size)
+        self.assertEqual(matrix.shape, (dst_size, 20))
+
+        values = numpy.random.random(20)
+        expected = numpy.zeros(dst_size)
+        numpy.add.at(expected, dst_address, weights1*values[src_address])
+        self.assertAlmostRelativeEqual(matrix.dot(values), expected, 12)
+
+    def test2(self):
+        """ test the periodic i and one-sided j gradient stencils, including the first and last rows and columns """
+        src_shape, dst_size = (5, 4), 3
+        links = self.links(src_shape, dst_size, 40)
+        src_address = numpy.concatenate([links[0], [0, 4, 15, 19]])
+        dst_address = numpy.concatenate([links[1], [0, 1, 2, 0]])
+        weights = [numpy.concatenate([w, [0.25, 0.5, 0.75, 1.]]) for w in links[2:]]
+        matrix = conservative_remapping_matrix(src_address, dst_address, weights[0], weights[1], weights[2],
+                                               src_shape, dst_size)
+
+        for values in [numpy.random.random(20), numpy.arange(20.)**2]:
+            expected = self.remap_links(src_address, dst_address, weights[0], weights[1], weights[2],
+                                        src_shape, dst_size, values)
+            self.assertAlmostRelativeEqual(matrix.dot(values), expected, 12)
@@ -0,0 +1,18 @@
+import numpy
+
+from amuse.datamodel import StructuredGrid
+from omuse.units import units
+
+# grids shared by the tests of the remappers
+
+
+def regular_structured_grid(nlon, nlat):
+    """regular lon/lat StructuredGrid covering the sphere, with the cell corners set"""
+    grid = StructuredGrid(nlon, nlat)
+    lon = numpy.linspace(0., 2*numpy.pi, nlon+1)
+    lat = numpy.linspace(-0.5*numpy.pi, 0.5*numpy.pi, nlat+1)
+    corner_lon, corner_lat = numpy.meshgrid(lon, lat, indexing='ij')
+    grid.lon = (0.5*(corner_lon[:-1,:-1] + corner_lon[1:,1:])) | units.rad
+    grid.lat = (0.5*(corner_lat[:-1,:-1] + corner_lat[1:,1:])) | units.rad
+    grid._cell_corners = numpy.array([corner_lon, corner_lat])
+    return grid
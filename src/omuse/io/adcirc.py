@@ -1,3 +1,7 @@
+import os
+import time
+import hashlib
+import tempfile
 import numpy
 
 from omuse.units import units
@@ -130,6 +134,17 @@ class adcirc_file_writer(object):
     def write_var_rows(self,*var):
         for v in zip(var):
             self.write_var(*v)
+    def write_block(self,*columns,**kwargs):
+        """ write the columns (arrays of equal length or scalars) as rows, formatted
+            as write_var would, chunksize rows at a time (default: all at once) """
+        chunksize=kwargs.get("chunksize", None)
+        columns=numpy.broadcast_arrays(*[numpy.asarray(x) for x in columns])
+        n=len(columns[0]) if columns[0].ndim>0 else 1
+        if chunksize is None: chunksize=max(n,1)
+        rowformat=' '.join(['%s']*len(columns))+"\n"
+        for start in range(0,n,chunksize):
+            rows=zip(*[x[start:start+chunksize].tolist() for x in columns])
+            self.write(''.join([rowformat % row for row in rows]))
 
 
 class adcirc_parameter_writer(object):
@@ -295,7 +310,9 @@ class adcirc_parameter_writer(object):
 class adcirc_grid_writer(object):
   
   def __init__(self,filename="fort.14",coordinates="cartesian", density_filename="fort.11",
-                nodes=None,elements=None, elevation_boundaries=None, flow_boundaries=None):
+                nodes=None,elements=None, elevation_boundaries=None, flow_boundaries=None, chunksize=None):
+    """ chunksize sets the number of lines formatted and written at once (default: whole blocks) """
+    self.chunksize=chunksize
     self.nodes=nodes
     self.elements=elements
     self.elevation_boundaries=elevation_boundaries
@@ -310,24 +327,24 @@ class adcirc_grid_writer(object):
     f=adcirc_file_writer(self.filename,'w')
     f.write_var("AMUSE grid")
     f.write_var(len(elements),len(x))
-    for i,x_,y_,d_ in zip(range(1,len(x)+1),x,y,depth):
-      f.write_var(i,x_,y_,d_)
-    for i,n in enumerate(elements):
-      f.write_var(i+1,3,n[0],n[1],n[2])
+    f.write_block(numpy.arange(1,len(x)+1),x,y,depth,chunksize=self.chunksize)
+    elements=numpy.asarray(elements)
+    if len(elements)>0:
+      f.write_block(numpy.arange(1,len(elements)+1),3,elements[:,0],elements[:,1],elements[:,2],chunksize=self.chunksize)
 
     f.write_var(len(elev_boundary))
     NETA=sum([len(x[0]) for x in elev_boundary])
     f.write_var(NETA)
     for b,t in elev_boundary:
       f.write_var(len(b), t)
-      for node in b: f.write_var(node)    
+      f.write_block(b,chunksize=self.chunksize)
     
     f.write_var(len(flow_boundary))
     NVEL=sum([len(x[0]) for x in flow_boundary])
     f.write_var(NVEL)
     for b,t in flow_boundary:
       f.write_var(len(b),t)
-      for node in b: f.write_var(node)    
+      f.write_block(b,chunksize=self.chunksize)
       
     f.close()
 
@@ -341,13 +358,17 @@ class adcirc_grid_writer(object):
 
     NP=len(nodes)
     NFEN=number_of_vertical_levels
-    f=adcirc_file_writer(self.density_filename,'w')
-    f.write_var("header 1")
-    f.write_var("header 2")
-    f.write_var(NFEN,NP)
-    for i in range(NP):
-      for j in range(NFEN):
-        f.write_var(i+1,j+1,Tconst.value_in(units.Celsius))
+    with adcirc_file_writer(self.density_filename,'w') as f:
+      f.write_var("header 1")
+      f.write_var("header 2")
+      f.write_var(NFEN,NP)
+      # node/level index rows are generated per chunk of nodes, the full NP*NFEN columns are never built
+      nodes_per_chunk=NP if self.chunksize is None else max(self.chunksize//NFEN,1)
+      levels=numpy.arange(1,NFEN+1)
+      for start in range(0,NP,nodes_per_chunk):
+        node=numpy.arange(start+1,min(start+nodes_per_chunk,NP)+1)
+        f.write_block(numpy.repeat(node,NFEN),numpy.tile(levels,len(node)),
+          Tconst.value_in(units.Celsius),chunksize=self.chunksize)
       
   def write_grid(self, nodes=None, elements=None, elevation_boundaries=None,flow_boundaries=None):
     if nodes is None: nodes=self.nodes
@@ -372,15 +393,25 @@ class adcirc_grid_writer(object):
 
 class adcirc_file_reader(object):
   def __init__(self, *args, **kwargs):
+    self.progress=kwargs.pop("progress", None)
     self.f=open(*args, **kwargs)
+    self._start_time=time.time()
   def __enter__(self):
     return self
   def close(self):
     self.f.close()
   def __exit__(self, *args):
     self.f.close()
+  def report_progress(self, section, done, total):
+    if self.progress is not None:
+      self.progress(section, done, total, time.time()-self._start_time)
   def readline(self):
     return self.f.readline()
+  def readlines(self,n):
+    lines=[self.f.readline() for i in range(n)]
+    if n>0 and not lines[-1]:
+      raise Exception("unexpected end of file {0}".format(self.f.name))
+    return lines
   def read_string(self,n=80):
     return self.readline()[:n]
   def read_int(self,n=1):
@@ -395,28 +426,30 @@ class adcirc_file_reader(object):
     for i in range(n):
       result.append(self.read_value(*types))
     return result
-  def read_single_type_attributes(self,n,m,dtype=int):
+  def read_block(self,n,m,dtype=float):
+    """ read n lines as a block and return the first m columns as an (n,m) array,
+        trailing columns and comments (starting with !) are ignored """
+    lines=self.readlines(n)
+    text=''.join(lines)
+    if '!' in text:
+      text='\n'.join([l.split('!',1)[0] for l in lines])
+    data=numpy.fromstring(text, dtype=dtype, sep=' ')
+    if data.size==n*m:
+      return data.reshape((n,m))
+    return numpy.array([l.split('!',1)[0].split()[:m] for l in lines], dtype=dtype)
+  def read_single_type_attributes(self,n,m,dtype=int, section=None):
     result=numpy.zeros((n,m),dtype)
-    _n=0
-    while _n<n:
-      line_=self.readline().split()
-      index=int(line_[0])-1
-      result[index,:]=[dtype(line_[i]) for i in range(1,m+1)]
-      _n+=1    
+    block=self.read_block(n,m+1,dtype)
+    index=block[:,0].astype(int)-1
+    result[index,:]=block[:,1:]
+    if section is not None:
+      self.report_progress(section, n, n)
     return result
   def read_boundary_segment(self,n):
-    seg=[]
-    i=0
-    while i<n:
-      line=self.readline()
-      line_=line.split()
-      seg.append( int(line_[0]))
-      i+=1
-    return numpy.array(seg)    
-  def read_boundary_segments(self,nseg,nnodes,default_type=None):
+    return self.read_block(n,1,int)[:,0]
+  def iter_boundary_segments(self,nseg,nnodes,default_type=None,section=None):
     i=0
     _nnodes=0
-    result=[]
     while i<nseg:
       line=self.readline()
       line_=line.split()
@@ -428,9 +461,12 @@ class adcirc_file_reader(object):
       _nnodes+=n
       seg=self.read_boundary_segment(n)
       i+=1
-      result.append((_type,seg))
+      if section is not None:
+        self.report_progress(section, i, nseg)
+      yield (_type,seg)
     assert nnodes==_nnodes
-    return result
+  def read_boundary_segments(self,nseg,nnodes,default_type=None,section=None):
+    return list(self.iter_boundary_segments(nseg,nnodes,default_type,section))
 
 class adcirc_parameter_reader(object):  
   def __init__(self,filename="fort.15"):
@@ -689,32 +725,114 @@ class adcirc_parameter_reader(object):
     
 class adcirc_grid_reader(object):
   
-  def __init__(self,filename="fort.14",coordinates="cartesian"):
+  cache_version=1
+  cached_parameters=["NE","NP","NOPE","NBOU","NETA","NVEL","NFLUX"]
+  
+  def __init__(self,filename="fort.14",coordinates="cartesian",progress=None,cache=False,validate="mtime"):
+    """ progress is an optional callback, called as progress(section, done, total, elapsed_time)
+        while the mesh is being read. With cache=True the mesh is stored in a binary
+        sidecar file (filename+".npz", or the filename given as cache) which is used
+        instead of the ASCII file as long as it is valid; validate is either "mtime"
+        (size and modification time of the ASCII file) or "hash" (its sha1 checksum) """
     self.filename=filename
     self.coordinates=coordinates
+    self.progress=progress
     if coordinates not in ["cartesian","spherical"]:
       raise Exception("coordinates must be cartesian or spherical")  
+    if validate not in ["mtime","hash"]:
+      raise Exception("validate must be mtime or hash")
+    if cache is True:
+      cache=filename+".npz"
+    self.cache_filename=cache or None
+    self.validate=validate
       
+  def source_signature(self):
+    if self.validate=="hash":
+      sha=hashlib.sha1()
+      with open(self.filename,'rb') as f:
+        for chunk in iter(lambda: f.read(1<<20), b''):
+          sha.update(chunk)
+      return "sha1:"+sha.hexdigest()
+    st=os.stat(self.filename)
+    return "mtime:{0}:{1}".format(st.st_size, st.st_mtime_ns)
+
   def read_grid(self):
-    f=adcirc_file_reader(self.filename,'r')
+    if self.cache_filename is not None:
+      signature=self.source_signature()
+      if self.read_cache(signature):
+        return
+    self.read_ascii_grid()
+    if self.cache_filename is not None:
+      self.write_cache(signature)
+
+  def read_cache(self, signature):
+    try:
+      data=numpy.load(self.cache_filename, allow_pickle=False)
+    except (IOError, ValueError):
+      return False
+    with data:
+      if int(data["version"])!=self.cache_version or str(data["signature"])!=signature:
+        return False
+      self.p=data["p"]
+      self.t=data["t"]
+      self.elev_spec_boundary_seg=self._unpack_segments(data["elev_types"],data["elev_lengths"],data["elev_nodes"])
+      self.flow_spec_boundary_seg=self._unpack_segments(data["flow_types"],data["flow_lengths"],data["flow_nodes"])
+      param=dict(zip(self.cached_parameters, [int(x) for x in data["parameters"]]))
+      param["AGRID"]=str(data["AGRID"])
+    self.parameters=param
+    return True
+
+  def write_cache(self, signature):
+    elev_types,elev_lengths,elev_nodes=self._pack_segments(self.elev_spec_boundary_seg)
+    flow_types,flow_lengths,flow_nodes=self._pack_segments(self.flow_spec_boundary_seg)
+    directory=os.path.dirname(os.path.abspath(self.cache_filename))
+    try:
+      handle,tmpname=tempfile.mkstemp(suffix=".tmp", dir=directory)
+    except OSError:
+      return # no write access, silently skip caching
+    try:
+      with os.fdopen(handle,'wb') as f:
+        numpy.savez(f, version=self.cache_version, signature=signature, p=self.p, t=self.t,
+          AGRID=self.parameters["AGRID"], parameters=[self.parameters[x] for x in self.cached_parameters],
+          elev_types=elev_types, elev_lengths=elev_lengths, elev_nodes=elev_nodes,
+          flow_types=flow_types, flow_lengths=flow_lengths, flow_nodes=flow_nodes)
+      os.replace(tmpname, self.cache_filename)
+    finally:
+      if os.path.exists(tmpname):
+        os.remove(tmpname)
+
+  @staticmethod
+  def _pack_segments(segments):
+    types=numpy.array([x[0] for x in segments], dtype=int)
+    lengths=numpy.array([len(x[1]) for x in segments], dtype=int)
+    nodes=numpy.concatenate([x[1] for x in segments]) if len(segments)>0 else numpy.zeros(0,dtype=int)
+    return types,lengths,nodes
+
+  @staticmethod
+  def _unpack_segments(types,lengths,nodes):
+    offsets=numpy.cumsum(lengths)[:-1]
+    return list(zip([int(x) for x in types], numpy.split(nodes,offsets))) if len(types)>0 else []
+
+  def read_ascii_grid(self):
+    f=adcirc_file_reader(self.filename,'r',progress=self.progress)
     param=dict()
     param["AGRID"]=f.read_string()
 
     NE,NP=f.read_int(2)
     
-    self.p=f.read_single_type_attributes(NP,3,float)
-    self.t=f.read_single_type_attributes(NE,4,int)
+    self.p=f.read_single_type_attributes(NP,3,float,section="nodes")
+    self.t=f.read_single_type_attributes(NE,4,int,section="elements")
 
     assert numpy.all(self.t[:,0]==3)
             
     NOPE=f.read_int(1)
     NETA=f.read_int(1)
 
-    self.elev_spec_boundary_seg=f.read_boundary_segments(NOPE,NETA,0)
+    self.elev_spec_boundary_seg=f.read_boundary_segments(NOPE,NETA,0,section="elevation boundaries")
 
     NBOU=f.read_int(1)
     NVEL=f.read_int(1)
-    self.flow_spec_boundary_seg=f.read_boundary_segments(NBOU,NVEL)
+    self.flow_spec_boundary_seg=f.read_boundary_segments(NBOU,NVEL,section="flow boundaries")
     
     NFLUX=0
     for _type,seg in self.flow_spec_boundary_seg:
@@ -743,7 +861,7 @@ class adcirc_grid_reader(object):
     nodes.depth=self.p[:,2] | units.m
         
     elements=Grid(self.parameters["NE"])
-    elements.nodes=[(x[1]-1,x[2]-1,x[3]-1) for x in self.t]
+    elements.nodes=self.t[:,1:4]-1
     
     elev_boundary=[]
     for type_,seg in self.elev_spec_boundary_seg:
@@ -763,27 +881,34 @@ class adcirc_grid_reader(object):
     
     return nodes,elements,elev_boundary,flow_boundary
   
+def unique_edges(triangles):
+    """ return the unique (undirected) edges of the triangles as an (n,2) array,
+        with the lowest node index first """
+    triangles=numpy.asarray(triangles)
+    edges=triangles[:,[0,1,1,2,2,0]].reshape(-1,2)
+    edges.sort(axis=1)
+    return numpy.unique(edges, axis=0)
+
+def node_adjacency(triangles, number_of_nodes=None):
+    """ return the node adjacency of the triangles in CSR form (offsets, neighbours):
+        the neighbours of node i are neighbours[offsets[i]:offsets[i+1]], sorted """
+    edges=unique_edges(triangles)
+    if number_of_nodes is None:
+      number_of_nodes=edges.max()+1 if len(edges)>0 else 0
+    first=numpy.concatenate((edges[:,0],edges[:,1]))
+    second=numpy.concatenate((edges[:,1],edges[:,0]))
+    order=numpy.lexsort((second,first))
+    offsets=numpy.zeros(number_of_nodes+1, dtype=int)
+    numpy.cumsum(numpy.bincount(first, minlength=number_of_nodes), out=offsets[1:])
+    return offsets, second[order]
+
 def assign_neighbours(nodes,elements):  
-    for n in nodes:
-      n.neighbours=set()
-    
-    for e in elements:
-      p1=e.nodes[0]
-      p2=e.nodes[1]
-      p3=e.nodes[2]
-      nodes[p1].neighbours.add(p2)
-      nodes[p1].neighbours.add(p3)
-      nodes[p2].neighbours.add(p1)
-      nodes[p2].neighbours.add(p3)
-      nodes[p3].neighbours.add(p1)
-      nodes[p3].neighbours.add(p2)
+    offsets,neighbours=node_adjacency(elements.nodes, len(nodes))
+    neighbours=neighbours.tolist()
+    nodes.neighbours=[set(neighbours[offsets[i]:offsets[i+1]]) for i in range(len(nodes))]
      
 def get_edges(elements):
-    edges=set()
-    for e in elements:
-      for i,j in [(0,1),(1,2),(2,0)]:
-        edges.add( frozenset([e.nodes[i],e.nodes[j]]) )
-    return edges
+    return set([frozenset(x) for x in unique_edges(elements.nodes).tolist()])
 
 if __name__=="__main__":
     from omuse.ext.simple_triangulations import unstructured_square_domain_sets